@@ -0,0 +1,423 @@
+'''\
+load test routers with randomly generated graphs.
+
+Run with ``python benchmarks/loadtest.py``. The graph is a tree of nodes
+with a chosen fan-out, plus regular expression subscribers:
+
+- every tree node subscribes to its parent by name, and calls (or yields)
+  its result to its own subscribers. ``--fanout`` picks how many children
+  each node gets, and ``--yields`` how many messages it emits per call. A
+  fan-out of 1 is one deep chain; a large fan-out is a wide, shallow tree.
+- ``--regex-fraction`` of the nodes are sinks subscribed by regular
+  expression to every tree node whose name ends in a digit, and
+  ``--wildcards`` more are sinks subscribed to ``'.+'``, like the examples'
+  loggers. ``--ignore-fraction`` of these sinks also ignore the tree's odd
+  nodes.
+
+Distributions are written as ``3`` (always 3), ``1-5`` (uniformly between 1
+and 5) or ``geo:2.5`` (geometric with a mean of 2.5, at least 1.)
+
+The messages are routed as fast as possible, or at ``--rate`` messages per
+second. The report gives the throughput, percentiles of the time spent in
+each node (from the router's metrics, see ``emit.metrics``) and the peak
+memory use of the process. ``--trace-memory`` also reports the peak memory
+allocated while routing, traced with ``tracemalloc`` (which slows routing
+down, so don't trust the throughput of that run.)
+
+Emitting more than one message per call multiplies the messages at every
+level of the tree, so check the calls per message printed before routing
+starts:
+
+.. code-block:: console
+
+    $ python benchmarks/loadtest.py --nodes 500 --fanout geo:3 --wildcards 2 \\
+        --regex-fraction 0.05 --ignore-fraction 0.5 --messages 200
+
+Use ``--json`` to save the report.
+'''
+from __future__ import print_function
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from emit.messages import NoResult
+from emit.metrics import Histogram, Metrics
+from emit.router.core import Router
+from emit.router.scheduler import ScheduledRouter
+from emit.router.threads import ThreadRouter
+
+MODULE = 'synthetic'
+
+ROUTERS = {
+    'core': Router,
+    'scheduled': ScheduledRouter,
+    'threads': ThreadRouter,
+}
+
+# ten buckets per decade, from a microsecond to ten seconds
+BUCKETS = tuple(1e-6 * 10 ** (i / 10.0) for i in range(71))
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def parse_distribution(spec):
+    '''\
+    parse a distribution of whole numbers
+
+    :param spec: ``'3'``, ``'1-5'`` or ``'geo:2.5'``
+    :type spec: :py:class:`str`
+
+    :raises: :py:exc:`ValueError` for a spec which can't be parsed
+    :returns: a function taking a :py:class:`random.Random` and returning a
+              sample
+    '''
+    if spec.startswith('geo:'):
+        mean = float(spec[4:])
+        if mean < 1:
+            raise ValueError('geometric mean must be at least 1')
+
+        p = 1 / mean
+
+        def geometric(rng):
+            'number of trials up to the first success'
+            count = 1
+            while rng.random() > p:
+                count += 1
+            return count
+
+        return geometric
+
+    low, _, high = spec.partition('-')
+    low = int(low)
+    high = int(high) if high else low
+    if low < 0 or high < low:
+        raise ValueError('bad range %r' % spec)
+
+    return lambda rng: rng.randint(low, high)
+
+
+def busy(seconds):
+    'spin for ``seconds``, standing in for work a node does'
+    if seconds <= 0:
+        return
+
+    end = clock() + seconds
+    while clock() < end:
+        pass
+
+
+def make_tree_node(name, yields, work):
+    '''\
+    make a function which passes its message on, ``yields`` times
+
+    :param name: unqualified name of the node
+    :param yields: messages emitted per call. 1 returns a single value, more
+                   makes a generator.
+    :param work: seconds of busy work per call
+    '''
+    if yields == 1:
+        def node(msg):
+            busy(work)
+            return msg.payload
+
+    else:
+        def node(msg):
+            busy(work)
+            for _ in range(yields):
+                yield msg.payload
+
+    node.__name__ = name
+    node.__module__ = MODULE
+    return node
+
+
+def make_sink(name, work):
+    'make a function which receives messages and emits nothing'
+    def sink(msg):
+        busy(work)
+        return NoResult
+
+    sink.__name__ = name
+    sink.__module__ = MODULE
+    return sink
+
+
+def build_graph(router, nodes, fanout, yields, regex_fraction=0.0,
+                wildcards=0, ignore_fraction=0.0, work=0.0, rng=None):
+    '''\
+    register a random graph on ``router``
+
+    :param nodes: number of nodes, including regex subscribers (but not
+                  wildcards)
+    :param fanout: distribution of children per tree node
+    :param yields: distribution of messages emitted per tree node call
+    :param regex_fraction: fraction of ``nodes`` which subscribe by regex
+    :param wildcards: number of extra nodes subscribing to ``'.+'``
+    :param ignore_fraction: fraction of regex and wildcard subscribers which
+                            ignore odd tree nodes
+    :param work: seconds of busy work per node call
+
+    :returns: a :py:class:`dict` describing the graph
+    '''
+    rng = rng or random.Random()
+    regexes = int(nodes * regex_fraction)
+    tree = max(1, nodes - regexes)
+
+    # lay out the tree breadth-first: each node takes the next unassigned
+    # nodes as its children
+    parents = {}
+    depths = {0: 0}
+    assigned = 1
+    for index in range(tree):
+        if assigned >= tree:
+            break
+
+        for _ in range(fanout(rng)):
+            if assigned >= tree:
+                break
+            parents[assigned] = index
+            depths[assigned] = depths[index] + 1
+            assigned += 1
+
+    # nodes left over (when a node draws a fan-out of 0) hang off the root
+    for index in range(assigned, tree):
+        parents[index] = 0
+        depths[index] = 1
+
+    # messages emitted by each tree node per call, and calls of each tree
+    # node for every message routed to the root
+    counts = {}
+    calls = {}
+    for index in range(tree):
+        counts[index] = count = yields(rng)
+        parent = parents.get(index)
+        calls[index] = 1 if parent is None else calls[parent] * counts[parent]
+        router.node(
+            ('payload',),
+            subscribe_to=None if parent is None else r'^%s\.n%d$' % (MODULE, parent),
+            entry_point=parent is None,
+        )(make_tree_node('n%d' % index, count, work))
+
+    ignored = 0
+    sinks = [('r%d' % i, r'^%s\.n\d*%d$' % (MODULE, i % 10)) for i in range(regexes)]
+    sinks += [('w%d' % i, '.+') for i in range(wildcards)]
+    for name, pattern in sinks:
+        ignore = None
+        if rng.random() < ignore_fraction:
+            ignore = r'^%s\.n\d*[13579]$' % MODULE
+            ignored += 1
+
+        router.node(('payload',), subscribe_to=pattern, ignore=ignore)(
+            make_sink(name, work)
+        )
+
+    return {
+        'tree_nodes': tree,
+        'regex_subscribers': regexes,
+        'wildcard_subscribers': wildcards,
+        'ignoring_subscribers': ignored,
+        'edges': sum(len(destinations) for destinations in router.routes.values()),
+        'depth': max(depths.values()),
+        'mean_yields': sum(counts.values()) / float(tree),
+        'tree_calls_per_message': sum(calls.values()),
+    }
+
+
+def drive(router, messages, payload, rate=None):
+    '''\
+    route ``messages`` messages to the router's entry points, at ``rate`` per
+    second if given
+
+    :returns: seconds taken
+    '''
+    interval = 1.0 / rate if rate else 0
+    start = clock()
+    for i in range(messages):
+        if interval:
+            delay = start + i * interval - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+        result = router(payload=payload)
+        exceptions = getattr(result, 'exceptions', None)
+        if exceptions:
+            raise exceptions[0]
+
+    return clock() - start
+
+
+def latency_report(metrics, top=5):
+    '''\
+    summarize node latencies: percentiles over every call, and for the
+    ``top`` nodes with the slowest median
+    '''
+    overall = Histogram(metrics.buckets)
+    nodes = []
+    for name, histogram in metrics.latency.items():
+        overall.count += histogram.count
+        overall.sum += histogram.sum
+        overall.counts = [a + b for a, b in zip(overall.counts, histogram.counts)]
+        nodes.append((histogram.quantile(0.5), name, histogram))
+
+    def percentiles(histogram):
+        'percentiles of a histogram, in microseconds'
+        return dict(
+            ('p%d' % (q * 100), histogram.quantile(q) * 1e6) for q in QUANTILES
+        )
+
+    nodes.sort(reverse=True)
+    return {
+        'all': percentiles(overall) if overall.count else {},
+        'slowest': [
+            dict(percentiles(histogram), node=name, calls=histogram.count)
+            for _, name, histogram in nodes[:top]
+        ],
+    }
+
+
+def run(args):
+    'build a graph, drive it and report'
+    rng = random.Random(args.seed)
+    metrics = Metrics(BUCKETS)
+
+    options = {}
+    if args.router == 'threads':
+        options['max_workers'] = args.workers
+
+    router = ROUTERS[args.router](log_messages=False, metrics=metrics, **options)
+    try:
+        graph = build_graph(
+            router, args.nodes, parse_distribution(args.fanout),
+            parse_distribution(args.yields), args.regex_fraction,
+            args.wildcards, args.ignore_fraction, args.work / 1e6, rng,
+        )
+        if args.freeze:
+            router.freeze()
+
+        payload = 'x' * args.payload
+        print('routing %d messages, each calling tree nodes %d times' % (
+            args.messages, graph['tree_calls_per_message']
+        ))
+
+        peak = None
+        if args.trace_memory:
+            tracemalloc.start()
+        try:
+            seconds = drive(router, args.messages, payload, args.rate)
+            if args.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if args.trace_memory:
+                tracemalloc.stop()
+    finally:
+        router.close()
+
+    calls = sum(metrics.calls.values())
+    report = {
+        'options': vars(args),
+        'graph': graph,
+        'seconds': seconds,
+        'messages_per_second': args.messages / seconds,
+        'node_calls': calls,
+        'node_calls_per_second': calls / seconds,
+        'latency_us': latency_report(metrics),
+        'peak_traced_bytes': peak,
+    }
+    if resource is not None:
+        report['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return report
+
+
+def print_report(report):
+    'print a report for people'
+    graph = report['graph']
+    print('graph: %(tree_nodes)d tree nodes (depth %(depth)d, %(mean_yields).1f '
+          'emitted per call), %(regex_subscribers)d regex and '
+          '%(wildcard_subscribers)d wildcard subscribers '
+          '(%(ignoring_subscribers)d ignoring), %(edges)d edges' % graph)
+    print('routed %d messages in %.3fs: %.0f messages/s, %.0f node calls/s' % (
+        report['options']['messages'], report['seconds'],
+        report['messages_per_second'], report['node_calls_per_second'],
+    ))
+
+    latency = report['latency_us']
+    if latency['all']:
+        print('node latency (us): %s' % ', '.join(
+            '%s %.1f' % (key, latency['all'][key]) for key in sorted(latency['all'])
+        ))
+    for node in latency['slowest']:
+        print('  %-24s %8d calls  p50 %.1f  p90 %.1f  p99 %.1f' % (
+            node['node'], node['calls'], node['p50'], node['p90'], node['p99']
+        ))
+
+    memory = []
+    if report['peak_traced_bytes'] is not None:
+        memory.append('%.1f KiB traced while routing' % (
+            report['peak_traced_bytes'] / 1024.0
+        ))
+    if 'max_rss_kb' in report:
+        memory.append('max RSS %d KiB' % report['max_rss_kb'])
+    if memory:
+        print('peak memory: %s' % ', '.join(memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=100,
+                        help='nodes in the graph, not counting wildcards')
+    parser.add_argument('--fanout', default='geo:2',
+                        help='distribution of children per node')
+    parser.add_argument('--yields', default='1',
+                        help='distribution of messages emitted per call')
+    parser.add_argument('--regex-fraction', type=float, default=0.0,
+                        help='fraction of nodes subscribing by regex')
+    parser.add_argument('--wildcards', type=int, default=0,
+                        help="extra nodes subscribing to '.+'")
+    parser.add_argument('--ignore-fraction', type=float, default=0.0,
+                        help='fraction of regex subscribers with an ignore')
+    parser.add_argument('--work', type=float, default=0.0,
+                        help='microseconds of busy work per node call')
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='messages to route')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='messages per second (default: as fast as possible)')
+    parser.add_argument('--payload', type=int, default=100,
+                        help='bytes of payload per message')
+    parser.add_argument('--router', choices=sorted(ROUTERS), default='core')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='thread pool size for the threads router')
+    parser.add_argument('--freeze', action='store_true',
+                        help='freeze the router before routing')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='trace allocations while routing with '
+                             'tracemalloc (slows routing down)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, to build the same graph again')
+    parser.add_argument('--json', help='file to save the report in')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    report = run(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''\
+benchmark ShellNode calls, starting a process per message against keeping a
+persistent process, and a pool of persistent processes called from several
+threads.
+
+Run with ``python benchmarks/multilang.py``. Uses the Python example in
+``examples/multilang/test.py`` as the child process.
+'''
+from __future__ import print_function
+import logging
+import os
+import sys
+from threading import Thread
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+from emit.messages import Message
+from emit.multilang import ShellNode
+
+CALLS = 50
+THREADS = 4
+
+
+class PerMessageNode(ShellNode):
+    command = '%s test.py' % sys.executable
+    cwd = os.path.join(ROOT, 'examples', 'multilang')
+
+
+class PersistentNode(PerMessageNode):
+    command = '%s test.py --persistent' % sys.executable
+    persistent = True
+
+
+class PooledNode(PersistentNode):
+    workers = THREADS
+
+
+def bench_calls(node, calls=CALLS, count=10, threads=1):
+    'time calling node from some threads, returning mean seconds per call'
+    message = Message(count=count)
+    list(node(message))  # start up persistent processes outside the timing
+
+    def call():
+        for _ in range(calls):
+            list(node(message))
+
+    workers = [Thread(target=call) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return (time.time() - start) / (calls * threads)
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    print('%12s %16s' % ('mode', 'per call (ms)'))
+    for mode, node, threads in (('per-message', PerMessageNode(), 1),
+                                ('persistent', PersistentNode(), THREADS),
+                                ('pool', PooledNode(), THREADS)):
+        try:
+            print('%12s %16.3f' % (mode, bench_calls(node, threads=threads) * 1000))
+        finally:
+            node.close()
+
+
+if __name__ == '__main__':
+    main()
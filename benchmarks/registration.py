@@ -0,0 +1,88 @@
+'''\
+benchmark node registration cost as graphs grow.
+
+Run with ``python benchmarks/registration.py``. Each line reports the total
+time to register a graph of ``n`` nodes and the mean cost of a single
+registration. Registering a node only checks the names and patterns which
+could match it (see ``emit.patterns``), so the per-node cost should stay
+roughly flat, and the total grow linearly, as the graph grows. What growth
+remains comes from the routes themselves: each module-wide subscription
+matches more nodes in a bigger graph.
+
+The last column is the time to register the same graph with a route
+manifest loaded (see ``Router.load_manifest``), including checking the
+manifest and using its routes.
+'''
+from __future__ import print_function
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from emit.router.core import Router
+
+SIZES = (10, 100, 500, 1000, 2000)
+
+
+def register_graph(n, modules=50, router=None):
+    '''\
+    register ``n`` nodes spread over ``modules`` modules. Every node subscribes
+    to the one registered before it, and every tenth node also subscribes to
+    a regular expression covering a whole module.
+    '''
+    router = router or Router()
+    previous = None
+    for i in range(n):
+        name = 'mod%d.node%d' % (i % modules, i)
+        subscribe_to = [previous] if previous else []
+        if i % 10 == 0:
+            subscribe_to.append(r'^mod%d\.' % ((i + 1) % modules))
+
+        router.register(name, None, ('x',), subscribe_to, previous is None, None)
+        previous = name
+
+    return router
+
+
+def bench_register(n):
+    'time registering a graph of n nodes, returning seconds'
+    start = time.time()
+    register_graph(n)
+    return time.time() - start
+
+
+def bench_manifest(n, directory):
+    '''\
+    time registering a graph of n nodes with a matching manifest loaded and
+    applying it, returning seconds
+    '''
+    path = os.path.join(directory, 'routes-%d.json' % n)
+    register_graph(n).save_manifest(path)
+
+    start = time.time()
+    router = register_graph(n, router=Router(manifest=path))
+    assert router.apply_manifest()
+    return time.time() - start
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    directory = tempfile.mkdtemp()
+    try:
+        print('%8s %12s %16s %16s' % (
+            'nodes', 'total (s)', 'per node (ms)', 'manifest (s)'
+        ))
+        for n in SIZES:
+            total = bench_register(n)
+            print('%8d %12.4f %16.4f %16.4f' % (
+                n, total, total / n * 1000, bench_manifest(n, directory)
+            ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''\
+benchmark encoding and decoding messages with each available codec.
+
+Run with ``python benchmarks/serialization.py``. Each line reports how many
+messages per second a codec encodes and decodes, for a small, a medium and a
+large message. Codecs whose library isn't installed are skipped.
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from emit.codecs import CODECS, get_codec
+
+MESSAGES = {
+    'small': {'n': 1, 'word': 'emit'},
+    'medium': {
+        'id': 123456789,
+        'text': 'some text about stream processing ' * 4,
+        'user': {'name': 'brian', 'followers': 1000, 'verified': False},
+        'tags': ['python', 'streams', 'graphs'],
+        'score': 0.75,
+    },
+    'large': {
+        'rows': [
+            {'id': i, 'name': 'row %d' % i, 'values': [i * 0.5] * 10}
+            for i in range(500)
+        ],
+    },
+}
+
+
+def rate(func, arg, seconds=0.2):
+    'call ``func(arg)`` for about ``seconds``, returning calls per second'
+    calls = 0
+    start = time.time()
+    while True:
+        for _ in range(100):
+            func(arg)
+        calls += 100
+
+        elapsed = time.time() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def bench_codec(codec, message):
+    'encode and decode rates of ``codec`` for ``message``'
+    encoded = codec.encode(message)
+    return rate(codec.encode, message), rate(codec.decode, encoded), len(encoded)
+
+
+def main():
+    print('%8s %8s %14s %14s %10s' % (
+        'codec', 'message', 'encode (/s)', 'decode (/s)', 'bytes'
+    ))
+    for name in sorted(CODECS):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print('%8s (not installed)' % name)
+            continue
+
+        for size in ('small', 'medium', 'large'):
+            print('%8s %8s %14d %14d %10d' % (
+                (name, size) + bench_codec(codec, MESSAGES[size])
+            ))
+
+
+if __name__ == '__main__':
+    main()
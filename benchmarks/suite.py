@@ -0,0 +1,434 @@
+'''\
+benchmark suite covering registration, routing, fan-out, generator nodes,
+messages, multilang nodes and the RQ and Celery routers.
+
+Run with ``python benchmarks/suite.py``. Each benchmark is timed a few times
+(after its setup) and the results are printed and saved as JSON, by default
+in ``benchmarks/results/``. To check a change for regressions, save results
+before and after and compare them:
+
+.. code-block:: console
+
+    $ python benchmarks/suite.py --output before.json
+    $ python benchmarks/suite.py --output after.json --compare before.json
+
+Use ``--filter`` to run only benchmarks whose names contain a string, and
+``--quick`` to skip the largest sizes.
+
+RQ and Celery run in process: RQ enqueues into ``fakeredis`` and Celery runs
+tasks eagerly. Those benchmarks are skipped if the libraries aren't
+installed.
+'''
+from __future__ import print_function
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+import emit
+from emit.messages import Message
+from emit.multilang import ShellNode
+from emit.router.core import Router
+
+from registration import register_graph
+
+# benchmarks in the order they run: ``(name, function, params, quick params)``
+BENCHMARKS = []
+
+# how much slower (as a fraction) a result must be to be flagged by --compare
+THRESHOLD = 0.1
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Skip(Exception):
+    'raised by a benchmark which can\'t run here'
+    pass
+
+
+def benchmark(params=({},), quick=None):
+    '''\
+    register a benchmark. The function is called with each set of
+    ``params`` as keyword arguments, does its setup and returns
+    ``(run, ops)``: a callable doing the timed work, and the number of
+    operations it does. It may return a third item, called after timing to
+    clean up. ``quick`` is the subset of ``params`` used with ``--quick``.
+    '''
+    def outer(func):
+        'register func'
+        BENCHMARKS.append((func.__name__, func, params, quick or params))
+        return func
+
+    return outer
+
+
+def chain(router, depth, fields=('x',)):
+    'register a chain of ``depth`` nodes, each passing its message on'
+    previous = None
+    for i in range(depth):
+        def node(msg):
+            return msg.x
+
+        node.__name__ = 'node%d' % i
+        router.node(
+            fields, subscribe_to=previous and '%s$' % previous,
+            entry_point=previous is None,
+        )(node)
+        previous = router.get_name(node)
+
+    return router
+
+
+def fanout(router, width):
+    'register an entry point with ``width`` subscribers'
+    @router.node(('x',), entry_point=True)
+    def source(msg):
+        return msg.x
+
+    for i in range(width):
+        def sink(msg):
+            pass
+
+        sink.__name__ = 'sink%d' % i
+        router.node(('x',), subscribe_to='%s$' % router.get_name(source))(sink)
+
+    return router
+
+
+@benchmark([{'n': n} for n in (10, 100, 1000, 5000)],
+           [{'n': n} for n in (10, 100, 1000)])
+def register(n):
+    'register a graph of ``n`` nodes (see ``registration.py``)'
+    return (lambda: register_graph(n)), n
+
+
+@benchmark([{'n': n} for n in (10, 100, 1000, 5000)],
+           [{'n': n} for n in (10, 100, 1000)])
+def regenerate_routes(n):
+    'recompute every route of a graph of ``n`` nodes'
+    return register_graph(n).regenerate_routes, 1
+
+
+@benchmark([{'depth': depth, 'frozen': frozen}
+            for depth in (10, 100) for frozen in (False, True)])
+def route_chain(depth, frozen):
+    'route messages down a chain of ``depth`` nodes'
+    router = chain(Router(log_messages=False), depth)
+    if frozen:
+        router.freeze()
+
+    messages = [{'x': i} for i in range(1000 // depth)]
+    return (lambda: router.feed(messages)), len(messages) * depth
+
+
+@benchmark([{'width': width, 'frozen': frozen}
+            for width in (10, 100, 1000) for frozen in (False, True)])
+def route_fanout(width, frozen):
+    'route messages from one node to ``width`` subscribers'
+    router = fanout(Router(log_messages=False), width)
+    if frozen:
+        router.freeze()
+
+    messages = [{'x': i} for i in range(max(1, 1000 // width))]
+    return (lambda: router.feed(messages)), len(messages) * width
+
+
+@benchmark([{'items': items, 'stream': stream}
+            for items in (10, 1000) for stream in (False, True)])
+def generator_emission(items, stream):
+    'route the items yielded by a generator node to a subscriber'
+    router = Router(log_messages=False)
+
+    @router.node(('i',), entry_point=True, stream=stream)
+    def numbers(msg):
+        for i in range(msg.count):
+            yield i
+
+    @router.node(('i',), subscribe_to='%s$' % router.get_name(numbers))
+    def sink(msg):
+        pass
+
+    router.freeze()
+    messages = [{'count': items}] * max(1, 1000 // items)
+    return (lambda: router.feed(messages)), len(messages) * items
+
+
+BUNDLES = {
+    'small': {'x': 1, 'word': 'emit'},
+    'large': dict(('field%d' % i, 'value %d' % i) for i in range(100)),
+}
+
+
+@benchmark([{'size': size} for size in sorted(BUNDLES)])
+def message_init(size):
+    'build messages from keyword arguments'
+    bundle = BUNDLES[size]
+
+    def run():
+        for _ in range(1000):
+            Message(**bundle)
+
+    return run, 1000
+
+
+@benchmark([{'size': size} for size in sorted(BUNDLES)])
+def message_adopt(size):
+    'build messages around existing dicts, as the router does'
+    bundle = BUNDLES[size]
+
+    def run():
+        for _ in range(1000):
+            Message.adopt(bundle)
+
+    return run, 1000
+
+
+@benchmark([{'size': size} for size in sorted(BUNDLES)])
+def message_as_json(size):
+    'serialize messages to JSON'
+    message = Message(**BUNDLES[size])
+
+    def run():
+        for _ in range(1000):
+            message.as_json()
+
+    return run, 1000
+
+
+class PerMessageNode(ShellNode):
+    command = '%s test.py' % sys.executable
+    cwd = os.path.join(ROOT, 'examples', 'multilang')
+
+
+class PersistentNode(PerMessageNode):
+    command = '%s test.py --persistent' % sys.executable
+    persistent = True
+
+
+@benchmark([{'persistent': False}, {'persistent': True}])
+def shell_node(persistent):
+    'call a multilang node (``examples/multilang/test.py``) once'
+    node = PersistentNode() if persistent else PerMessageNode()
+    message = Message(count=10)
+    list(node(message))  # start persistent processes outside the timing
+
+    calls = 50 if persistent else 5
+
+    def run():
+        for _ in range(calls):
+            list(node(message))
+
+    return run, calls, node.close
+
+
+@benchmark([{'width': width} for width in (1, 100)])
+def rq_enqueue(width):
+    '''\
+    run a node which yields ``width`` messages to a subscriber, enqueueing
+    them into fakeredis
+    '''
+    try:
+        from fakeredis import FakeStrictRedis
+        from emit.router.rq import RQRouter
+    except ImportError:
+        raise Skip('RQ or fakeredis is not installed')
+
+    router = RQRouter(FakeStrictRedis(), log_messages=False)
+
+    @router.node(('i',), entry_point=True)
+    def numbers(msg):
+        for i in range(msg.count):
+            yield i
+
+    @router.node(('i',), subscribe_to='%s$' % router.get_name(numbers))
+    def sink(msg):
+        pass
+
+    calls = max(1, 100 // width)
+
+    def run():
+        for _ in range(calls):
+            numbers(count=width)
+
+    return run, calls * width
+
+
+@benchmark([{'depth': depth} for depth in (1, 10)])
+def celery_eager(depth):
+    'route messages down a chain of ``depth`` nodes with eager Celery tasks'
+    try:
+        from celery import Celery
+        from emit.router.celery import CeleryRouter
+    except ImportError:
+        raise Skip('Celery is not installed')
+
+    celery = Celery()
+    celery.conf.update(task_always_eager=True)
+    router = chain(CeleryRouter(celery.task, log_messages=False), depth)
+
+    calls = max(1, 100 // depth)
+
+    def run():
+        for i in range(calls):
+            router(x=i)
+
+    return run, calls * depth
+
+
+def measure(run, repeat, budget):
+    '''\
+    call ``run`` up to ``repeat`` times, stopping early once ``budget``
+    seconds have been spent (but always at least once)
+
+    :returns: :py:class:`list` of seconds taken by each call
+    '''
+    samples = []
+    started = clock()
+    while len(samples) < repeat:
+        start = clock()
+        run()
+        samples.append(clock() - start)
+
+        if clock() - started > budget:
+            break
+
+    return samples
+
+
+def format_params(params):
+    'format benchmark parameters for display'
+    return ', '.join('%s=%s' % item for item in sorted(params.items()))
+
+
+def key(result):
+    'identify a result across runs'
+    return result['name'], format_params(result['params'])
+
+
+def run_benchmarks(pattern=None, quick=False, repeat=5, budget=2.0):
+    '''\
+    run the registered benchmarks, printing each result
+
+    :returns: :py:class:`list` of results
+    '''
+    results = []
+    for name, func, params, quick_params in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+
+        for kwargs in quick_params if quick else params:
+            label = '%s(%s)' % (name, format_params(kwargs))
+            try:
+                setup = func(**kwargs)
+            except Skip as err:
+                print('%-50s skipped: %s' % (label, err))
+                continue
+
+            run, ops = setup[:2]
+            try:
+                samples = sorted(measure(run, repeat, budget))
+            finally:
+                if len(setup) > 2:
+                    setup[2]()
+
+            best, median = samples[0], samples[len(samples) // 2]
+            results.append({
+                'name': name,
+                'params': kwargs,
+                'ops': ops,
+                'samples': samples,
+                'seconds_per_op': {'min': best / ops, 'median': median / ops},
+                'ops_per_second': ops / best,
+            })
+            print('%-50s %14.0f ops/s %12.3f us/op' % (
+                label, ops / best, best / ops * 1e6
+            ))
+
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''\
+    print how much each result changed since ``baseline``, flagging ones
+    more than ``threshold`` slower
+
+    :returns: the number of regressions
+    '''
+    previous = dict(
+        (key(result), result) for result in baseline['results']
+    )
+
+    regressions = 0
+    print()
+    print('compared to %s (%s):' % (baseline['timestamp'], baseline['emit']))
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+
+        change = result['seconds_per_op']['min'] / before['seconds_per_op']['min'] - 1
+        slower = change > threshold
+        regressions += slower
+        print('%-50s %+8.1f%% %s' % (
+            '%s(%s)' % key(result), change * 100, 'SLOWER' if slower else ''
+        ))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', help='file to save results in')
+    parser.add_argument('--compare', help='results to compare against')
+    parser.add_argument('--filter', help='only run benchmarks containing this')
+    parser.add_argument('--quick', action='store_true',
+                        help='skip the largest sizes')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='most timings per benchmark')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower to count as a regression')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    now = datetime.now()
+
+    results = run_benchmarks(args.filter, args.quick, args.repeat)
+    report = {
+        'emit': emit.__version__,
+        'python': '%s %s' % (
+            platform.python_implementation(), platform.python_version()
+        ),
+        'platform': platform.platform(),
+        'timestamp': now.isoformat(),
+        'results': results,
+    }
+
+    output = args.output
+    if output is None:
+        directory = os.path.join(HERE, 'results')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        output = os.path.join(directory, now.strftime('%Y%m%dT%H%M%S.json'))
+
+    with open(output, 'w') as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print('saved results in %s' % output)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(results, json.load(baseline), args.threshold):
+                return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
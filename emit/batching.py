@@ -0,0 +1,70 @@
+'collect messages into batches'
+import threading
+
+
+class Batcher(object):
+    '''\
+    collect items until there are ``size`` of them, or until ``timeout``
+    seconds after the first one arrived, then pass them all to ``send``.
+
+    When ``timeout`` passes, ``send`` is called from a timer thread.
+    '''
+    def __init__(self, size, timeout, send):
+        '''\
+        :param size: most items in a batch
+        :type size: :py:class:`int`
+        :param timeout: most seconds to hold an item before sending its batch,
+                        or ``None`` to wait for a full batch (or ``flush``)
+        :type timeout: :py:class:`float` or ``None``
+        :param send: called with a :py:class:`list` of items for each batch
+        :type send: callable
+        '''
+        if size < 1:
+            raise ValueError('batch size must be at least 1')
+
+        self.size = size
+        self.timeout = timeout
+        self.send = send
+
+        self.items = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        '''\
+        add an item, sending the batch if it's full
+
+        :returns: ``None``. Results of the batch are routed when it's sent.
+        '''
+        with self.lock:
+            self.items.append(item)
+            full = len(self.items) >= self.size
+
+            if not full and self.timer is None and self.timeout is not None:
+                self.timer = threading.Timer(self.timeout, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        '''\
+        send the items collected so far, if any
+
+        :returns: the return value of ``send``, or ``None`` if there was
+                  nothing to send
+        '''
+        with self.lock:
+            items, self.items = self.items, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        if not items:
+            return None
+
+        return self.send(items)
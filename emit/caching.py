@@ -0,0 +1,148 @@
+'remember the results of nodes'
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+
+def message_key(message):
+    '''\
+    a stable key for a message: a hash of its bundle, without ``_origin``, so
+    equal messages from different nodes share a key.
+
+    :param message: message to make a key for
+    :type message: :py:class:`emit.messages.Message`
+
+    :returns: :py:class:`bytes`
+    :raises: :py:exc:`TypeError` or :py:exc:`ValueError` if the bundle can't
+             be represented as JSON (for example, it holds other objects,
+             tuple keys, or a mix of :py:class:`int` and :py:class:`str`
+             keys.) Such messages can't be cached.
+    '''
+    bundle = message.as_dict()
+    if '_origin' in bundle:
+        bundle = dict(bundle)
+        del bundle['_origin']
+
+    return hashlib.sha1(json.dumps(
+        bundle, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')).digest()
+
+
+class Cache(object):
+    '''\
+    a bounded cache of node results, evicting the least recently used entry
+    when full, and entries older than ``ttl`` seconds (if given) when they are
+    next looked up. Safe to use between threads.
+
+    Pass an instance as the ``cache`` option of
+    :py:meth:`emit.router.core.Router.node` to choose these, or to read the
+    counters: ``hits``, ``misses``, ``evictions`` (entries removed to make
+    room) and ``expirations`` (entries found too old.)
+    '''
+    def __init__(self, size=1024, ttl=None, key=message_key):
+        '''\
+        :param size: most entries to keep
+        :type size: :py:class:`int`
+        :param ttl: most seconds to keep an entry, or ``None`` to keep it
+                    until it is evicted
+        :type ttl: :py:class:`float` or ``None``
+        :param key: function making a hashable key from a message
+        :type key: callable
+
+        :raises: :py:exc:`ValueError` if ``size`` is less than 1
+        '''
+        if size < 1:
+            raise ValueError('cache size must be at least 1')
+
+        self.size = size
+        self.ttl = ttl
+        self.key = key
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''\
+        look up a key, counting a hit or a miss
+
+        :returns: ``(found, value)``
+        '''
+        with self.lock:
+            try:
+                stored, value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+
+            if self.ttl is not None and time.monotonic() - stored > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        'store a value, evicting the least recently used entry if full'
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        'remove every entry (the counters are kept)'
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''\
+        :returns: a :py:class:`dict` of the counters, the number of entries
+                  and the ``hit_rate`` (``None`` before the first lookup)
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self.entries),
+                'hit_rate': float(self.hits) / lookups if lookups else None,
+            }
+
+
+def get_cache(cache):
+    '''\
+    make a :py:class:`Cache` from the ``cache`` option of a node
+
+    :param cache: ``True`` for a default cache, an :py:class:`int` for a
+                  cache of that size, or a :py:class:`Cache`
+    :type cache: :py:class:`bool`, :py:class:`int` or :py:class:`Cache`
+
+    :raises: :py:exc:`TypeError` for anything else
+    '''
+    if cache is True:
+        return Cache()
+
+    if isinstance(cache, Cache):
+        return cache
+
+    if isinstance(cache, int) and not isinstance(cache, bool):
+        return Cache(cache)
+
+    raise TypeError('cache must be True, a size or a Cache, not %r' % (cache,))
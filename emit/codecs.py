@@ -0,0 +1,204 @@
+'codecs for sending messages to and from other processes'
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+# binary framing: a frame's length, and a persistent request's ID
+LENGTH = struct.Struct('>I')
+REQUEST_ID = struct.Struct('>Q')
+
+
+class Codec(object):
+    '''\
+    turns messages into bytes and back, and frames them on a stream.
+
+    Text codecs (the default) write one frame per line, so encoded values must
+    not contain newlines. Binary codecs (``binary = True``) prefix each frame
+    with its length as a four byte, big-endian unsigned integer.
+
+    Subclasses provide ``name``, ``encode`` and ``decode``.
+    '''
+    name = None
+    binary = False
+
+    def encode(self, obj):
+        '''\
+        serialize an object
+
+        :returns: :py:class:`bytes`
+        '''
+        raise NotImplementedError
+
+    def decode(self, data):
+        '''\
+        deserialize an object
+
+        :param data: output of :py:meth:`Codec.encode`
+        :type data: :py:class:`bytes`
+        '''
+        raise NotImplementedError
+
+    def write_frame(self, stream, data):
+        '''\
+        write a frame to a stream
+
+        :param stream: file-like object open for writing bytes
+        :param data: contents of the frame
+        :type data: :py:class:`bytes`
+        '''
+        if self.binary:
+            stream.write(LENGTH.pack(len(data)) + data)
+        else:
+            stream.write(data + b'\n')
+
+    def read_frame(self, stream):
+        '''\
+        read a frame from a stream. Text frames have surrounding whitespace
+        removed, so blank lines read as empty frames.
+
+        :param stream: file-like object open for reading bytes
+        :returns: :py:class:`bytes`, or ``None`` at the end of the stream
+        '''
+        if not self.binary:
+            line = stream.readline()
+            return line.strip() if line else None
+
+        header = stream.read(LENGTH.size)
+        if len(header) < LENGTH.size:
+            return None
+
+        length, = LENGTH.unpack(header)
+        data = stream.read(length)
+        return data if len(data) == length else None
+
+    def tag(self, request_id, data=None):
+        '''\
+        mark a frame's contents with the ID of a request to a persistent
+        process (see :py:class:`emit.multilang.ShellProcess`.) Text codecs
+        put the ID and a space first, binary codecs the ID as an eight byte,
+        big-endian unsigned integer.
+
+        :param request_id: ID of the request
+        :type request_id: :py:class:`int`
+        :param data: contents of the frame, or ``None`` to mark the end of a
+                     request's output with a frame holding only the ID
+        :type data: :py:class:`bytes` or ``None``
+        '''
+        if self.binary:
+            return REQUEST_ID.pack(request_id) + (data or b'')
+
+        tagged = str(request_id).encode('ascii')
+        if data is None:
+            return tagged
+
+        return tagged + b' ' + data
+
+    def untag(self, frame):
+        '''\
+        split a frame made by :py:meth:`Codec.tag`
+
+        :returns: ``(request_id, data)``, where ``data`` is ``None`` if the
+                  frame marks the end of a request's output
+        :raises: :py:exc:`ValueError` if the frame has no request ID
+        '''
+        if self.binary:
+            if len(frame) < REQUEST_ID.size:
+                raise ValueError('frame is too short for a request ID')
+
+            request_id, = REQUEST_ID.unpack(frame[:REQUEST_ID.size])
+            return request_id, frame[REQUEST_ID.size:] or None
+
+        request_id, sep, data = frame.partition(b' ')
+        return int(request_id), data if sep else None
+
+
+class JSONCodec(Codec):
+    'JSON, using the standard library'
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj).encode('UTF-8')
+
+    def decode(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('UTF-8')
+
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    'JSON, using `orjson <https://github.com/ijl/orjson>`_ (if installed)'
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('the orjson codec needs orjson installed')
+
+    def encode(self, obj):
+        return orjson.dumps(obj)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    'msgpack (if installed), in length-prefixed frames'
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('the msgpack codec needs msgpack installed')
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+CODECS = dict(
+    (codec.name, codec) for codec in (JSONCodec, OrjsonCodec, MsgpackCodec)
+)
+
+# codecs created by ``get_codec``, by name
+instances = {}
+
+
+def get_codec(codec=None):
+    '''\
+    get a codec
+
+    :param codec: a codec, the name of one in ``emit.codecs.CODECS``, or
+                  ``None`` for JSON
+    :type codec: :py:class:`Codec`, :py:class:`str` or ``None``
+
+    :returns: :py:class:`Codec`
+    :raises: :py:exc:`ValueError` if there is no codec with that name, or
+             :py:exc:`ImportError` if the codec's library isn't installed.
+    '''
+    if isinstance(codec, Codec):
+        return codec
+
+    name = codec or 'json'
+    try:
+        return instances[name]
+    except KeyError:
+        pass
+
+    try:
+        cls = CODECS[name]
+    except KeyError:
+        raise ValueError('no codec named "%s"' % name)
+
+    instances[name] = cls()
+    return instances[name]
@@ -0,0 +1,290 @@
+'drop messages which have been seen before'
+from collections import OrderedDict
+import hashlib
+import json
+import math
+import threading
+import time
+
+from emit.caching import message_key
+
+
+def fields_key(fields):
+    '''\
+    make a key function which hashes some fields of a message. Missing fields
+    count as ``None``.
+
+    :param fields: names of the fields to use
+    :type fields: ordered iterable of :py:class:`str`
+
+    :returns: a function taking a :py:class:`emit.messages.Message` and
+              returning :py:class:`bytes`. Like
+              :py:func:`emit.caching.message_key`, it raises
+              :py:exc:`TypeError` or :py:exc:`ValueError` for fields JSON
+              can't represent.
+    '''
+    fields = tuple(fields)
+
+    def key(message):
+        'hash the chosen fields of message'
+        bundle = message.as_dict()
+        return hashlib.sha1(json.dumps(
+            [bundle.get(field) for field in fields],
+            sort_keys=True, separators=(',', ':')
+        ).encode('utf-8')).digest()
+
+    return key
+
+
+class ExactFilter(object):
+    '''\
+    remembers up to ``size`` keys exactly, forgetting the oldest first, and
+    keys older than ``window`` seconds
+    '''
+    def __init__(self, size=100000, window=None):
+        '''\
+        :param size: most keys to remember
+        :type size: :py:class:`int`
+        :param window: seconds to remember a key, or ``None`` to remember it
+                       until it's pushed out by newer keys
+        :type window: :py:class:`float` or ``None``
+
+        :raises: :py:exc:`ValueError` if ``size`` is less than 1
+        '''
+        if size < 1:
+            raise ValueError('filter size must be at least 1')
+
+        self.size = size
+        self.window = window
+        self.keys = OrderedDict()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        '''\
+        remember a key
+
+        :returns: whether the key was already remembered
+        '''
+        now = time.monotonic()
+        if self.window is not None:
+            while self.keys:
+                oldest, first_seen = next(iter(self.keys.items()))
+                if now - first_seen <= self.window:
+                    break
+                del self.keys[oldest]
+
+        if key in self.keys:
+            return True
+
+        self.keys[key] = now
+        while len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+
+        return False
+
+
+class BloomFilter(object):
+    '''\
+    remembers keys in two generations of Bloom filters, using a fixed amount
+    of memory. When the current generation has held ``size`` keys or
+    ``window`` seconds have passed, it becomes the previous one and a new
+    generation starts, so a key is remembered for between one and two
+    windows (or ``size`` and twice ``size`` keys.)
+
+    Bloom filters can mistake a new key for a remembered one (a message is
+    dropped when it shouldn't be) about ``error_rate`` of the time, but never
+    the other way around.
+    '''
+    def __init__(self, size=100000, window=None, error_rate=0.001):
+        '''\
+        :param size: keys per generation
+        :type size: :py:class:`int`
+        :param window: seconds per generation, or ``None`` to start a new
+                       generation only when the current one is full
+        :type window: :py:class:`float` or ``None``
+        :param error_rate: chance of mistaking a new key for a remembered one,
+                           per generation
+        :type error_rate: :py:class:`float`
+
+        :raises: :py:exc:`ValueError` if ``size`` is less than 1 or
+                 ``error_rate`` isn't between 0 and 1
+        '''
+        if size < 1:
+            raise ValueError('filter size must be at least 1')
+
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+
+        self.size = size
+        self.window = window
+        self.error_rate = error_rate
+
+        self.bits = int(math.ceil(-size * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(size) * math.log(2))))
+
+        self.current = bytearray((self.bits + 7) // 8)
+        self.previous = None
+        self.count = 0
+        self.started = time.monotonic()
+
+    def __len__(self):
+        'number of keys added to the current generation'
+        return self.count
+
+    def positions(self, key):
+        '''\
+        bit positions for a key, by double hashing
+
+        :param key: key to place
+        :type key: :py:class:`bytes`
+        '''
+        digest = hashlib.sha1(key).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def rotate(self):
+        'start a new generation'
+        self.previous = self.current
+        self.current = bytearray(len(self.current))
+        self.count = 0
+        self.started = time.monotonic()
+
+    def add(self, key):
+        '''\
+        remember a key
+
+        :returns: whether the key was (probably) already remembered
+        '''
+        expired = self.window is not None and time.monotonic() - self.started > self.window
+        if self.count >= self.size or expired:
+            self.rotate()
+
+        positions = self.positions(key)
+        current = self.current
+        if all(current[bit >> 3] & (1 << (bit & 7)) for bit in positions):
+            return True
+
+        previous = self.previous
+        seen = previous is not None and all(
+            previous[bit >> 3] & (1 << (bit & 7)) for bit in positions
+        )
+
+        for bit in positions:
+            current[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+        return seen
+
+
+FILTERS = {
+    'exact': ExactFilter,
+    'bloom': BloomFilter,
+}
+
+
+class Deduper(object):
+    '''\
+    decides whether messages are repeats of ones seen before, and counts the
+    ones which are. Safe to use between threads.
+
+    Pass an instance as the ``dedupe`` option of
+    :py:meth:`emit.router.core.Router.node` to choose the fields, window and
+    filter.
+    '''
+    def __init__(self, fields=None, window=None, size=100000, method='exact',
+                 error_rate=0.001):
+        '''\
+        :param fields: fields which identify a message (an idempotency key),
+                       or ``None`` to use every field except ``_origin`` (see
+                       :py:func:`emit.caching.message_key`)
+        :type fields: :py:class:`str`, ordered iterable of :py:class:`str`
+                      or ``None``
+        :param window: seconds to remember a message, or ``None`` to remember
+                       it until ``size`` newer ones push it out
+        :type window: :py:class:`float` or ``None``
+        :param size: most messages to remember (per generation, for
+                     ``'bloom'``)
+        :type size: :py:class:`int`
+        :param method: ``'exact'`` remembers keys in a bounded set (see
+                       :py:class:`ExactFilter`). ``'bloom'`` uses less
+                       memory but occasionally drops a new message (see
+                       :py:class:`BloomFilter`.)
+        :type method: :py:class:`str`
+        :param error_rate: false positive rate for ``'bloom'``
+        :type error_rate: :py:class:`float`
+
+        :raises: :py:exc:`ValueError` for an unknown ``method``
+        '''
+        if method not in FILTERS:
+            raise ValueError('method must be one of %s' % ', '.join(sorted(FILTERS)))
+
+        if isinstance(fields, str):
+            fields = [fields]
+
+        self.fields = fields
+        self.method = method
+        self.key = message_key if fields is None else fields_key(fields)
+
+        if method == 'bloom':
+            self.filter = BloomFilter(size, window, error_rate)
+        else:
+            self.filter = ExactFilter(size, window)
+
+        self.lock = threading.Lock()
+        self.seen = 0
+        self.dropped = 0
+
+    def is_duplicate(self, message):
+        '''\
+        remember a message, counting it as dropped if it's a repeat
+
+        :param message: message to check
+        :type message: :py:class:`emit.messages.Message`
+
+        :returns: whether the message was seen before
+        :raises: :py:exc:`TypeError` or :py:exc:`ValueError` if no key can be
+                 made for the message. It isn't counted or remembered.
+        '''
+        key = self.key(message)
+        with self.lock:
+            self.seen += 1
+            duplicate = self.filter.add(key)
+            if duplicate:
+                self.dropped += 1
+
+        return duplicate
+
+    def stats(self):
+        '''\
+        :returns: a :py:class:`dict` of messages ``seen`` and ``dropped``
+        '''
+        with self.lock:
+            return {'seen': self.seen, 'dropped': self.dropped}
+
+
+def get_deduper(dedupe):
+    '''\
+    make a :py:class:`Deduper` from the ``dedupe`` option of a node
+
+    :param dedupe: ``True`` to compare whole messages, a field name or list
+                   of field names to compare those, or a :py:class:`Deduper`
+    :type dedupe: :py:class:`bool`, :py:class:`str`, :py:class:`list`,
+                  :py:class:`tuple` or :py:class:`Deduper`
+
+    :raises: :py:exc:`TypeError` for anything else
+    '''
+    if dedupe is True:
+        return Deduper()
+
+    if isinstance(dedupe, Deduper):
+        return dedupe
+
+    if isinstance(dedupe, (str, list, tuple)):
+        return Deduper(dedupe)
+
+    raise TypeError(
+        'dedupe must be True, fields or a Deduper, not %r' % (dedupe,)
+    )
@@ -1,13 +1,82 @@
 'message wrapper to be passed to functions'
+from itertools import islice
 import json
 
+from emit.codecs import get_codec
+
+try:
+    from reprlib import Repr
+except ImportError:  # python 2
+    from repr import Repr
+
+# limits on representing message contents, so logging a large message doesn't
+# serialize the whole payload.
+REPR = Repr()
+REPR.maxlevel = 3
+REPR.maxdict = REPR.maxlist = REPR.maxtuple = REPR.maxset = 20
+REPR.maxstring = REPR.maxother = 200
+
+
+class Bounded(object):
+    '''\
+    lazy, length-limited representation of an object. Limits are taken from
+    ``emit.messages.REPR``, a :py:class:`reprlib.Repr` instance.
+    '''
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __repr__(self):
+        return REPR.repr(self.obj)
+
+    def __str__(self):
+        if isinstance(self.obj, str):
+            if len(self.obj) > REPR.maxstring:
+                return self.obj[:REPR.maxstring] + '...'
+
+            return self.obj
+
+        return REPR.repr(self.obj)
+
 
 class Message(object):
-    'Convenient wrapper around a dictionary to provide attribute access'
+    '''\
+    Convenient wrapper around a dictionary to provide attribute access
+
+    Messages are read-only by contract: nodes must not change a message's
+    bundle (or the dictionary returned by :py:meth:`Message.as_dict`.) The
+    router makes one shallow copy of a bundle per subscriber, to add
+    ``_origin``, and adopts that copy instead of copying it again. The values
+    inside are shared, so a change one node makes to a list or dictionary in
+    a message would be seen by the others. Return a new value from the node
+    instead.
+    '''
+    __slots__ = ('bundle',)
+
     def __init__(self, *args, **kwargs):
         self.bundle = dict(*args, **kwargs)
 
+    @classmethod
+    def adopt(cls, bundle):
+        '''\
+        Create a message which uses ``bundle`` directly instead of copying it.
+        See the note on mutability above.
+
+        ``__init__`` is not called, so subclasses which need to initialize
+        anything else should override this as well.
+
+        :param bundle: contents of the message
+        :type bundle: :py:class:`dict`
+        '''
+        message = cls.__new__(cls)
+        message.bundle = bundle
+        return message
+
     def __getattr__(self, attr):
+        if attr == 'bundle':  # not set yet, for example while unpickling
+            raise AttributeError(attr)
+
         try:
             return self.bundle[attr]
         except KeyError:
@@ -20,10 +89,18 @@ class Message(object):
         return sorted(list(['bundle'] + list(self.bundle.keys())))
 
     def __repr__(self):
-        'representation of this message'
-        return 'Message(%s)' % (
-            ', '.join('%s=%s' % pair for pair in self.bundle.items())
-        )
+        '''\
+        representation of this message. Large messages are abbreviated
+        according to the limits in ``emit.messages.REPR``.
+        '''
+        items = [
+            '%s=%s' % (key, Bounded(value))
+            for key, value in islice(self.bundle.items(), REPR.maxdict)
+        ]
+        if len(self.bundle) > REPR.maxdict:
+            items.append('...')
+
+        return 'Message(%s)' % ', '.join(items)
 
     def __eq__(self, other):
         'test equality of two messages'
@@ -45,6 +122,32 @@ class Message(object):
         '''
         return json.dumps(self.as_dict())
 
+    def encode(self, codec=None):
+        '''\
+        representation of this message in a codec's format
+
+        :param codec: codec to use (see :py:func:`emit.codecs.get_codec`.)
+                      Defaults to JSON.
+        :type codec: :py:class:`emit.codecs.Codec`, :py:class:`str` or
+                     ``None``
+
+        :returns: bytes
+        '''
+        return get_codec(codec).encode(self.bundle)
+
+    @classmethod
+    def decode(cls, data, codec=None):
+        '''\
+        create a message from the output of :py:meth:`Message.encode`
+
+        :param data: encoded message
+        :type data: :py:class:`bytes`
+        :param codec: codec the message was encoded with
+        :type codec: :py:class:`emit.codecs.Codec`, :py:class:`str` or
+                     ``None``
+        '''
+        return cls.adopt(get_codec(codec).decode(data))
+
 
 class NoResult(object):
     'single value to return from a node to stop further processing'
@@ -0,0 +1,229 @@
+'record what happens in a graph'
+from bisect import bisect_left
+from collections import Counter
+import threading
+
+# upper bounds (in seconds) of latency histogram buckets
+BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram(object):
+    '''\
+    counts of observations falling in each bucket, plus their total. Buckets
+    are given by their upper bounds; one more bucket holds everything above
+    the last bound.
+    '''
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        'record an observation'
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        '''\
+        estimate a quantile of the observations, interpolating within the
+        bucket it falls in (as Prometheus' ``histogram_quantile`` does.)
+        Quantiles falling above the last bound are reported as the last
+        bound.
+
+        :param q: quantile, between 0 and 1
+        :type q: :py:class:`float`
+
+        :returns: :py:class:`float`, or ``None`` if nothing was observed
+        '''
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        total = 0
+        lower = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and total + count >= rank:
+                return lower + (bound - lower) * (rank - total) / count
+
+            total += count
+            lower = bound
+
+        return float(self.bounds[-1])
+
+    def cumulative(self):
+        '''\
+        :returns: ``(upper bound, observations at or below it)`` pairs,
+                  ending with ``float('inf')``
+        '''
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+
+        return buckets
+
+
+def escape(value):
+    'escape a Prometheus label value'
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    'format a histogram bound for Prometheus'
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Metrics(object):
+    '''\
+    per-node and per-edge counters for a :py:class:`emit.router.core.Router`.
+    Pass an instance (or ``True``) as the router's ``metrics`` argument.
+
+    For each node it records the number of calls, the messages it emitted,
+    the calls which returned :py:class:`emit.messages.NoResult` (or items
+    which were ``NoResult``) and a histogram of the time spent in the node
+    itself (not counting routing its results.) For each edge it records how
+    many messages were routed along it.
+    '''
+    def __init__(self, buckets=BUCKETS):
+        '''\
+        :param buckets: upper bounds of the latency histogram buckets, in
+                        seconds
+        :type buckets: sorted :py:class:`tuple` of :py:class:`float`
+        '''
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        'forget everything recorded so far'
+        with self.lock:
+            self.calls = Counter()
+            self.emitted = Counter()
+            self.dropped = Counter()
+            self.latency = {}
+            self.edges = Counter()
+
+    def record_call(self, node, seconds, emitted, dropped=0):
+        '''\
+        record a call of a node
+
+        :param node: name of the node
+        :type node: :py:class:`str`
+        :param seconds: time spent in the node
+        :type seconds: :py:class:`float`
+        :param emitted: number of messages the call emitted
+        :type emitted: :py:class:`int`
+        :param dropped: number of ``NoResult`` values the call returned
+        :type dropped: :py:class:`int`
+        '''
+        with self.lock:
+            self.calls[node] += 1
+            self.emitted[node] += emitted
+            if dropped:
+                self.dropped[node] += dropped
+
+            try:
+                histogram = self.latency[node]
+            except KeyError:
+                histogram = self.latency[node] = Histogram(self.buckets)
+
+            histogram.observe(seconds)
+
+    def record_edge(self, origin, destination):
+        '''\
+        record a message routed from ``origin`` to ``destination``
+        '''
+        with self.lock:
+            self.edges[origin, destination] += 1
+
+    def snapshot(self):
+        '''\
+        everything recorded so far, as plain data
+
+        :returns: a :py:class:`dict` with ``nodes`` (a dict of node names to
+                  ``calls``, ``emitted``, ``dropped`` and ``latency``, which
+                  has the ``count`` and ``sum`` of the latencies and
+                  cumulative ``buckets`` as ``[upper bound, count]`` pairs)
+                  and ``edges`` (a list of dicts with ``origin``,
+                  ``destination`` and ``messages``.)
+        '''
+        with self.lock:
+            nodes = {}
+            for node, histogram in self.latency.items():
+                nodes[node] = {
+                    'calls': self.calls[node],
+                    'emitted': self.emitted[node],
+                    'dropped': self.dropped[node],
+                    'latency': {
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'buckets': [
+                            [bound, count]
+                            for bound, count in histogram.cumulative()
+                        ],
+                    },
+                }
+
+            edges = [
+                {'origin': origin, 'destination': destination, 'messages': count}
+                for (origin, destination), count in sorted(self.edges.items())
+            ]
+
+        return {'nodes': nodes, 'edges': edges}
+
+    def prometheus(self, prefix='emit'):
+        '''\
+        everything recorded so far, in the Prometheus text exposition format
+
+        :param prefix: prefix for metric names
+        :type prefix: :py:class:`str`
+
+        :returns: :py:class:`str`
+        '''
+        snapshot = self.snapshot()
+        nodes = sorted(snapshot['nodes'].items())
+        lines = []
+
+        for metric, key, description in (
+            ('node_calls_total', 'calls', 'Calls of each node'),
+            ('node_emitted_total', 'emitted', 'Messages emitted by each node'),
+            ('node_dropped_total', 'dropped', 'NoResult values returned by each node'),
+        ):
+            lines.append('# HELP %s_%s %s' % (prefix, metric, description))
+            lines.append('# TYPE %s_%s counter' % (prefix, metric))
+            for node, values in nodes:
+                lines.append('%s_%s{node="%s"} %d' % (
+                    prefix, metric, escape(node), values[key]
+                ))
+
+        metric = '%s_node_latency_seconds' % prefix
+        lines.append('# HELP %s Time spent in each node' % metric)
+        lines.append('# TYPE %s histogram' % metric)
+        for node, values in nodes:
+            label = escape(node)
+            latency = values['latency']
+            for bound, count in latency['buckets']:
+                lines.append('%s_bucket{node="%s",le="%s"} %d' % (
+                    metric, label, format_bound(bound), count
+                ))
+            lines.append('%s_sum{node="%s"} %r' % (metric, label, latency['sum']))
+            lines.append('%s_count{node="%s"} %d' % (metric, label, latency['count']))
+
+        metric = '%s_edge_messages_total' % prefix
+        lines.append('# HELP %s Messages routed along each edge' % metric)
+        lines.append('# TYPE %s counter' % metric)
+        for edge in snapshot['edges']:
+            lines.append('%s{origin="%s",destination="%s"} %d' % (
+                metric, escape(edge['origin']), escape(edge['destination']),
+                edge['messages']
+            ))
+
+        return '\n'.join(lines) + '\n'
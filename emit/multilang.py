@@ -1,8 +1,167 @@
 'class to communicate with other languages over stdin/out'
-import json
+from collections import deque
+from itertools import count
 import logging
 import shlex
 from subprocess import Popen, PIPE
+import threading
+import time
+
+from emit.codecs import get_codec
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # python 2
+    from Queue import Empty, Queue
+
+
+# markers put on a request's queue by ``ShellProcess.read`` when its output
+# ends, or when the process exits before that
+END = object()
+EXITED = object()
+
+
+def drain(pipe, lines, node):
+    '''\
+    read a process' stderr until it closes, logging each line, so the process
+    never blocks on a full pipe
+
+    :param pipe: stderr of the process
+    :param lines: where to keep the lines read
+    :type lines: :py:class:`collections.deque`
+    :param node: the node which started the process
+    :type node: :py:class:`ShellNode`
+    '''
+    for line in iter(pipe.readline, b''):
+        line = line.decode('UTF-8', 'replace')
+        lines.append(line)
+        node.logger.error('"%s": %s', node.command, line.rstrip('\n'))
+
+
+class ShellProcess(object):
+    '''\
+    a persistent process started for a :py:class:`ShellNode`, and the requests
+    waiting on it.
+
+    Requests are written to stdin one per frame (see
+    :py:class:`emit.codecs.Codec`), as an ID followed by a message; with the
+    default JSON codec that is a line holding the ID, a space and the message.
+    The process answers with frames of the same form (one per output message)
+    and then a frame with only the ID to mark the end of that request's
+    output. Requests may be answered in any order.
+    '''
+    def __init__(self, node):
+        self.node = node
+        self.logger = node.logger
+        self.codec = node.get_codec()
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stderr = deque(maxlen=100)
+
+        self.process = Popen(
+            node.get_command(),
+            stdout=PIPE, stderr=PIPE, stdin=PIPE,
+            cwd=node.get_cwd()
+        )
+
+        for target, pipe in ((self.read, self.process.stdout),
+                             (self.drain, self.process.stderr)):
+            thread = threading.Thread(target=target, args=(pipe,))
+            thread.daemon = True
+            thread.start()
+
+        self.logger.debug('started "%s"', node.command)
+
+    @property
+    def running(self):
+        'whether the process is still running'
+        return self.process.poll() is None
+
+    @property
+    def in_flight(self):
+        'number of requests waiting on this process'
+        return len(self.pending)
+
+    def submit(self, request_id, data):
+        '''\
+        send a request to the process
+
+        :param request_id: ID to tag the request with
+        :type request_id: :py:class:`int`
+        :param data: encoded message
+        :type data: :py:class:`bytes`
+
+        :returns: a :py:class:`Queue` which will receive each output message
+                  (still encoded) for this request, then ``END`` (or
+                  ``EXITED`` if the process exits first.)
+        '''
+        responses = Queue()
+        with self.lock:
+            if not self.running:
+                responses.put(EXITED)
+                return responses
+
+            self.pending[request_id] = responses
+            try:
+                self.codec.write_frame(
+                    self.process.stdin, self.codec.tag(request_id, data)
+                )
+                self.process.stdin.flush()
+            except (IOError, OSError):  # exited; reported by ``read``
+                pass
+
+        return responses
+
+    def forget(self, request_id):
+        '''\
+        stop waiting on a request. Output for it which arrives later is
+        dropped.
+        '''
+        self.pending.pop(request_id, None)
+
+    def read(self, stdout):
+        'hand output to the requests waiting for it'
+        for frame in iter(lambda: self.codec.read_frame(stdout), None):
+            if not frame:
+                continue
+
+            try:
+                request_id, data = self.codec.untag(frame)
+            except ValueError:
+                self.logger.error(
+                    '"%s" wrote output without a request ID: %r',
+                    self.node.command, frame
+                )
+                continue
+
+            responses = self.pending.get(request_id)
+            if responses is not None:
+                responses.put(END if data is None else data)
+
+        self.process.wait()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        for responses in pending.values():
+            responses.put(EXITED)
+
+    def drain(self, stderr):
+        'log lines written to stderr, so the process never blocks on it'
+        drain(stderr, self.stderr, self.node)
+
+    def close(self):
+        'stop the process'
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        if self.running:
+            self.process.terminate()
+
+        self.process.wait()
+        self.logger.debug('stopped "%s"', self.node.command)
 
 
 class ShellNode(object):
@@ -12,14 +171,39 @@ class ShellNode(object):
     to use this, subclass ``ShellNode``, providing "command". Decorate it
     however you feel like.
 
-    Messages will be passed in on lines in msgpack format. This class expects
-    similar output: msgpack messages separated by a newline.
+    Messages are passed in, and expected out, in the format of ``codec``: a
+    :py:class:`emit.codecs.Codec` or the name of one. By default that's JSON,
+    one message per line. If ``codec`` is ``None``, the codec of the router
+    the node is registered with is used.
+
+    By default the command is run once per message. Set ``persistent`` to
+    ``True`` to start it once and send it every message instead, using the
+    protocol described in :py:class:`ShellProcess`. ``workers`` persistent
+    processes are started; each request goes to the one with the fewest
+    requests waiting, with at most ``max_in_flight`` waiting per process.
+    Processes which exit are started again for the next message.
+
+    ``timeout`` (in seconds, or ``None`` to wait forever) limits how long a
+    persistent request waits for a process and for its output.
     '''
+    codec = None
+    persistent = False
+    workers = 1
+    max_in_flight = 16
+    timeout = None
+
     def __init__(self):
         self.logger = logging.getLogger('%s.%s' % (
             self.__class__.__module__,
             self.__class__.__name__
         ))
+
+        # persistent processes
+        self.pool = []
+        self.pool_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.workers * self.max_in_flight)
+        self.request_ids = count()
+
         self.logger.debug('initialized %s', self.__class__.__name__)
 
     @property
@@ -29,26 +213,164 @@ class ShellNode(object):
 
     def __call__(self, msg):
         'call the command specified, processing output'
+        if self.persistent:
+            return self.call_persistent(msg)
+
+        return self.call_once(msg)
+
+    def call_once(self, msg):
+        '''\
+        run the command for a single message, processing output line by line
+        as it arrives. stdin and stderr are handled in threads so the command
+        never blocks on a full pipe.
+
+        :raises: :py:exc:`RuntimeError` after the output, if the command wrote
+                 anything to stderr
+        '''
         process = Popen(
             self.get_command(),
             stdout=PIPE, stderr=PIPE, stdin=PIPE,
             cwd=self.get_cwd()
         )
+        stderr = deque(maxlen=100)
+        codec = self.get_codec()
+
+        threads = [
+            threading.Thread(target=self.write, args=(process.stdin, msg.encode(codec))),
+            threading.Thread(target=drain, args=(process.stderr, stderr, self)),
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
 
-        msg_json = msg.as_json()
+        finished = False
         try:
-            stdout, stderr = process.communicate(bytes(msg_json, 'UTF-8'))
-        except TypeError:  # python 2.7.2
-            stdout, stderr = process.communicate(msg_json)
+            messages = 0
+            for frame in iter(lambda: codec.read_frame(process.stdout), None):
+                if frame:
+                    messages += 1
+                    yield self.deserialize_frame(codec, frame)
+
+            finished = True
+        finally:
+            if not finished and process.poll() is None:
+                process.kill()
+
+            process.stdout.close()
+            process.wait()
+            for thread in threads:
+                thread.join()
 
         if stderr:
-            self.logger.error('Error calling "%s": %s', self.command, stderr)
-            raise RuntimeError(stderr)
+            self.logger.error('Error calling "%s"', self.command)
+            raise RuntimeError(''.join(stderr))
+
+        self.logger.debug('subprocess returned %d messages', messages)
+
+    def write(self, stdin, data):
+        'write an encoded message to stdin and close it'
+        try:
+            self.get_codec().write_frame(stdin, data)
+            stdin.close()
+        except (IOError, OSError):  # exited without reading everything
+            pass
+
+    def call_persistent(self, msg):
+        '''\
+        send a message to a persistent process (starting it if needed),
+        processing output as it arrives.
+
+        :raises: :py:exc:`RuntimeError` if the process exits before finishing
+                 the request, or if ``timeout`` passes.
+        '''
+        deadline = None if self.timeout is None else time.time() + self.timeout
+
+        if not self.acquire_slot(self.timeout):
+            raise RuntimeError('timed out waiting for "%s"' % self.command)
+
+        try:
+            process = self.get_process()
+            request_id = next(self.request_ids)
+            responses = process.submit(request_id, msg.encode(process.codec))
+
+            try:
+                while True:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = max(deadline - time.time(), 0)
+
+                    try:
+                        data = responses.get(timeout=remaining)
+                    except Empty:
+                        self.logger.error(
+                            'timed out waiting for "%s"', self.command
+                        )
+                        raise RuntimeError(
+                            'timed out waiting for "%s"' % self.command
+                        )
+
+                    if data is END:
+                        return
+
+                    if data is EXITED:
+                        self.logger.error(
+                            '"%s" exited with %s', self.command,
+                            process.process.returncode
+                        )
+                        raise RuntimeError('"%s" exited with %s: %s' % (
+                            self.command, process.process.returncode,
+                            ''.join(process.stderr)
+                        ))
+
+                    yield self.deserialize_frame(process.codec, data)
+            finally:
+                process.forget(request_id)
+        finally:
+            self.slots.release()
+
+    def acquire_slot(self, timeout):
+        '''\
+        wait for room in the pool (see ``max_in_flight``)
+
+        :returns: whether there was room before ``timeout`` passed
+        '''
+        if timeout is None:
+            return self.slots.acquire()
+
+        try:
+            return self.slots.acquire(timeout=timeout)
+        except TypeError:  # python 2 has no timeout
+            return self.slots.acquire()
 
-        messages = stdout.decode('UTF-8').strip().split('\n')
-        self.logger.debug('subprocess returned %d messages', len(messages))
-        for message in messages:
-            yield self.deserialize(message)
+    def get_process(self):
+        '''\
+        get the persistent process with the fewest requests waiting, starting
+        processes (or restarting ones which exited) as needed
+        '''
+        with self.pool_lock:
+            for i, process in enumerate(self.pool):
+                if not process.running:
+                    self.logger.warning(
+                        '"%s" exited with %s, restarting',
+                        self.command, process.process.returncode
+                    )
+                    process.close()
+                    self.pool[i] = ShellProcess(self)
+
+            if len(self.pool) < self.workers:
+                idle = [p for p in self.pool if not p.in_flight]
+                if not idle:
+                    self.pool.append(ShellProcess(self))
+
+            return min(self.pool, key=lambda process: process.in_flight)
+
+    def close(self):
+        'stop any persistent processes'
+        with self.pool_lock:
+            pool, self.pool = self.pool, []
+
+        for process in pool:
+            process.close()
 
     def get_command(self):
         'get the command as a list'
@@ -62,7 +384,33 @@ class ShellNode(object):
             self.logger.debug('no cwd specified, returning None')
             return None
 
+    def get_codec(self):
+        'get the codec to use (see :py:func:`emit.codecs.get_codec`)'
+        return get_codec(self.codec)
+
+    def deserialize_frame(self, codec, frame):
+        '''\
+        hand a frame of output to :py:meth:`ShellNode.deserialize`, decoding
+        it to :py:class:`str` first for text codecs
+
+        :param codec: codec the frame was read with
+        :type codec: :py:class:`emit.codecs.Codec`
+        :param frame: frame read from the process
+        :type frame: :py:class:`bytes`
+        '''
+        if not codec.binary:
+            frame = frame.decode('utf-8')
+
+        return self.deserialize(frame)
+
     def deserialize(self, msg):
-        'deserialize output to a Python object'
-        self.logger.debug('deserializing %s', msg)
-        return json.loads(msg)
+        '''\
+        deserialize output to a Python object. Override this to change how
+        output is read.
+
+        :param msg: a line of output (without the newline) as
+                    :py:class:`str` for text codecs, or a frame as
+                    :py:class:`bytes` for binary codecs
+        '''
+        self.logger.debug('deserializing %r', msg)
+        return self.get_codec().decode(msg)
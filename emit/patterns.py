@@ -0,0 +1,200 @@
+'index of regular expressions to find every pattern matching a name'
+import re
+
+# a pattern made up only of literal characters and dots (escaped or not), with
+# optional anchors. Every pattern like this contains at least one run of
+# literal characters which has to appear in any name it matches.
+LITERAL = re.compile(r'^\^?((?:[\w-]|\\?\.)+)\$?$')
+
+# a pattern which is the same as the single name it was written for
+EXACT = re.compile(r'^[\w.-]+$')
+
+SEGMENT_SEPARATOR = re.compile(r'\\?\.')
+
+# length of the substrings names are indexed by in ``NameIndex``
+GRAM = 3
+
+
+def literal_segments(pattern):
+    '''\
+    Get the runs of literal characters in a pattern, or ``None`` if the
+    pattern is not made up of literal characters. Every run has to appear in
+    any name the pattern matches.
+
+    :param pattern: pattern to inspect
+    :type pattern: :py:class:`str`
+    '''
+    literal = LITERAL.match(pattern)
+    if not literal:
+        return None
+
+    return [
+        segment for segment in SEGMENT_SEPARATOR.split(literal.group(1))
+        if segment
+    ] or None
+
+
+def grams(text):
+    'every substring of ``text`` which is ``GRAM`` characters long'
+    return set(text[start:start + GRAM] for start in range(len(text) - GRAM + 1))
+
+
+class PatternIndex(object):
+    '''\
+    Holds compiled regular expressions under keys, and finds all the keys with
+    a pattern that matches (with ``re.search``) a given name in one pass.
+
+    Patterns which are plain names (like ``tasks.tweet_text``) are found with a
+    dictionary lookup when the name is the same as the pattern. Other patterns
+    made up of literal characters are only checked against names containing
+    their longest literal segment. Anything else (``.+``, for example) is
+    checked against every name.
+    '''
+    def __init__(self, patterns=None):
+        '''\
+        Create a new index.
+
+        :param patterns: initial patterns to add
+        :type patterns: :py:class:`dict` of keys to lists of compiled regexes
+        '''
+        self.exact = {}
+        self.segments = {}
+        self.lengths = set()
+        self.fallback = []
+
+        for key, regexes in (patterns or {}).items():
+            self.add(key, regexes)
+
+    def add(self, key, regexes):
+        '''\
+        Add patterns to the index
+
+        :param key: key to return when any of the patterns match
+        :param regexes: patterns to add
+        :type regexes: iterable of compiled regular expressions
+        '''
+        for regex in regexes:
+            if EXACT.match(regex.pattern):
+                self.exact.setdefault(regex.pattern, set()).add(key)
+
+            segment = self.get_segment(regex.pattern)
+            if segment:
+                self.segments.setdefault(segment, []).append((key, regex))
+                self.lengths.add(len(segment))
+            else:
+                self.fallback.append((key, regex))
+
+    def get_segment(self, pattern):
+        '''\
+        Get the longest run of literal characters in a pattern, or ``None`` if
+        the pattern is not made up of literal characters.
+
+        :param pattern: pattern to inspect
+        :type pattern: :py:class:`str`
+        '''
+        segments = literal_segments(pattern)
+        if not segments:
+            return None
+
+        return max(segments, key=len)
+
+    def match(self, name):
+        '''\
+        Get every key with a pattern that matches a name
+
+        :param name: name to match
+        :type name: :py:class:`str`
+
+        :returns: :py:class:`set` of keys
+        '''
+        matched = set(self.exact.get(name, ()))
+
+        for length in self.lengths:
+            for start in range(len(name) - length + 1):
+                for key, regex in self.segments.get(name[start:start + length], ()):
+                    if key not in matched and regex.search(name):
+                        matched.add(key)
+
+        for key, regex in self.fallback:
+            if key not in matched and regex.search(name):
+                matched.add(key)
+
+        return matched
+
+
+class NameIndex(object):
+    '''\
+    Holds names, and finds all the names a pattern matches (with
+    ``re.search``) without checking every one.
+
+    A pattern which is a plain name is found with a set lookup. Names are also
+    indexed by their substrings of ``GRAM`` characters, so other patterns made
+    up of literal characters are only checked against names containing every
+    substring of their literal segments. Anything else is checked against
+    every name.
+    '''
+    def __init__(self, names=()):
+        '''\
+        Create a new index.
+
+        :param names: initial names to add
+        :type names: iterable of :py:class:`str`
+        '''
+        self.names = set()
+        self.grams = {}
+
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def add(self, name):
+        '''\
+        Add a name to the index
+
+        :param name: name to add
+        :type name: :py:class:`str`
+        '''
+        if name in self.names:
+            return
+
+        self.names.add(name)
+        for gram in grams(name):
+            self.grams.setdefault(gram, set()).add(name)
+
+    def candidates(self, pattern):
+        '''\
+        Get the names which could match a pattern
+
+        :param pattern: pattern to look up
+        :type pattern: :py:class:`str`
+        '''
+        needed = set()
+        for segment in literal_segments(pattern) or ():
+            needed.update(grams(segment))
+
+        if not needed:
+            return self.names
+
+        found = sorted((self.grams.get(gram, set()) for gram in needed), key=len)
+        return found[0].intersection(*found[1:])
+
+    def search(self, regex):
+        '''\
+        Get every name a pattern matches
+
+        :param regex: pattern to match
+        :type regex: compiled regular expression
+
+        :returns: :py:class:`set` of names
+        '''
+        matched = set()
+        if EXACT.match(regex.pattern) and regex.pattern in self.names:
+            matched.add(regex.pattern)
+
+        for name in self.candidates(regex.pattern):
+            if name not in matched and regex.search(name):
+                matched.add(name)
+
+        return matched
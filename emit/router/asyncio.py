@@ -0,0 +1,283 @@
+from __future__ import absolute_import
+import asyncio
+from collections import Counter
+from functools import wraps
+from inspect import isawaitable
+import time
+from types import AsyncGeneratorType, GeneratorType
+import weakref
+
+from emit.dedupe import get_deduper
+from emit.messages import NoResult
+
+from .core import Router
+
+
+class Unlimited(object):
+    'stands in for a semaphore when concurrency is not limited'
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class AsyncRouter(Router):
+    'Router for asyncio, running the subscribers of each message concurrently'
+    def __init__(self, *args, **kwargs):
+        '''\
+        Route with asyncio. Nodes may be ``async def`` functions (or async
+        generators) as well as plain functions, and calling a node or the
+        router returns a coroutine.
+
+        :param concurrency: (keyword only) most node calls to run at once.
+                            Further calls wait until one finishes. ``None``
+                            doesn't limit them. Defaults to 100. Only node
+                            calls are limited: a message's subscribers, and
+                            the items a generator node yields, are all
+                            routed at once, so a large fanout still creates
+                            a task for each of them.
+        :type concurrency: :py:class:`int` or ``None``
+
+        Other arguments are the same as :py:meth:`Router.__init__`.
+        '''
+        self.concurrency = kwargs.pop('concurrency', 100)
+        super(AsyncRouter, self).__init__(*args, **kwargs)
+
+        # semaphores belong to an event loop, so keep one for each
+        self.semaphores = weakref.WeakKeyDictionary()
+
+        self.logger.debug('Initialized Async Router')
+
+    async def __call__(self, **kwargs):
+        '''\
+        Route a message to all nodes marked as entry points, concurrently.
+        See :py:meth:`Router.__call__`.
+        '''
+        self.log_info('Calling entry point with %r', kwargs)
+        await self.route('__entry_point', kwargs)
+
+    async def feed(self, messages):
+        '''\
+        Route a number of messages to all nodes marked as entry points. Up to
+        ``concurrency`` messages are routed at once. See
+        :py:meth:`Router.feed`.
+
+        :param messages: messages to route
+        :type messages: iterable of :py:class:`dict`
+        '''
+        dispatchers = self.entry_dispatchers()
+        self.log_info('feeding messages to %d entry points', len(dispatchers))
+
+        previous, self.emissions = self.emissions, Counter()
+        count = 0
+        pending = set()
+        try:
+            for message in messages:
+                count += 1
+                pending.add(asyncio.ensure_future(asyncio.gather(*[
+                    dispatch(message) for dispatch in dispatchers
+                ])))
+
+                if self.concurrency is not None and len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+
+            if pending:
+                await asyncio.gather(*pending)
+                pending = ()
+
+            emitted = dict(self.emissions)
+        finally:
+            for task in pending:
+                task.cancel()
+
+            self.emissions = previous
+
+        self.log_info('fed %d messages', count)
+        return {'messages': count, 'emitted': emitted}
+
+    def limit(self):
+        '''\
+        get the semaphore limiting node calls in the running event loop (see
+        ``concurrency``.) Only calling a node holds it, not routing its
+        results, so deep graphs can't deadlock waiting for their own slots.
+        '''
+        if self.concurrency is None:
+            return Unlimited()
+
+        loop = asyncio.get_event_loop()
+        try:
+            return self.semaphores[loop]
+        except KeyError:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.concurrency)
+            return semaphore
+
+    def wrap_as_node(self, func, stream=False, batch_size=None,
+                     batch_timeout=None, cache=None, dedupe=None):
+        '''\
+        wrap a function as a node. The wrapped node is a coroutine function.
+        See :py:meth:`Router.wrap_as_node`. With ``metrics``, the time
+        recorded for a call includes the time the node spends awaiting.
+
+        :raises: :py:exc:`ValueError` if ``batch_size`` or ``cache`` is
+                 given. Batching and cached nodes aren't supported by this
+                 router.
+        '''
+        if batch_size is not None:
+            raise ValueError('AsyncRouter does not support batching nodes')
+
+        if cache is not None:
+            raise ValueError('AsyncRouter does not support cached nodes')
+
+        name = self.get_name(func)
+        deduper = None if dedupe is None else get_deduper(dedupe)
+        if deduper is not None:
+            self.dedupers[name] = deduper
+
+        metrics = self.metrics
+        clock = time.perf_counter
+
+        async def process(message):
+            'call func with a message and route the results'
+            if deduper is not None and deduper.is_duplicate(message):
+                self.log_info('"%s" dropped repeated %r', name, message)
+                return NoResult
+
+            self.log_info('calling "%s" with %r', name, message)
+            # generators are collected while holding the limit, unless the
+            # node asked for its items to be routed as they are produced.
+            # See :py:meth:`Router.wrap_as_node`.
+            async with self.limit():
+                start = clock()
+                result = func(message)
+                if isawaitable(result):
+                    result = await result
+
+                generator = isinstance(result, (GeneratorType, AsyncGeneratorType))
+                if generator and not stream:
+                    if isinstance(result, AsyncGeneratorType):
+                        result = [item async for item in result]
+                    else:
+                        result = list(result)
+
+                elapsed = clock() - start
+
+            if generator and stream:
+                count = dropped = 0
+                while True:
+                    async with self.limit():
+                        start = clock()
+                        try:
+                            if isinstance(result, AsyncGeneratorType):
+                                item = await result.__anext__()
+                            else:
+                                item = next(result)
+                        except (StopIteration, StopAsyncIteration):
+                            break
+                        finally:
+                            elapsed += clock() - start
+
+                    if item is NoResult:
+                        dropped += 1
+                        continue
+
+                    await self.route(name, self.wrap_result(name, item))
+                    count += 1
+
+                if metrics is not None:
+                    metrics.record_call(name, elapsed, count, dropped)
+
+                self.log_debug('%s streamed %d items', func, count)
+                return count
+
+            elif generator:
+                results = [
+                    self.wrap_result(name, item)
+                    for item in result
+                    if item is not NoResult
+                ]
+                if metrics is not None:
+                    metrics.record_call(
+                        name, elapsed, len(results), len(result) - len(results)
+                    )
+
+                self.log_debug(
+                    '%s returned generator yielding %d items', func, len(results)
+                )
+
+                await asyncio.gather(*[self.route(name, item) for item in results])
+                return tuple(results)
+
+            else:
+                if metrics is not None:
+                    dropped = result is NoResult
+                    metrics.record_call(name, elapsed, int(not dropped), int(dropped))
+
+                if result is NoResult:
+                    return result
+
+                result = self.wrap_result(name, result)
+                self.log_debug(
+                    '%s returned single value %s', func, result
+                )
+                await self.route(name, result)
+                return result
+
+        @wraps(func)
+        async def wrapped(*args, **kwargs):
+            'wrapped version of func'
+            return await process(self.get_message_from_call(*args, **kwargs))
+
+        self.processors[wrapped] = process
+
+        return wrapped
+
+    async def route(self, origin, message):
+        '''\
+        dispatch a message to all subscribers of ``origin`` concurrently,
+        returning once they have all finished. See :py:meth:`Router.route`.
+        '''
+        if self.emissions is not None:
+            self.count_emission(origin)
+
+        if self.dispatch_table is not None:
+            dispatchers = self.dispatch_table.get(origin, ())
+        else:
+            self.resolve_node_modules()
+            dispatchers = [
+                self.get_dispatcher(origin, destination)
+                for destination in self.routes.get(origin, ())
+            ]
+
+        if not self.routing_enabled or not dispatchers:
+            return
+
+        if len(dispatchers) == 1:
+            await dispatchers[0](message)
+            return
+
+        await asyncio.gather(*[dispatch(message) for dispatch in dispatchers])
+
+    async def dispatch(self, origin, destination, message):
+        '''\
+        dispatch a message to a named function, awaiting it. See
+        :py:meth:`Router.dispatch`.
+        '''
+        func = self.functions[destination]
+        self.log_debug('calling %r directly', func)
+
+        process = self.processors.get(func)
+        if process is None:
+            result = func(_origin=origin, **message)
+            if isawaitable(result):
+                result = await result
+
+            return result
+
+        bundle = dict(message)
+        bundle['_origin'] = origin
+        return await process(self.message_class.adopt(bundle))
@@ -1,4 +1,10 @@
 from __future__ import absolute_import
+from contextlib import contextmanager
+from functools import wraps
+import re
+import threading
+
+from celery import group
 
 from .core import Router
 
@@ -12,23 +18,143 @@ class CeleryRouter(Router):
         :param celery_task: celery task to apply to all nodes (can be
                             overridden in :py:meth:`Router.node`.)
         :type celery_task: A celery task decorator, in any form
+        :param chunk_size: (keyword only) when one node call dispatches more
+                           than this many messages to the same node, send
+                           them as Celery chunks of this many messages per
+                           task instead of one task per message. ``None``
+                           (the default) never chunks.
+        :type chunk_size: :py:class:`int` or ``None``
         '''
+        self.chunk_size = kwargs.pop('chunk_size', None)
         super(CeleryRouter, self).__init__(*args, **kwargs)
         self.celery_task = celery_task
+
+        # dispatches collected while in ``batch``, per thread (or greenlet,
+        # when gevent or eventlet patch ``threading``)
+        self.local = threading.local()
+
         self.logger.debug('Initialized Celery Router')
 
+    @property
+    def pending(self):
+        'dispatches collected by the current thread\'s batch, or ``None``'
+        return getattr(self.local, 'pending', None)
+
+    @pending.setter
+    def pending(self, value):
+        self.local.pending = value
+
+    def __call__(self, **kwargs):
+        'route a message to all entry points, publishing them together'
+        with self.batch():
+            super(CeleryRouter, self).__call__(**kwargs)
+
+    def feed(self, messages):
+        '''\
+        route a number of messages to all entry points, publishing them
+        together. See :py:meth:`Router.feed`.
+        '''
+        with self.batch():
+            return super(CeleryRouter, self).feed(messages)
+
     def dispatch(self, origin, destination, message):
         '''\
-        enqueue a message with Celery
+        enqueue a message with Celery. Inside :py:meth:`CeleryRouter.batch`
+        the message is collected to be published when the batch ends.
+        Messages to batching nodes (see ``batch_size`` in
+        :py:meth:`Router.node`) are added to the node's batch instead, which
+        is published as one task.
 
         :param destination: destination to dispatch to
         :type destination: :py:class:`str`
         :param message: message to dispatch
         :type message: :py:class:`emit.message.Message` or subclass
         '''
+        kwargs = dict(message)
+        kwargs['_origin'] = origin
+
+        batcher = self.batchers.get(destination)
+        if batcher is not None:
+            return batcher.add(kwargs)
+
+        if self.pending is not None:
+            self.pending.append((destination, kwargs))
+            return None
+
         func = self.functions[destination]
-        self.logger.debug('delaying %r', func)
-        return func.delay(_origin=origin, **message)
+        self.log_debug('delaying %r', func)
+        return func.delay(**kwargs)
+
+    @contextmanager
+    def batch(self):
+        '''\
+        collect the messages dispatched inside this context and publish them
+        together at the end as a Celery group (see
+        :py:meth:`CeleryRouter.publish`.) Every node runs inside a batch. If
+        the context raises, nothing is published.
+        '''
+        if self.pending is not None:  # already collecting
+            yield
+            return
+
+        self.pending = []
+        try:
+            yield
+            pending = self.pending
+        finally:
+            self.pending = None
+
+        self.publish(pending)
+
+    def publish(self, dispatches):
+        '''\
+        publish a number of messages. A single message is sent with
+        ``delay``. More are sent as one group of signatures, with messages to
+        the same node split into chunks if there are more than
+        ``chunk_size`` of them.
+
+        :param dispatches: messages to publish
+        :type dispatches: :py:class:`list` of ``(destination, kwargs)``
+                          tuples
+        '''
+        if not dispatches:
+            return None
+
+        if len(dispatches) == 1:
+            destination, kwargs = dispatches[0]
+            func = self.functions[destination]
+            self.log_debug('delaying %r', func)
+            return func.delay(**kwargs)
+
+        by_destination = {}
+        for destination, kwargs in dispatches:
+            by_destination.setdefault(destination, []).append(kwargs)
+
+        tasks = []
+        for destination, messages in by_destination.items():
+            func = self.functions[destination]
+            if self.chunk_size and len(messages) > self.chunk_size:
+                self.log_debug(
+                    'chunking %d messages to %r', len(messages), func
+                )
+                chunks = func.chunks(
+                    [(kwargs,) for kwargs in messages], self.chunk_size
+                )
+                tasks.extend(chunks.group().tasks)
+            else:
+                tasks.extend(func.s(**kwargs) for kwargs in messages)
+
+        self.log_debug('publishing group of %d tasks', len(tasks))
+        return group(tasks).apply_async()
+
+    def send_batch(self, name, messages):
+        '''\
+        send a batch of messages to a batching node as a single job, which
+        calls the node with the whole list
+        '''
+        func = self.functions[name]
+        self.log_debug('delaying batch of %d messages to %r', len(messages), func)
+        return func.delay(messages)
 
     def wrap_node(self, node, options):
         '''\
@@ -36,7 +162,23 @@ class CeleryRouter(Router):
         can pass a celery task and we'll wrap our code with theirs in a nice
         package celery can execute.
         '''
+        @wraps(node)
+        def batched(*args, **kwargs):
+            'run the node, publishing everything it dispatches together'
+            with self.batch():
+                result = node(*args, **kwargs)
+
+                # the worker may exit after this job, so don't leave
+                # messages waiting in batches
+                self.flush()
+                return result
+
+        # celery compiles a stub with the function's name to check task
+        # signatures, which fails for names like ``<lambda>``
+        if not batched.__name__.isidentifier():
+            batched.__name__ = re.sub(r'\W|^(?=\d)', '_', batched.__name__)
+
         if 'celery_task' in options:
-            return options['celery_task'](node)
+            return options['celery_task'](batched)
 
-        return self.celery_task(node)
+        return self.celery_task(batched)
@@ -1,16 +1,37 @@
 'router for emit'
-from functools import wraps
+from collections import Counter
+from functools import partial, wraps
+import hashlib
 import importlib
+import json
 import logging
+from numbers import Number
+import os
 import re
+import time
 from types import GeneratorType
 
-from emit.messages import Message, NoResult
+from emit.batching import Batcher
+from emit.caching import get_cache
+from emit.dedupe import get_deduper
+from emit.messages import Bounded, Message, NoResult
+from emit.metrics import Metrics
+from emit.patterns import NameIndex, PatternIndex
+
+
+# format of files written by ``Router.save_manifest``
+MANIFEST_VERSION = 1
+
+
+def noop(*args, **kwargs):
+    'do nothing. Stands in for logging hooks when logging is disabled.'
+    pass
 
 
 class Router(object):
     'A router object. Holds routes and references to functions for dispatch'
-    def __init__(self, message_class=None, node_modules=None, node_package=None):
+    def __init__(self, message_class=None, node_modules=None, node_package=None,
+                 log_messages=True, codec=None, metrics=None, manifest=None):
         '''\
         Create a new router object. All parameters are optional.
 
@@ -21,6 +42,29 @@ class Router(object):
         :param node_package: if any node_modules are relative, the path to base
                                off of.
         :type node_package: :py:class:`str`, or ``None``.
+        :param log_messages: whether to log each message passing through the
+                             graph. ``True`` leaves the decision to the
+                             logger's level on every message, ``False`` never
+                             logs messages, and ``None`` checks the logger's
+                             level once, when registering nodes and when
+                             freezing. See :py:meth:`Router.configure_logging`.
+        :type log_messages: :py:class:`bool` or ``None``
+        :param codec: codec for nodes which talk to other processes and don't
+                      choose one themselves (like
+                      :py:class:`emit.multilang.ShellNode`.) See
+                      :py:func:`emit.codecs.get_codec`.
+        :type codec: :py:class:`emit.codecs.Codec`, :py:class:`str` or
+                     ``None``
+        :param metrics: where to record calls, emissions, latency and edge
+                        counts, or ``True`` for a new
+                        :py:class:`emit.metrics.Metrics`. Nodes registered
+                        while this is ``None`` (the default) aren't measured
+                        at all.
+        :type metrics: :py:class:`emit.metrics.Metrics`, :py:class:`bool` or
+                       ``None``
+        :param manifest: path of a route manifest to load (see
+                         :py:meth:`Router.load_manifest`)
+        :type manifest: :py:class:`str` or ``None``
 
         :exceptions: None
         :returns: None
@@ -29,11 +73,27 @@ class Router(object):
         self.names = set()
         self.regexes = {}
         self.ignore_regexes = {}
+        self.regex_index = PatternIndex()
+        self.ignore_index = PatternIndex()
+        self.name_index = NameIndex()
 
         self.fields = {}
         self.functions = {}
+        self.processors = {}
+        self.batchers = {}
+        self.caches = {}
+        self.dedupers = {}
+
+        # ``close`` methods of nodes holding resources (like
+        # :py:class:`emit.multilang.ShellNode`), called by ``close``
+        self.closers = []
 
         self.message_class = message_class or Message
+        self.codec = codec
+
+        if metrics is True:
+            metrics = Metrics()
+        self.metrics = metrics or None
 
         # manage imported packages, lazily importing before the first message
         # is routed.
@@ -44,8 +104,22 @@ class Router(object):
         self.logger = logging.getLogger(__name__ + '.Router')
         self.logger.debug('Initialized Router')
 
+        self.log_messages = log_messages
+        self.configure_logging()
+
         self.routing_enabled = True
 
+        # set by ``freeze``
+        self.dispatch_table = None
+
+        # counts of messages routed from each origin, while in ``feed``
+        self.emissions = None
+
+        # set by ``load_manifest`` until the manifest is applied
+        self.manifest = None
+        if manifest is not None:
+            self.load_manifest(manifest)
+
     def __call__(self, **kwargs):
         '''\
         Route a message to all nodes marked as entry points.
@@ -55,34 +129,138 @@ class Router(object):
            (dictionary) as other points in this API do - it must be expanded to
            keyword arguments in this case.
         '''
-        self.logger.info('Calling entry point with %r', kwargs)
+        self.log_info('Calling entry point with %r', kwargs)
         self.route('__entry_point', kwargs)
 
-    def wrap_as_node(self, func):
-        'wrap a function as a node'
+    def feed(self, messages):
+        '''\
+        Route a number of messages to all nodes marked as entry points. This
+        is the same as calling the router with each message, but the work
+        done before routing (resolving node modules, finding entry points and
+        logging) happens once for the whole batch. Batching nodes are flushed
+        at the end (see :py:meth:`Router.flush`.)
+
+        :param messages: messages to route
+        :type messages: iterable of :py:class:`dict`
+
+        :returns: a :py:class:`dict` with the number of ``messages`` routed
+                  and the number of messages ``emitted`` by each node in this
+                  process. (Nodes run by RQ or Celery workers emit in the
+                  worker instead, so they aren't counted here.)
+        '''
+        dispatchers = self.entry_dispatchers()
+        self.log_info('feeding messages to %d entry points', len(dispatchers))
+
+        previous, self.emissions = self.emissions, Counter()
+        count = 0
+        try:
+            for message in messages:
+                count += 1
+                for dispatch in dispatchers:
+                    dispatch(message)
+
+            self.flush()
+            emitted = dict(self.emissions)
+        finally:
+            self.emissions = previous
+
+        self.log_info('fed %d messages', count)
+        return {'messages': count, 'emitted': emitted}
+
+    def entry_dispatchers(self):
+        '''\
+        get the functions which dispatch a message to each entry point (see
+        :py:meth:`Router.get_dispatcher`.) Feeding messages through these
+        skips routing from ``'__entry_point'``, so it isn't counted as an
+        emission.
+
+        :returns: a sequence of callables, empty while routing is disabled
+        '''
+        if not self.routing_enabled:
+            return ()
+
+        if self.dispatch_table is not None:
+            return self.dispatch_table.get('__entry_point', ())
+
+        self.resolve_node_modules()
+        return [
+            self.get_dispatcher('__entry_point', destination)
+            for destination in sorted(self.routes.get('__entry_point', ()))
+        ]
+
+    def wrap_as_node(self, func, stream=False, batch_size=None,
+                     batch_timeout=None, cache=None, dedupe=None):
+        '''\
+        wrap a function as a node
+
+        :param func: function to wrap
+        :type func: callable
+        :param stream: route items yielded by ``func`` as they are produced.
+                       See :py:meth:`Router.node`.
+        :type stream: :py:class:`bool`
+        :param batch_size: call ``func`` with lists of up to this many
+                           messages. See :py:meth:`Router.node`.
+        :type batch_size: :py:class:`int` or ``None``
+        :param batch_timeout: most seconds to hold a message for a batch
+        :type batch_timeout: :py:class:`float` or ``None``
+        :param cache: remember results of ``func``. See
+                      :py:meth:`Router.node`.
+        :type cache: :py:class:`bool`, :py:class:`int`,
+                     :py:class:`emit.caching.Cache` or ``None``
+        :param dedupe: drop repeated messages. See :py:meth:`Router.node`.
+        :type dedupe: :py:class:`bool`, :py:class:`str`, :py:class:`list`,
+                      :py:class:`emit.dedupe.Deduper` or ``None``
+
+        :raises: :py:exc:`ValueError` if ``cache`` is combined with
+                 ``stream`` or ``batch_size``, or ``dedupe`` with
+                 ``batch_size``
+        '''
         name = self.get_name(func)
 
-        @wraps(func)
-        def wrapped(*args, **kwargs):
-            'wrapped version of func'
-            message = self.get_message_from_call(*args, **kwargs)
-            self.logger.info('calling "%s" with %r', name, message)
-            result = func(message)
+        if cache is not None and (stream or batch_size is not None):
+            raise ValueError('cached nodes cannot stream or batch')
+
+        if dedupe is not None and batch_size is not None:
+            raise ValueError('batching nodes cannot dedupe')
+
+        if batch_size is not None:
+            return self.wrap_as_batch_node(func, batch_size, batch_timeout)
+
+        call = func
+        if self.metrics is not None:
+            call = self.measure(name, func, stream=stream)
+
+        def process(message):
+            'call func with a message and route the results'
+            self.log_info('calling "%s" with %r', name, message)
+            result = call(message)
 
             # functions can return multiple values ("emit" multiple times)
             # by yielding instead of returning. Handle this case by making
             # a list of the results and processing them all after the
             # generator successfully exits. If we were to process them as
             # they came out of the generator, we might get a partially
-            # processed input sent down the graph. This may be possible in
-            # the future via a flag.
-            if isinstance(result, GeneratorType):
+            # processed input sent down the graph, so that's only done when
+            # the node asks for it with ``stream``.
+            if isinstance(result, GeneratorType) and stream:
+                count = 0
+                for item in result:
+                    if item is NoResult:
+                        continue
+
+                    self.route(name, self.wrap_result(name, item))
+                    count += 1
+
+                self.log_debug('%s streamed %d items', func, count)
+                return count
+
+            elif isinstance(result, GeneratorType):
                 results = [
                     self.wrap_result(name, item)
                     for item in result
                     if item is not NoResult
                 ]
-                self.logger.debug(
+                self.log_debug(
                     '%s returned generator yielding %d items', func, len(results)
                 )
 
@@ -96,16 +274,283 @@ class Router(object):
                     return result
 
                 result = self.wrap_result(name, result)
-                self.logger.debug(
+                self.log_debug(
                     '%s returned single value %s', func, result
                 )
                 self.route(name, result)
                 return result
 
+        if cache is not None:
+            process = self.wrap_as_cached(name, process, get_cache(cache))
+
+        if dedupe is not None:
+            process = self.wrap_as_deduplicated(
+                name, process, get_deduper(dedupe)
+            )
+
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            'wrapped version of func'
+            return process(self.get_message_from_call(*args, **kwargs))
+
+        # in-process dispatch can skip building and parsing keyword arguments
+        # by handing a message straight to ``process``.
+        self.processors[wrapped] = process
+
+        return wrapped
+
+    def wrap_as_cached(self, name, process, cache):
+        '''\
+        remember what a node's ``process`` returns for each message. When a
+        message is found in the cache, ``process`` isn't called, but the
+        cached results are routed again just as ``process`` would route them.
+        Messages the cache can't make a key for are logged and passed
+        straight to ``process``.
+
+        :param name: name of the node
+        :type name: :py:class:`str`
+        :param process: the node's message processor (see
+                        :py:meth:`Router.wrap_as_node`)
+        :type process: callable
+        :param cache: where to keep results
+        :type cache: :py:class:`emit.caching.Cache`
+        '''
+        self.caches[name] = cache
+
+        def cached(message):
+            'look message up in the cache, or process it and cache the result'
+            try:
+                key = cache.key(message)
+            except (TypeError, ValueError) as err:
+                self.logger.warning(
+                    '"%s" can\'t cache %r, calling it anyway: %s',
+                    name, message, err
+                )
+                return process(message)
+
+            found, result = cache.get(key)
+            if not found:
+                result = process(message)
+                cache.set(key, result)
+                return result
+
+            self.log_info('"%s" found a cached result for %r', name, message)
+            if isinstance(result, tuple):
+                for item in result:
+                    self.route(name, item)
+            elif result is not NoResult:
+                self.route(name, result)
+
+            return result
+
+        return cached
+
+    def wrap_as_deduplicated(self, name, process, deduper):
+        '''\
+        drop messages to a node's ``process`` which ``deduper`` has seen
+        before. Dropped messages return ``NoResult``. Messages the deduper
+        can't make a key for are logged and never count as repeats.
+
+        :param name: name of the node
+        :type name: :py:class:`str`
+        :param process: the node's message processor (see
+                        :py:meth:`Router.wrap_as_node`)
+        :type process: callable
+        :param deduper: what decides which messages are repeats
+        :type deduper: :py:class:`emit.dedupe.Deduper`
+        '''
+        self.dedupers[name] = deduper
+
+        def deduplicated(message):
+            'process message, unless it is a repeat'
+            try:
+                duplicate = deduper.is_duplicate(message)
+            except (TypeError, ValueError) as err:
+                self.logger.warning(
+                    '"%s" can\'t check %r for repeats, calling it anyway: %s',
+                    name, message, err
+                )
+                duplicate = False
+
+            if duplicate:
+                self.log_info('"%s" dropped repeated %r', name, message)
+                return NoResult
+
+            return process(message)
+
+        return deduplicated
+
+    def duplicates(self):
+        '''\
+        count the repeated messages dropped by each node with ``dedupe``
+
+        :returns: a :py:class:`dict` of node names to dropped counts
+        '''
+        return dict(
+            (name, deduper.dropped) for name, deduper in self.dedupers.items()
+        )
+
+    def wrap_as_batch_node(self, func, batch_size, batch_timeout=None):
+        '''\
+        wrap a function which takes a list of messages as a node. Messages
+        dispatched to the node are collected by a
+        :py:class:`emit.batching.Batcher` and sent with
+        :py:meth:`Router.send_batch`.
+
+        :param func: function to wrap
+        :type func: callable
+        :param batch_size: most messages in a batch
+        :type batch_size: :py:class:`int`
+        :param batch_timeout: most seconds to hold a message before sending a
+                              partial batch, or ``None`` to wait for a full
+                              one (or :py:meth:`Router.flush`)
+        :type batch_timeout: :py:class:`float` or ``None``
+        '''
+        name = self.get_name(func)
+
+        call = func
+        if self.metrics is not None:
+            call = self.measure(name, func, many=True)
+
+        def process(messages):
+            'call func with a list of messages and route each result'
+            self.log_info('calling "%s" with %d messages', name, len(messages))
+            results = [
+                self.wrap_result(name, item)
+                for item in call(messages)
+                if item is not NoResult
+            ]
+            self.log_debug(
+                '%s returned %d results for %d messages',
+                func, len(results), len(messages)
+            )
+
+            [self.route(name, item) for item in results]
+            return tuple(results)
+
+        batcher = Batcher(
+            batch_size, batch_timeout, partial(self.send_batch, name)
+        )
+        self.batchers[name] = batcher
+
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            '''\
+            wrapped version of func. A list of messages is processed now. A
+            single message is added to the batch, and routed when the batch
+            is sent.
+            '''
+            if len(args) == 1 and not kwargs and isinstance(args[0], list):
+                return process([
+                    message if isinstance(message, Message)
+                    else self.message_class.adopt(message)
+                    for message in args[0]
+                ])
+
+            return batcher.add(self.get_message_from_call(*args, **kwargs))
+
+        self.processors[wrapped] = batcher.add
+
         return wrapped
 
+    def measure(self, name, func, stream=False, many=False):
+        '''\
+        wrap a node's function to record each call in ``metrics``: the time
+        spent in ``func`` (including running a generator it returns, but not
+        routing the results), the number of results and the number of
+        ``NoResult`` values. Calls which raise aren't recorded.
+
+        :param name: name of the node
+        :type name: :py:class:`str`
+        :param func: function to measure
+        :type func: callable
+        :param stream: time each item as the generator produces it, instead
+                       of collecting the generator's items up front
+        :type stream: :py:class:`bool`
+        :param many: ``func`` always returns an iterable of results (like
+                     batching nodes)
+        :type many: :py:class:`bool`
+
+        :returns: a function which returns the same results as ``func``.
+                  Generators are replaced with generators over the same
+                  items.
+        '''
+        metrics = self.metrics
+        clock = time.perf_counter
+
+        def timed(result, elapsed):
+            'yield the items of a generator, timing each'
+            emitted = dropped = 0
+            while True:
+                start = clock()
+                try:
+                    item = next(result)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += clock() - start
+
+                if item is NoResult:
+                    dropped += 1
+                else:
+                    emitted += 1
+
+                yield item
+
+            metrics.record_call(name, elapsed, emitted, dropped)
+
+        @wraps(func)
+        def measured(message):
+            'call func, recording the call in metrics'
+            start = clock()
+            result = func(message)
+
+            if isinstance(result, GeneratorType) and stream:
+                return timed(result, clock() - start)
+
+            if many or isinstance(result, GeneratorType):
+                items = list(result)
+                dropped = sum(1 for item in items if item is NoResult)
+                metrics.record_call(
+                    name, clock() - start, len(items) - dropped, dropped
+                )
+                return items if many else (item for item in items)
+
+            dropped = result is NoResult
+            metrics.record_call(
+                name, clock() - start, int(not dropped), int(dropped)
+            )
+            return result
+
+        return measured
+
+    def send_batch(self, name, messages):
+        '''\
+        send a full (or flushed) batch of messages to a batching node. The
+        node is called with the list of messages, here in this process.
+
+        :param name: name of the node
+        :type name: :py:class:`str`
+        :param messages: messages in the batch
+        :type messages: :py:class:`list` of
+                        :py:class:`emit.messages.Message`
+        '''
+        self.log_debug('sending batch of %d messages to "%s"', len(messages), name)
+        return self.functions[name](messages)
+
+    def flush(self):
+        '''\
+        send the messages waiting in every batching node's batch, without
+        waiting for the batches to fill
+        '''
+        for name, batcher in list(self.batchers.items()):
+            if len(batcher):
+                self.log_debug('flushing batch for "%s"', name)
+                batcher.flush()
+
     def node(self, fields, subscribe_to=None, entry_point=False, ignore=None,
-             **wrapper_options):
+             stream=False, batch_size=None, batch_timeout=None, cache=None,
+             dedupe=None, **wrapper_options):
         '''\
         Decorate a function to make it a node.
 
@@ -129,6 +574,45 @@ class Router(object):
                             that is, this function will be called when the
                             router is called directly.
         :type entry_point: :py:class:`bool`
+        :param stream: if the function yields, route each item as soon as it
+                       is yielded instead of after the generator finishes.
+                       Calling the node then returns the number of items
+                       routed instead of a tuple of them.
+        :type stream: :py:class:`bool`
+        :param batch_size: call the function with a list of up to this many
+                           messages instead of one at a time. It should
+                           return (or yield) a list of results, each of which
+                           is routed separately. Messages routed to the node
+                           wait until the batch is full, ``batch_timeout``
+                           passes, or :py:meth:`Router.flush` is called.
+        :type batch_size: :py:class:`int` or ``None``
+        :param batch_timeout: most seconds a message waits for its batch to
+                              fill. The partial batch is then sent from a
+                              timer thread.
+        :type batch_timeout: :py:class:`float` or ``None``
+        :param cache: remember the results of the function for each message
+                      (told apart by a hash of its fields, see
+                      :py:func:`emit.caching.message_key`), and route the
+                      remembered results instead of calling it again. Only
+                      use this for functions which depend on nothing but
+                      the message. ``True`` keeps the 1024 most recently
+                      used results, an :py:class:`int` that many, and an
+                      :py:class:`emit.caching.Cache` can also set a time to
+                      live. Caches are kept in ``caches`` by node name.
+                      Cached nodes can't ``stream`` or batch.
+        :type cache: :py:class:`bool`, :py:class:`int`,
+                     :py:class:`emit.caching.Cache` or ``None``
+        :param dedupe: drop messages which repeat one the node has already
+                       received, without calling the function. ``True``
+                       compares every field (except ``_origin``), a field
+                       name or list of names compares only those (an
+                       idempotency key), and an
+                       :py:class:`emit.dedupe.Deduper` can also set a time
+                       window and a Bloom filter. Set this on entry points
+                       to drop repeats before they fan out. See
+                       :py:meth:`Router.duplicates` for the number dropped.
+        :type dedupe: :py:class:`bool`, :py:class:`str`, :py:class:`list`,
+                      :py:class:`emit.dedupe.Deduper` or ``None``
 
         In addition to all of the above, you can define a ``wrap_node``
         function on a subclass of Router, which will need to receive node and
@@ -142,7 +626,15 @@ class Router(object):
             'outer level function'
             # create a wrapper function
             self.logger.debug('wrapping %s', func)
-            wrapped = self.wrap_as_node(func)
+            options = {}
+            if batch_size is not None:
+                options.update(batch_size=batch_size, batch_timeout=batch_timeout)
+            if cache is not None:
+                options['cache'] = cache
+            if dedupe is not None:
+                options['dedupe'] = dedupe
+
+            wrapped = self.wrap_as_node(func, stream=stream, **options)
 
             if hasattr(self, 'wrap_node'):
                 self.logger.debug('wrapping node "%s" in custom wrapper', wrapped)
@@ -154,12 +646,22 @@ class Router(object):
                 name, wrapped, fields, subscribe_to, entry_point, ignore
             )
 
+            if self.codec is not None and getattr(func, 'codec', False) is None:
+                func.codec = self.codec
+
+            close = getattr(func, 'close', None)
+            if callable(close):
+                self.closers.append(close)
+
             return wrapped
 
         return outer
 
     def resolve_node_modules(self):
-        'import the modules specified in init'
+        '''\
+        import the modules specified in init, then apply a loaded manifest
+        (see :py:meth:`Router.load_manifest`), if any
+        '''
         if not self.resolved_node_modules:
             try:
                 self.resolved_node_modules = [
@@ -170,8 +672,173 @@ class Router(object):
                 self.resolved_node_modules = []
                 raise
 
+        if self.manifest is not None:
+            self.apply_manifest()
+
         return self.resolved_node_modules
 
+    def route_hash(self):
+        '''\
+        hash everything the routes are computed from: node names,
+        subscriptions, ignores and entry points, plus each node's fields
+
+        :returns: :py:class:`str`
+        '''
+        state = {
+            'names': sorted(self.names),
+            'subscriptions': dict(
+                (name, [regex.pattern for regex in regexes])
+                for name, regexes in self.regexes.items()
+            ),
+            'ignores': dict(
+                (name, [regex.pattern for regex in regexes])
+                for name, regexes in self.ignore_regexes.items()
+            ),
+            'entry_points': sorted(self.routes.get('__entry_point', ())),
+            'fields': dict(
+                (name, list(fields)) for name, fields in self.fields.items()
+            ),
+        }
+        return hashlib.sha256(
+            json.dumps(state, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def ignored_routes(self):
+        '''\
+        find the routes which would exist if their destination didn't ignore
+        their origin
+
+        :returns: sorted :py:class:`list` of ``[origin, destination]`` pairs
+        '''
+        ignored = []
+        for destination, ignores in self.ignore_regexes.items():
+            subscriptions = self.regexes.get(destination, [])
+            for name in self.names:
+                if name == destination:
+                    continue
+
+                if any(regex.search(name) for regex in subscriptions) and \
+                        any(regex.search(name) for regex in ignores):
+                    ignored.append([name, destination])
+
+        return sorted(ignored)
+
+    def save_manifest(self, path):
+        '''\
+        write the resolved routes to a manifest file, for workers to load
+        with :py:meth:`Router.load_manifest` instead of computing them. The
+        file is replaced atomically, so workers starting meanwhile read
+        either the old manifest or the new one.
+
+        The manifest is JSON with the ``routes``, each node's ``fields``, the
+        ``ignored`` routes (for reference) and the :py:meth:`Router.route_hash`
+        they were computed from.
+
+        :param path: where to write the manifest
+        :type path: :py:class:`str`
+
+        :returns: the manifest, as a :py:class:`dict`
+        '''
+        self.resolve_node_modules()
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'hash': self.route_hash(),
+            'routes': dict(
+                (origin, sorted(destinations))
+                for origin, destinations in self.routes.items()
+            ),
+            'fields': dict(
+                (name, list(fields)) for name, fields in self.fields.items()
+            ),
+            'ignored': self.ignored_routes(),
+        }
+
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'w') as out:
+            json.dump(manifest, out, indent=1, sort_keys=True)
+        os.replace(temporary, path)
+
+        self.logger.info(
+            'saved routes for %d origins to %s', len(manifest['routes']), path
+        )
+        return manifest
+
+    def load_manifest(self, path):
+        '''\
+        load a manifest written by :py:meth:`Router.save_manifest`. Until the
+        manifest is applied, registering nodes doesn't resolve routes. It's
+        applied when node modules are resolved (before the first message is
+        routed, or when freezing): if :py:meth:`Router.route_hash` of the
+        registered nodes matches the manifest, its routes are used as they
+        are. Otherwise they are all computed with
+        :py:meth:`Router.regenerate_routes`.
+
+        Load the manifest before registering nodes, usually by passing it to
+        the router's ``manifest`` argument. A manifest which is missing,
+        can't be read or isn't a manifest of this version is logged as a
+        warning and ignored, so routes are computed as if no manifest had
+        been given.
+
+        :param path: manifest to load
+        :type path: :py:class:`str`
+
+        :raises: :py:exc:`RuntimeError` if the router is frozen
+
+        :returns: whether the manifest was loaded
+        '''
+        self.check_frozen()
+
+        try:
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError) as err:
+            self.logger.warning(
+                'could not load route manifest %s (%s), computing routes',
+                path, err
+            )
+            return False
+
+        if not isinstance(manifest, dict) or \
+                manifest.get('version') != MANIFEST_VERSION or \
+                not isinstance(manifest.get('hash'), str) or \
+                not isinstance(manifest.get('routes'), dict):
+            self.logger.warning(
+                '%s is not a version %d route manifest, computing routes',
+                path, MANIFEST_VERSION
+            )
+            return False
+
+        self.logger.debug('loaded manifest from %s', path)
+        self.manifest = manifest
+        return True
+
+    def apply_manifest(self):
+        '''\
+        use the routes from a loaded manifest if it matches the registered
+        nodes, or compute them all if it doesn't
+
+        :returns: whether the manifest matched
+        '''
+        manifest, self.manifest = self.manifest, None
+
+        if manifest['hash'] == self.route_hash():
+            self.routes = dict(
+                (origin, set(destinations))
+                for origin, destinations in manifest['routes'].items()
+            )
+            self.logger.info(
+                'using manifest routes for %d origins', len(self.routes)
+            )
+            return True
+
+        self.logger.warning(
+            'route manifest does not match the registered nodes, '
+            'computing routes'
+        )
+        self.regenerate_routes()
+        return False
+
     def get_message_from_call(self, *args, **kwargs):
         '''\
         Get message object from a call.
@@ -183,14 +850,17 @@ class Router(object):
 
          - A single positional argument (a :py:class:`dict`)
          - No positional arguments and a number of keyword arguments
+
+        The dictionary is not copied. See :py:class:`emit.messages.Message`
+        for why nodes must not change it.
         '''
         if len(args) == 1 and isinstance(args[0], dict):
             # then it's a message
-            self.logger.debug('called with arg dictionary')
+            self.log_debug('called with arg dictionary')
             result = args[0]
         elif len(args) == 0 and kwargs != {}:
             # then it's a set of kwargs
-            self.logger.debug('called with kwargs')
+            self.log_debug('called with kwargs')
             result = kwargs
         else:
             # it's neither, and we don't handle that
@@ -200,7 +870,7 @@ class Router(object):
             )
             raise TypeError('Pass either keyword arguments or a dictionary argument')
 
-        return self.message_class(result)
+        return self.message_class.adopt(result)
 
     def register(self, name, func, fields, subscribe_to, entry_point, ignore):
         '''
@@ -214,6 +884,8 @@ class Router(object):
         ``fields``, ``subscribe_to`` and ``entry_point`` are the same as in
         :py:meth:`Router.node`.
         '''
+        self.check_frozen()
+
         self.fields[name] = fields
         self.functions[name] = func
 
@@ -226,6 +898,7 @@ class Router(object):
             self.add_entry_point(name)
 
         self.logger.info('registered %s', name)
+        self.configure_logging()
 
     def add_entry_point(self, destination):
         '''\
@@ -234,6 +907,8 @@ class Router(object):
         :param destination: node to route to initially
         :type destination: str
         '''
+        self.check_frozen()
+
         self.routes.setdefault('__entry_point', set()).add(destination)
         return self.routes['__entry_point']
 
@@ -251,17 +926,33 @@ class Router(object):
             {'node_a': set(['node_b', 'node_c']),
              'node_b': set(['node_d'])}
 
+        Only the routes which could have changed are recomputed: the new
+        destination's regexes against existing names, and existing regexes
+        against the new name.
         '''
+        self.check_frozen()
+
+        new_name = destination not in self.names
         self.names.add(destination)
+        self.name_index.add(destination)
         self.logger.debug('added "%s" to names', destination)
 
         origins = origins or []  # remove None
         if not isinstance(origins, list):
             origins = [origins]
 
-        self.regexes.setdefault(destination, [re.compile(origin) for origin in origins])
+        # with a manifest loaded, routes are resolved when it's applied
+        resolve = self.manifest is None
+
+        if destination not in self.regexes:
+            self.regexes[destination] = [re.compile(origin) for origin in origins]
+            self.regex_index.add(destination, self.regexes[destination])
+            if resolve:
+                self.resolve_destination(destination)
+
+        if new_name and resolve:
+            self.resolve_origin(destination)
 
-        self.regenerate_routes()
         return self.regexes[destination]
 
     def register_ignore(self, origins, destination):
@@ -279,42 +970,226 @@ class Router(object):
              'node_b': set(['node_d'])}
 
         '''
+        self.check_frozen()
+
         if not isinstance(origins, list):
             origins = [origins]
 
-        self.ignore_regexes.setdefault(destination, [re.compile(origin) for origin in origins])
-        self.regenerate_routes()
+        if destination not in self.ignore_regexes:
+            self.ignore_regexes[destination] = [re.compile(origin) for origin in origins]
+            self.ignore_index.add(destination, self.ignore_regexes[destination])
+            if self.manifest is None:
+                self.resolve_destination(destination)
 
         return self.ignore_regexes[destination]
 
     def regenerate_routes(self):
-        'regenerate the routes after a new route is added'
-        for destination, origins in self.regexes.items():
-            # we want only the names that match the destination regexes.
-            resolved = [
-                name for name in self.names
-                if name is not destination
-                and any(origin.search(name) for origin in origins)
-            ]
+        '''\
+        regenerate all the routes from scratch. Registration keeps the routes
+        up to date incrementally, so this is only needed if ``regexes``,
+        ``ignore_regexes`` or ``names`` are changed by hand.
+        '''
+        self.regex_index = PatternIndex(self.regexes)
+        self.ignore_index = PatternIndex(self.ignore_regexes)
+        self.name_index = NameIndex(self.names)
+
+        for name in self.names:
+            self.resolve_origin(name)
+
+    def resolve_destination(self, destination):
+        '''\
+        route every known name matching the regexes of ``destination`` to it
+
+        :param destination: destination to resolve routes for
+        :type destination: :py:class:`str`
+        '''
+        resolved = set()
+        for origin in self.regexes.get(destination, []):
+            resolved.update(self.name_index.search(origin))
+
+        resolved.discard(destination)
+        for name in resolved:
+            self.add_route(name, destination)
+
+    def resolve_origin(self, origin):
+        '''\
+        route a (newly registered) name to every destination subscribed to it
+
+        :param origin: name to resolve routes for
+        :type origin: :py:class:`str`
+        '''
+        destinations = self.regex_index.match(origin)
+        destinations.discard(origin)
+        if not destinations:
+            return
 
+        ignored = self.ignore_index.match(origin)
+        for destination in destinations:
+            self.add_route(origin, destination, destination in ignored)
+
+    def add_route(self, origin, destination, ignored=None):
+        '''\
+        add a single route from ``origin`` to ``destination``, unless
+        ``destination`` ignores ``origin``. In that case the route is removed
+        if it already exists.
+
+        :param origin: name of the origin node
+        :type origin: :py:class:`str`
+        :param destination: name of the destination node
+        :type destination: :py:class:`str`
+        :param ignored: whether ``destination`` ignores ``origin``. Looked up
+                        in ``ignore_regexes`` if not provided.
+        :type ignored: :py:class:`bool` or ``None``
+        '''
+        destinations = self.routes.setdefault(origin, set())
+
+        if ignored is None:
             ignores = self.ignore_regexes.get(destination, [])
-            for origin in resolved:
-                destinations = self.routes.setdefault(origin, set())
+            ignored = any(ignore.search(origin) for ignore in ignores)
 
-                if any(ignore.search(origin) for ignore in ignores):
-                    self.logger.info('ignoring route "%s" -> "%s"', origin, destination)
-                    try:
-                        destinations.remove(destination)
-                        self.logger.debug('removed "%s" -> "%s"', origin, destination)
-                    except KeyError:
-                        pass
+        if ignored:
+            self.logger.info('ignoring route "%s" -> "%s"', origin, destination)
+            if destination in destinations:
+                destinations.remove(destination)
+                self.logger.debug('removed "%s" -> "%s"', origin, destination)
 
-                    continue
+            return
+
+        if destination not in destinations:
+            self.logger.info('added route "%s" -> "%s"', origin, destination)
+
+        destinations.add(destination)
+
+    def freeze(self):
+        '''\
+        Compile the routes into a dispatch table and stop accepting new
+        registrations. Node modules are resolved now instead of before each
+        message, and routing becomes a lookup of pre-bound dispatch functions.
+
+        Call this once every node is registered (usually on worker startup.)
+
+        :returns: the dispatch table, which maps origin names to tuples of
+                  callables which each accept a message.
+        '''
+        self.resolve_node_modules()
+        self.configure_logging()
+
+        self.dispatch_table = dict(
+            (origin, tuple(
+                self.get_dispatcher(origin, destination)
+                for destination in sorted(destinations)
+            ))
+            for origin, destinations in self.routes.items()
+            if destinations
+        )
+        self.logger.info(
+            'froze routes for %d origins', len(self.dispatch_table)
+        )
+
+        return self.dispatch_table
+
+    def get_dispatcher(self, origin, destination):
+        '''\
+        Get a function which dispatches a message from ``origin`` to
+        ``destination``, for use in the dispatch table.
+
+        :param origin: name of the origin node
+        :type origin: :py:class:`str`
+        :param destination: name of the destination node
+        :type destination: :py:class:`str`
+        '''
+        if self.metrics is not None:
+            record_edge = partial(self.metrics.record_edge, origin, destination)
+
+            def dispatcher(message):
+                'record the edge, log and dispatch'
+                record_edge()
+                self.log_debug('routing "%s" -> "%s"', origin, destination)
+                return self.dispatch(origin, destination, message)
+
+            return dispatcher
+
+        if self.log_debug is noop:
+            return partial(self.dispatch, origin, destination)
 
-                if destination not in destinations:
-                    self.logger.info('added route "%s" -> "%s"', origin, destination)
+        def dispatcher(message):
+            'log and dispatch'
+            self.log_debug('routing "%s" -> "%s"', origin, destination)
+            return self.dispatch(origin, destination, message)
 
-                destinations.add(destination)
+        return dispatcher
+
+    def configure_logging(self):
+        '''\
+        Bind the hooks used to log each message: ``log_info`` and
+        ``log_debug``. Depending on ``log_messages`` (see
+        :py:meth:`Router.__init__`) these either log with bounded
+        representations of their arguments or do nothing at all.
+
+        This is called when initializing, registering nodes and freezing.
+        Call it again if ``log_messages`` is ``None`` and the logger's level
+        changes after that.
+        '''
+        if self.log_messages is None:
+            info = self.logger.isEnabledFor(logging.INFO)
+            debug = self.logger.isEnabledFor(logging.DEBUG)
+        else:
+            info = debug = self.log_messages
+
+        self.log_info = partial(self.log, logging.INFO) if info else noop
+        self.log_debug = partial(self.log, logging.DEBUG) if debug else noop
+
+    def log(self, level, msg, *args):
+        '''\
+        log a line about a message passing through the graph. Arguments other
+        than numbers are represented with :py:class:`emit.messages.Bounded`,
+        so large messages are abbreviated.
+
+        :param level: logging level
+        :type level: :py:class:`int`
+        :param msg: format string
+        :type msg: :py:class:`str`
+        '''
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, *[
+                arg if isinstance(arg, Number) else Bounded(arg)
+                for arg in args
+            ])
+
+    @property
+    def frozen(self):
+        'whether :py:meth:`Router.freeze` has been called'
+        return self.dispatch_table is not None
+
+    def check_frozen(self):
+        '''\
+        make sure the routes can still be changed
+
+        :raises: :py:exc:`RuntimeError` if the router has been frozen
+        '''
+        if self.dispatch_table is not None:
+            raise RuntimeError('Router is frozen and cannot register new routes')
+
+    def close(self):
+        '''\
+        send waiting batches (see :py:meth:`Router.flush`), then release
+        resources held by nodes, by calling ``close`` on every node
+        which has one (for example, :py:class:`emit.multilang.ShellNode`
+        stops its persistent processes.) Routers are also context managers
+        which close on exit.
+        '''
+        self.flush()
+
+        closers, self.closers = self.closers, []
+        for close in closers:
+            self.logger.debug('closing %r', close)
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def disable_routing(self):
         'disable routing (usually for testing purposes)'
@@ -333,6 +1208,16 @@ class Router(object):
         :param message: message to dispatch
         :type message: :py:class:`emit.message.Message` or subclass
         '''
+        if self.emissions is not None:
+            self.count_emission(origin)
+
+        if self.dispatch_table is not None:
+            if self.routing_enabled:
+                for dispatch in self.dispatch_table.get(origin, ()):
+                    dispatch(message)
+
+            return
+
         # side-effect: we have to know all the routes before we can route. But
         # we can't resolve them while the object is initializing, so we have to
         # do it just in time to route.
@@ -343,10 +1228,23 @@ class Router(object):
 
         subs = self.routes.get(origin, set())
 
+        if self.metrics is not None:
+            for destination in subs:
+                self.metrics.record_edge(origin, destination)
+
         for destination in subs:
-            self.logger.debug('routing "%s" -> "%s"', origin, destination)
+            self.log_debug('routing "%s" -> "%s"', origin, destination)
             self.dispatch(origin, destination, message)
 
+    def count_emission(self, origin):
+        '''\
+        count a message routed from ``origin`` while in :py:meth:`Router.feed`
+
+        :param origin: name of the origin node
+        :type origin: :py:class:`str`
+        '''
+        self.emissions[origin] += 1
+
     def dispatch(self, origin, destination, message):
         '''\
         dispatch a message to a named function
@@ -355,10 +1253,21 @@ class Router(object):
         :type destination: :py:class:`str`
         :param message: message to dispatch
         :type message: :py:class:`emit.message.Message` or subclass
+
+        Nodes created with :py:meth:`Router.wrap_as_node` are handed a message
+        directly. Anything else in ``functions`` is called with the message
+        as keyword arguments, and ``_origin`` set to the origin's name.
         '''
         func = self.functions[destination]
-        self.logger.debug('calling %r directly', func)
-        return func(_origin=origin, **message)
+        self.log_debug('calling %r directly', func)
+
+        process = self.processors.get(func)
+        if process is None:
+            return func(_origin=origin, **message)
+
+        bundle = dict(message)
+        bundle['_origin'] = origin
+        return process(self.message_class.adopt(bundle))
 
     def wrap_result(self, name, result):
         '''
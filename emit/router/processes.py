@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+import importlib
+import time
+from types import GeneratorType
+
+from emit.codecs import get_codec
+from emit.messages import NoResult
+
+from .threads import ThreadRouter
+
+# nodes found by ``find_node`` in a worker process, by module and name
+nodes = {}
+
+
+def initialize(node_modules, node_package):
+    '''\
+    prepare a worker process by importing the router's node modules (see
+    :py:meth:`emit.router.core.Router.resolve_node_modules`)
+    '''
+    for module in node_modules:
+        importlib.import_module(module, node_package)
+
+
+def find_node(module, name):
+    '''\
+    find the function behind a node in a worker process. Decorated nodes are
+    unwrapped, so calling the function doesn't route anything in the worker.
+
+    :param module: module the function is defined in
+    :type module: :py:class:`str`
+    :param name: name of the function in the module
+    :type name: :py:class:`str`
+    '''
+    try:
+        return nodes[module, name]
+    except KeyError:
+        pass
+
+    func = getattr(importlib.import_module(module), name)
+    while hasattr(func, '__wrapped__'):
+        func = func.__wrapped__
+
+    nodes[module, name] = func
+    return func
+
+
+def call_node(module, name, fields, message_class, codec, data):
+    '''\
+    call a node in a worker process
+
+    :param fields: the node's fields, to turn results into messages
+    :type fields: ordered iterable of :py:class:`str`
+    :param message_class: class to decode the message as
+    :type message_class: :py:class:`emit.messages.Message` or subclass
+    :param codec: codec the message is encoded with, and to encode results
+    :type codec: :py:class:`emit.codecs.Codec`
+    :param data: encoded message
+    :type data: :py:class:`bytes`
+
+    :returns: ``(many, data, seconds, dropped)``: whether the node yielded
+              its results, the results as an encoded list of messages, the
+              time spent in the node (including running a generator it
+              returns) and the number of ``NoResult`` values it returned
+    '''
+    message = message_class.decode(data, codec)
+
+    start = time.perf_counter()
+    result = find_node(module, name)(message)
+
+    many = isinstance(result, GeneratorType)
+    results = list(result) if many else [result]
+    seconds = time.perf_counter() - start
+
+    kept = [item for item in results if item is not NoResult]
+    encoded = codec.encode([
+        dict(zip(fields, item if isinstance(item, tuple) else (item,)))
+        for item in kept
+    ])
+
+    return many, encoded, seconds, len(results) - len(kept)
+
+
+class ProcessRouter(ThreadRouter):
+    '''\
+    Router which calls CPU-bound nodes in a pool of processes, and other
+    nodes in a pool of threads (see
+    :py:class:`emit.router.threads.ThreadRouter`.)
+    '''
+    def __init__(self, *args, **kwargs):
+        '''\
+        Route like :py:class:`emit.router.threads.ThreadRouter`, but call
+        nodes marked with the ``cpu_bound=True`` option in worker processes
+        from a :py:class:`concurrent.futures.ProcessPoolExecutor`.
+
+        :param processes: (keyword only) number of worker processes. Defaults
+                          to the number of CPUs.
+        :type processes: :py:class:`int` or ``None``
+
+        Workers import ``node_modules`` when they start, and find each node by
+        its module and name, so CPU-bound nodes must be module-level
+        functions. Messages are sent to workers and back with the router's
+        codec (JSON by default, see :py:func:`emit.codecs.get_codec`.) The
+        messages a node returns are routed from the parent process.
+
+        Other arguments are the same as
+        :py:meth:`emit.router.threads.ThreadRouter.__init__`.
+        '''
+        self.processes = kwargs.pop('processes', None)
+        super(ProcessRouter, self).__init__(*args, **kwargs)
+
+        # started on the first message to a CPU-bound node, so importing node
+        # modules in the workers doesn't start pools of their own
+        self.process_pool = None
+
+        self.logger.debug('Initialized Process Router')
+
+    def get_process_pool(self):
+        'get the pool of worker processes, starting it if needed'
+        with self.lock:
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor(
+                    self.processes, initializer=initialize,
+                    initargs=(self.node_modules, self.node_package),
+                )
+
+            return self.process_pool
+
+    def node(self, fields, *args, **kwargs):
+        '''\
+        Decorate a function to make it a node. See
+        :py:meth:`emit.router.core.Router.node`. A CPU-bound node runs its
+        generator to the end in the worker, so it can't ``stream``, and is
+        sent one message at a time, so it can't batch either.
+
+        :raises: :py:exc:`ValueError` if ``cpu_bound`` is combined with
+                 ``stream`` or ``batch_size``
+        '''
+        if kwargs.get('cpu_bound') and kwargs.get('stream'):
+            raise ValueError('cpu bound nodes cannot stream')
+
+        if kwargs.get('cpu_bound') and kwargs.get('batch_size') is not None:
+            raise ValueError('cpu bound nodes cannot batch')
+
+        return super(ProcessRouter, self).node(fields, *args, **kwargs)
+
+    def wrap_node(self, node, options):
+        '''\
+        make nodes with ``cpu_bound=True`` call their function in a worker
+        process. Results of cached nodes are kept in this process, and
+        repeated messages to nodes with ``dedupe`` are dropped here, so
+        neither is sent to a worker at all. See :py:meth:`emit.router.threads.ThreadRouter.wrap_node`
+        for other options.
+        '''
+        node = super(ProcessRouter, self).wrap_node(node, options)
+        if not options.get('cpu_bound'):
+            return node
+
+        name = self.get_name(node)
+        func = node
+        while hasattr(func, '__wrapped__'):
+            func = func.__wrapped__
+
+        def process(message):
+            'call the node in a worker process and route the results'
+            self.log_info('calling "%s" in a worker with %r', name, message)
+            codec = get_codec(self.codec)
+            future = self.get_process_pool().submit(
+                call_node, func.__module__, func.__name__, self.fields[name],
+                self.message_class, codec, message.encode(codec)
+            )
+            many, data, seconds, dropped = future.result()
+
+            results = codec.decode(data)
+            if self.metrics is not None:
+                self.metrics.record_call(name, seconds, len(results), dropped)
+
+            for result in results:
+                self.route(name, result)
+
+            if many:
+                return tuple(results)
+
+            return results[0] if results else NoResult
+
+        # the options applied around the in-process call are lost with it, so
+        # apply them around the worker call instead
+        cache = self.caches.get(name)
+        if cache is not None:
+            process = self.wrap_as_cached(name, process, cache)
+
+        deduper = self.dedupers.get(name)
+        if deduper is not None:
+            process = self.wrap_as_deduplicated(name, process, deduper)
+
+        @wraps(node)
+        def wrapped(*args, **kwargs):
+            'wrapped version of func, calling it in a worker process'
+            return process(self.get_message_from_call(*args, **kwargs))
+
+        self.processors.pop(node, None)
+        self.processors[wrapped] = process
+        return wrapped
+
+    def close(self):
+        '''\
+        close nodes and the thread pool (see
+        :py:meth:`emit.router.threads.ThreadRouter.close`), then shut down
+        the worker processes
+        '''
+        super(ProcessRouter, self).close()
+
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
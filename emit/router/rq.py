@@ -1,4 +1,8 @@
 from __future__ import absolute_import
+from contextlib import contextmanager
+from functools import wraps
+import threading
+
 from rq import Queue
 from rq.decorators import job
 
@@ -17,13 +21,124 @@ class RQRouter(Router):
         '''
         super(RQRouter, self).__init__(*args, **kwargs)
         self.redis_connection = redis_connection
+        self.job_options = {}
+
+        # dispatches collected while in ``batch``, per thread (or greenlet,
+        # when gevent or eventlet patch ``threading``)
+        self.local = threading.local()
+
         self.logger.debug('Initialized RQ Router')
 
+    @property
+    def pending(self):
+        'dispatches collected by the current thread\'s batch, or ``None``'
+        return getattr(self.local, 'pending', None)
+
+    @pending.setter
+    def pending(self, value):
+        self.local.pending = value
+
+    def __call__(self, **kwargs):
+        'route a message to all entry points, enqueueing them together'
+        with self.batch():
+            super(RQRouter, self).__call__(**kwargs)
+
+    def feed(self, messages):
+        '''\
+        route a number of messages to all entry points, enqueueing them
+        together. See :py:meth:`Router.feed`.
+        '''
+        with self.batch():
+            return super(RQRouter, self).feed(messages)
+
     def dispatch(self, origin, destination, message):
-        'dispatch through RQ'
+        '''\
+        dispatch through RQ. Inside :py:meth:`RQRouter.batch` the job is
+        collected to be enqueued when the batch ends. Messages to batching
+        nodes (see ``batch_size`` in :py:meth:`Router.node`) are added to the
+        node's batch instead, which is enqueued as one job.
+        '''
+        kwargs = dict(message)
+        kwargs['_origin'] = origin
+
+        batcher = self.batchers.get(destination)
+        if batcher is not None:
+            return batcher.add(kwargs)
+
+        if self.pending is not None:
+            self.pending.append((destination, kwargs))
+            return None
+
         func = self.functions[destination]
-        self.logger.debug('enqueueing %r', func)
-        return func.delay(_origin=origin, **message)
+        self.log_debug('enqueueing %r', func)
+        return func.delay(**kwargs)
+
+    @contextmanager
+    def batch(self):
+        '''\
+        collect the jobs dispatched inside this context and enqueue them all
+        at the end, with one redis pipeline per connection. Every node runs
+        inside a batch, so a node which yields many messages enqueues them in
+        one round-trip. If the context raises, nothing is enqueued.
+        '''
+        if self.pending is not None:  # already collecting
+            yield
+            return
+
+        self.pending = []
+        try:
+            yield
+            pending = self.pending
+        finally:
+            self.pending = None
+
+        self.enqueue_many(pending)
+
+    def enqueue_many(self, dispatches):
+        '''\
+        enqueue a number of jobs, pipelining the ones which share a redis
+        connection. Falls back to enqueueing one at a time on versions of RQ
+        without ``Queue.enqueue_many``, or for functions which weren't created
+        with :py:meth:`RQRouter.wrap_node`.
+
+        :param dispatches: jobs to enqueue
+        :type dispatches: iterable of ``(destination, kwargs)`` tuples
+        '''
+        pipelines = {}
+        for destination, kwargs in dispatches:
+            func = self.functions[destination]
+            options = self.job_options.get(destination)
+            if options is None or not hasattr(Queue, 'enqueue_many'):
+                self.log_debug('enqueueing %r', func)
+                func.delay(**kwargs)
+                continue
+
+            queue = options['queue']
+            if not isinstance(queue, Queue):
+                queue = Queue(queue, connection=options['connection'])
+
+            jobs = pipelines.setdefault(id(queue.connection), (queue.connection, {}))[1]
+            jobs.setdefault(queue.name, (queue, []))[1].append(queue.prepare_data(
+                func, kwargs=kwargs,
+                timeout=options['timeout'], result_ttl=options['result_ttl'],
+            ))
+
+        for connection, queues in pipelines.values():
+            with connection.pipeline() as pipe:
+                for queue, jobs in queues.values():
+                    self.log_debug('enqueueing %d jobs on %r', len(jobs), queue)
+                    queue.enqueue_many(jobs, pipeline=pipe)
+
+                pipe.execute()
+
+    def send_batch(self, name, messages):
+        '''\
+        send a batch of messages to a batching node as a single job, which
+        calls the node with the whole list
+        '''
+        func = self.functions[name]
+        self.log_debug('enqueueing batch of %d messages to %r', len(messages), func)
+        return func.delay(messages)
 
     def wrap_node(self, node, options):
         '''
@@ -36,5 +151,17 @@ class RQRouter(Router):
             'timeout': options.get('timeout', None),
             'result_ttl': options.get('result_ttl', 500),
         }
+        self.job_options[self.get_name(node)] = job_kwargs
+
+        @wraps(node)
+        def batched(*args, **kwargs):
+            'run the node, enqueueing everything it dispatches together'
+            with self.batch():
+                result = node(*args, **kwargs)
+
+                # the worker may exit after this job, so don't leave
+                # messages waiting in batches
+                self.flush()
+                return result
 
-        return job(**job_kwargs)(node)
+        return job(**job_kwargs)(batched)
@@ -0,0 +1,193 @@
+from __future__ import absolute_import
+from collections import Counter, deque
+import heapq
+from itertools import count
+
+from .core import Router
+
+ORDERS = ('fifo', 'priority')
+WHEN_FULL = ('block', 'drop', 'reject')
+
+
+class ScheduledRouter(Router):
+    '''\
+    Router which routes from a work queue instead of recursively.
+
+    :py:class:`emit.router.core.Router` calls each subscriber as soon as a
+    message is routed to it, so every level of the graph adds to the stack.
+    This router queues the message instead, and the outermost call runs queued
+    messages one at a time until the queue is empty. Deep graphs don't grow
+    the stack, and the queue's size can be limited.
+    '''
+    def __init__(self, *args, **kwargs):
+        '''\
+        Route through a work queue.
+
+        :param order: (keyword only) ``'fifo'`` (the default) runs messages
+                      in the order they were routed, so the graph is
+                      processed breadth-first. ``'priority'`` runs messages
+                      to nodes with a higher ``priority`` option first (the
+                      default priority is 0), and in order within a priority.
+        :type order: :py:class:`str`
+        :param max_queued: (keyword only) most messages to hold in the queue,
+                           or ``None`` (the default) for no limit.
+        :type max_queued: :py:class:`int` or ``None``
+        :param when_full: (keyword only) what to do with a message when the
+                          queue is full. ``'block'`` (the default) runs
+                          queued messages until there's room. While a node
+                          is running, a message it routes to a full queue is
+                          run straight away instead, as
+                          :py:class:`emit.router.core.Router` would, so the
+                          stack grows with the depth of the graph below it
+                          until the queue has room again. ``'drop'`` logs
+                          the message and drops it, counting it in
+                          ``dropped``. ``'reject'`` raises
+                          :py:exc:`RuntimeError`.
+        :type when_full: :py:class:`str`
+
+        Other arguments are the same as :py:meth:`Router.__init__`.
+
+        :raises: :py:exc:`ValueError` for an unknown ``order`` or
+                 ``when_full``
+        '''
+        self.order = kwargs.pop('order', 'fifo')
+        self.max_queued = kwargs.pop('max_queued', None)
+        self.when_full = kwargs.pop('when_full', 'block')
+        super(ScheduledRouter, self).__init__(*args, **kwargs)
+
+        if self.order not in ORDERS:
+            raise ValueError('order must be one of %s' % ', '.join(ORDERS))
+
+        if self.when_full not in WHEN_FULL:
+            raise ValueError('when_full must be one of %s' % ', '.join(WHEN_FULL))
+
+        self.queue = deque() if self.order == 'fifo' else []
+        self.sequence = count()
+        self.dropped = Counter()
+        self.priorities = {}
+        self.draining = False
+
+        self.logger.debug('Initialized Scheduled Router')
+
+    def dispatch(self, origin, destination, message):
+        '''\
+        queue a message for ``destination``. If nothing is running the
+        queue, run it until it's empty.
+
+        :raises: :py:exc:`RuntimeError` if the queue is full and
+                 ``when_full`` is ``'reject'``
+        '''
+        if self.full():
+            if self.when_full == 'reject':
+                self.logger.error(
+                    'queue is full, rejecting message to "%s"', destination
+                )
+                raise RuntimeError(
+                    'queue is full (%d messages)' % self.max_queued
+                )
+
+            if self.when_full == 'drop':
+                self.logger.warning(
+                    'queue is full, dropping message to "%s"', destination
+                )
+                self.dropped[destination] += 1
+                return
+
+            if self.draining:
+                # the node routing this message can't wait for room while the
+                # queue is drained underneath it, so run the message now
+                self.log_debug('queue is full, running "%s" now', destination)
+                return super(ScheduledRouter, self).dispatch(
+                    origin, destination, message
+                )
+
+            self.log_debug('queue is full, running queued messages')
+            self.drain(until_room=True)
+
+        self.push(origin, destination, message)
+
+        if not self.draining:
+            self.drain()
+
+    def full(self):
+        'whether the queue holds ``max_queued`` messages'
+        return self.max_queued is not None and len(self.queue) >= self.max_queued
+
+    def push(self, origin, destination, message):
+        'add a message to the queue'
+        if self.order == 'fifo':
+            self.queue.append((origin, destination, message))
+            return
+
+        heapq.heappush(self.queue, (
+            -self.priorities.get(destination, 0), next(self.sequence),
+            origin, destination, message
+        ))
+
+    def pop(self):
+        '''\
+        take the next message from the queue
+
+        :returns: ``(origin, destination, message)``
+        '''
+        if self.order == 'fifo':
+            return self.queue.popleft()
+
+        return heapq.heappop(self.queue)[2:]
+
+    def run_next(self):
+        'call the node for the next message in the queue'
+        origin, destination, message = self.pop()
+        self.log_debug('running "%s" -> "%s"', origin, destination)
+        return super(ScheduledRouter, self).dispatch(origin, destination, message)
+
+    def drain(self, until_room=False):
+        '''\
+        run queued messages until the queue is empty. If a node raises, the
+        rest of the queue is dropped and the exception is raised.
+
+        :param until_room: stop as soon as the queue isn't full
+        :type until_room: :py:class:`bool`
+        '''
+        self.draining = True
+        try:
+            while self.queue:
+                if until_room and not self.full():
+                    break
+
+                self.run_next()
+        except Exception:
+            self.logger.error(
+                'dropping %d queued messages after an error', len(self.queue)
+            )
+            self.queue.clear()
+            raise
+        finally:
+            self.draining = False
+
+    def wrap_as_node(self, func, stream=False, batch_size=None,
+                     batch_timeout=None, cache=None, dedupe=None):
+        '''\
+        wrap a function as a node. See :py:meth:`Router.wrap_as_node`.
+
+        :raises: :py:exc:`ValueError` if ``batch_timeout`` is given. A timed
+                 out batch is sent from a timer thread, which would run the
+                 queue alongside the thread already running it. Call
+                 :py:meth:`Router.flush` instead.
+        '''
+        if batch_timeout is not None:
+            raise ValueError('ScheduledRouter does not support batch_timeout')
+
+        return super(ScheduledRouter, self).wrap_as_node(
+            func, stream=stream, batch_size=batch_size, cache=cache,
+            dedupe=dedupe,
+        )
+
+    def wrap_node(self, node, options):
+        '''\
+        record the node's ``priority`` option, if given
+        '''
+        if 'priority' in options:
+            self.priorities[self.get_name(node)] = options['priority']
+
+        return node
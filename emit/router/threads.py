@@ -0,0 +1,270 @@
+from __future__ import absolute_import
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import time
+
+from .core import Router
+
+
+class Call(object):
+    '''\
+    the work started by one call to a :py:class:`ThreadRouter`: how many
+    dispatches are still running, and the exceptions raised by the ones which
+    have finished.
+    '''
+    def __init__(self, collect=True):
+        '''\
+        :param collect: whether to keep the exceptions raised by dispatches.
+                        Calls which are never waited on should pass ``False``
+                        so exceptions don't pile up.
+        :type collect: :py:class:`bool`
+        '''
+        self.pending = 0
+        self.collect = collect
+        self.exceptions = []
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        'whether every dispatch has finished'
+        return self.pending == 0
+
+    def add(self):
+        'count a dispatch as started'
+        with self.condition:
+            self.pending += 1
+
+    def finish(self, exception=None):
+        '''\
+        count a dispatch as finished
+
+        :param exception: exception raised by the dispatch, if any
+        :type exception: :py:class:`Exception` or ``None``
+        '''
+        with self.condition:
+            self.pending -= 1
+            if exception is not None and self.collect:
+                self.exceptions.append(exception)
+
+            if self.pending == 0:
+                self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        '''\
+        wait for every dispatch (including the ones they start, and so on
+        through the graph) to finish
+
+        :param timeout: most seconds to wait, or ``None`` to wait until done
+        :type timeout: :py:class:`float` or ``None``
+
+        :returns: :py:class:`list` of exceptions raised by dispatches so far
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while self.pending:
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                self.condition.wait(remaining)
+
+        return list(self.exceptions)
+
+
+class ThreadRouter(Router):
+    'Router which calls nodes in a pool of threads'
+    def __init__(self, *args, **kwargs):
+        '''\
+        Route by calling each node in a thread from a
+        :py:class:`concurrent.futures.ThreadPoolExecutor`, so nodes which block
+        on the network don't hold up the rest of the graph.
+
+        :param max_workers: (keyword only) size of the thread pool. Defaults
+                            to the executor's default.
+        :type max_workers: :py:class:`int` or ``None``
+        :param wait: (keyword only) whether calling the router waits for the
+                     whole graph below the entry points to finish. Defaults to
+                     ``True``.
+        :type wait: :py:class:`bool`
+
+        Other arguments are the same as :py:meth:`Router.__init__`. Nodes take
+        one more option, ``max_concurrency``: the most calls of that node
+        which may run at once. Further messages to the node wait in a queue
+        without taking up a thread.
+        '''
+        self.max_workers = kwargs.pop('max_workers', None)
+        self.wait = kwargs.pop('wait', True)
+        super(ThreadRouter, self).__init__(*args, **kwargs)
+
+        self.executor = ThreadPoolExecutor(self.max_workers)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # dispatches made outside of ``tracking``. Nothing collects their
+        # exceptions, so they are only logged.
+        self.untracked = Call(collect=False)
+
+        # per-node concurrency: limit, running count and waiting dispatches
+        self.limits = {}
+        self.running = Counter()
+        self.waiting = {}
+
+        self.logger.debug('Initialized Thread Router')
+
+    def __call__(self, **kwargs):
+        '''\
+        Route a message to all nodes marked as entry points.
+
+        :returns: the :py:class:`Call` tracking the dispatches. If ``wait``
+                  is set (the default) it is already done, and its
+                  ``exceptions`` holds any exceptions raised in the graph.
+        '''
+        with self.tracking() as call:
+            super(ThreadRouter, self).__call__(**kwargs)
+
+        if self.wait:
+            call.wait()
+
+        return call
+
+    def feed(self, messages):
+        '''\
+        Route a number of messages to all nodes marked as entry points, and
+        wait for the graph to finish with them, flushing batching nodes. See
+        :py:meth:`Router.feed`.
+
+        :returns: as :py:meth:`Router.feed`, plus the ``exceptions`` raised
+                  in the graph.
+        '''
+        dispatchers = self.entry_dispatchers()
+        self.log_info('feeding messages to %d entry points', len(dispatchers))
+
+        previous, self.emissions = self.emissions, Counter()
+        count = 0
+        try:
+            with self.tracking() as call:
+                for message in messages:
+                    count += 1
+                    for dispatch in dispatchers:
+                        dispatch(message)
+
+                # batching nodes only send full batches on their own, so
+                # flush them once the rest of the graph is done, and wait for
+                # the work that starts in turn
+                call.wait()
+                while any(len(batcher) for batcher in list(self.batchers.values())):
+                    self.flush()
+                    call.wait()
+
+            exceptions = call.wait()
+            emitted = dict(self.emissions)
+        finally:
+            self.emissions = previous
+
+        self.log_info('fed %d messages', count)
+        return {'messages': count, 'emitted': emitted, 'exceptions': exceptions}
+
+    @contextmanager
+    def tracking(self):
+        '''\
+        track the dispatches made inside this context, and the ones they
+        make in turn, with a new :py:class:`Call`. Use this to wait for the
+        graph below a node called directly:
+
+        .. code-block:: python
+
+            with router.tracking() as call:
+                node(x=1)
+
+            call.wait()
+        '''
+        call = Call()
+        previous = getattr(self.local, 'call', None)
+        self.local.call = call
+        try:
+            yield call
+        finally:
+            self.local.call = previous
+
+    def count_emission(self, origin):
+        'count an emission, safely between threads'
+        with self.lock:
+            self.emissions[origin] += 1
+
+    def dispatch(self, origin, destination, message):
+        '''\
+        submit a message to the thread pool. If ``destination`` is already
+        running its ``max_concurrency`` calls, the message waits until one
+        finishes.
+        '''
+        call = getattr(self.local, 'call', None) or self.untracked
+        call.add()
+
+        with self.lock:
+            limit = self.limits.get(destination)
+            if limit is not None and self.running[destination] >= limit:
+                self.log_debug('"%s" is busy, queueing message', destination)
+                self.waiting.setdefault(destination, deque()).append(
+                    (call, origin, message)
+                )
+                return None
+
+            self.running[destination] += 1
+
+        return self.executor.submit(self.run, call, origin, destination, message)
+
+    def run(self, call, origin, destination, message):
+        '''\
+        call a node in a worker thread, then start the next message waiting
+        for the node, if any. Exceptions are logged and collected on
+        ``call`` (unless it doesn't collect them.)
+        '''
+        self.local.call = call
+        exception = None
+        try:
+            super(ThreadRouter, self).dispatch(origin, destination, message)
+        except Exception as err:
+            self.logger.exception('error dispatching to "%s"', destination)
+            exception = err
+        finally:
+            self.local.call = None
+
+            with self.lock:
+                waiting = self.waiting.get(destination)
+                if waiting:
+                    following = waiting.popleft()
+                else:
+                    following = None
+                    self.running[destination] -= 1
+
+            if following is not None:
+                next_call, next_origin, next_message = following
+                self.executor.submit(
+                    self.run, next_call, next_origin, destination, next_message
+                )
+
+            call.finish(exception)
+
+    def wrap_node(self, node, options):
+        '''\
+        record the node's ``max_concurrency`` option, if given
+        '''
+        limit = options.get('max_concurrency')
+        if limit is not None:
+            self.limits[self.get_name(node)] = limit
+
+        return node
+
+    def close(self):
+        '''\
+        close nodes (see :py:meth:`Router.close`), then wait for running
+        dispatches and shut down the thread pool
+        '''
+        super(ThreadRouter, self).close()
+        self.executor.shutdown(wait=True)
@@ -2,7 +2,19 @@
 import sys
 import json
 
-message = json.loads(sys.stdin.read())
 
-for i in range(message['count']):
-    sys.stdout.write(json.dumps(i) + '\n')
+def respond(message, prefix=''):
+    for i in range(message['count']):
+        sys.stdout.write(prefix + json.dumps(i) + '\n')
+
+
+if '--persistent' in sys.argv:
+    # one request per line: an ID, a space and a message. Each line of output
+    # starts with the request's ID, and a line with only the ID ends it.
+    for line in iter(sys.stdin.readline, ''):
+        request_id, _, message = line.partition(' ')
+        respond(json.loads(message), request_id + ' ')
+        sys.stdout.write(request_id + '\n')
+        sys.stdout.flush()
+else:
+    respond(json.loads(sys.stdin.read()))
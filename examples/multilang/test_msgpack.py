@@ -0,0 +1,42 @@
+'test for multilang, using the msgpack codec'
+import struct
+import sys
+
+import msgpack
+
+LENGTH = struct.Struct('>I')
+REQUEST_ID = struct.Struct('>Q')
+
+stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+
+
+def read_frame():
+    'read a frame: its length as four bytes, then its contents'
+    header = stdin.read(LENGTH.size)
+    if len(header) < LENGTH.size:
+        return None
+
+    return stdin.read(LENGTH.unpack(header)[0])
+
+
+def write_frame(data):
+    stdout.write(LENGTH.pack(len(data)) + data)
+
+
+def respond(message, prefix=b''):
+    for i in range(message['count']):
+        write_frame(prefix + msgpack.packb(i))
+
+
+if '--persistent' in sys.argv:
+    # each frame holds a request ID as eight bytes, then a message. Each frame
+    # of output starts with the request's ID, and a frame with only the ID
+    # ends it.
+    for frame in iter(read_frame, None):
+        request_id = frame[:REQUEST_ID.size]
+        respond(msgpack.unpackb(frame[REQUEST_ID.size:], raw=False), request_id)
+        write_frame(request_id)
+        stdout.flush()
+else:
+    respond(msgpack.unpackb(read_frame(), raw=False))
@@ -15,11 +15,14 @@ setup(
     name='emit',
     version=emit.__version__,
     packages=find_packages(exclude=('test',)),
-    scripts=['emit/bin/emit_digraph'],
+    scripts=['emit/bin/emit_digraph', 'emit/bin/emit_manifest'],
     zip_safe=True,
-    extras_require = {
+    python_requires='>=3.6',
+    extras_require={
         'celery-routing': ['celery>=3.0.13'],
         'rq-routing': ['rq>=0.3.4', 'redis>=2.7.2'],
+        'msgpack': ['msgpack'],
+        'orjson': ['orjson'],
     },
 
     # Human information
@@ -35,10 +38,14 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy',
         'Topic :: Software Development :: Libraries :: Python Modules',
@@ -0,0 +1,41 @@
+'tests for emit/batching.py'
+import threading
+from unittest import TestCase
+
+from emit.batching import Batcher
+
+
+class BatcherTests(TestCase):
+    'tests for Batcher'
+    def setUp(self):
+        self.sent = []
+        self.batcher = Batcher(3, None, self.sent.append)
+
+    def test_full(self):
+        'full batches are sent'
+        for i in range(7):
+            self.batcher.add(i)
+
+        self.assertEqual([[0, 1, 2], [3, 4, 5]], self.sent)
+        self.assertEqual(1, len(self.batcher))
+
+    def test_flush(self):
+        'flush sends what has been collected'
+        self.batcher.add(1)
+        self.batcher.flush()
+        self.batcher.flush()
+
+        self.assertEqual([[1]], self.sent)
+
+    def test_timeout(self):
+        'partial batches are sent after the timeout'
+        sent = threading.Event()
+        batcher = Batcher(3, 0.01, lambda items: sent.set())
+
+        batcher.add(1)
+        self.assertTrue(sent.wait(5))
+        self.assertEqual(None, batcher.timer)
+
+    def test_size(self):
+        'batches must hold at least one item'
+        self.assertRaises(ValueError, Batcher, 0, None, self.sent.append)
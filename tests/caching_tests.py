@@ -0,0 +1,128 @@
+'tests for emit/caching.py'
+from unittest import TestCase
+
+import mock
+
+from emit.caching import Cache, get_cache, message_key
+from emit.messages import Message
+
+
+class MessageKeyTests(TestCase):
+    'tests for message_key'
+    def test_equal_messages(self):
+        'equal messages have equal keys, whatever their order'
+        self.assertEqual(
+            message_key(Message([('a', 1), ('b', [1, 2])])),
+            message_key(Message([('b', [1, 2]), ('a', 1)])),
+        )
+
+    def test_different_messages(self):
+        'different messages have different keys'
+        self.assertNotEqual(
+            message_key(Message(a=1)), message_key(Message(a=2))
+        )
+
+    def test_ignores_origin(self):
+        'the origin is not part of the key'
+        self.assertEqual(
+            message_key(Message(a=1, _origin='x')),
+            message_key(Message(a=1, _origin='y')),
+        )
+
+    def test_unrepresentable(self):
+        'messages JSON can\'t represent have no key'
+        self.assertRaises(TypeError, message_key, Message(a={(1, 2): 'b'}))
+        self.assertRaises(TypeError, message_key, Message(a={1: 'b', 'c': 'd'}))
+        self.assertRaises(TypeError, message_key, Message(a=object()))
+
+    def test_origin_kept(self):
+        'the message itself still has its origin'
+        message = Message(a=1, _origin='x')
+        message_key(message)
+        self.assertEqual('x', message._origin)
+
+
+class CacheTests(TestCase):
+    'tests for Cache'
+    def test_get_set(self):
+        'values are found after being set'
+        cache = Cache()
+        self.assertEqual((False, None), cache.get('a'))
+
+        cache.set('a', 1)
+        self.assertEqual((True, 1), cache.get('a'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_lru(self):
+        'the least recently used entry is evicted'
+        cache = Cache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual((True, 1), cache.get('a'))
+        self.assertEqual((False, None), cache.get('b'))
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(2, len(cache))
+
+    @mock.patch('emit.caching.time')
+    def test_ttl(self, fake_time):
+        'entries older than ttl are expired'
+        fake_time.monotonic.return_value = 100
+        cache = Cache(ttl=10)
+        cache.set('a', 1)
+
+        fake_time.monotonic.return_value = 105
+        self.assertEqual((True, 1), cache.get('a'))
+
+        fake_time.monotonic.return_value = 111
+        self.assertEqual((False, None), cache.get('a'))
+        self.assertEqual(1, cache.expirations)
+        self.assertEqual(0, len(cache))
+
+    def test_stats(self):
+        'stats reports counters and hit rate'
+        cache = Cache()
+        self.assertEqual(None, cache.stats()['hit_rate'])
+
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(
+            {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0,
+             'entries': 1, 'hit_rate': 0.5},
+            cache.stats()
+        )
+
+    def test_clear(self):
+        'clear removes entries'
+        cache = Cache()
+        cache.set('a', 1)
+        cache.clear()
+        self.assertEqual((False, None), cache.get('a'))
+
+    def test_bad_size(self):
+        'size must be positive'
+        self.assertRaises(ValueError, Cache, 0)
+
+
+class GetCacheTests(TestCase):
+    'tests for get_cache'
+    def test_true(self):
+        'True makes a default cache'
+        self.assertEqual(1024, get_cache(True).size)
+
+    def test_size(self):
+        'an int makes a cache of that size'
+        self.assertEqual(10, get_cache(10).size)
+
+    def test_instance(self):
+        'a cache is used as-is'
+        cache = Cache()
+        self.assertIs(cache, get_cache(cache))
+
+    def test_other(self):
+        'anything else is an error'
+        self.assertRaises(TypeError, get_cache, 'yes')
+        self.assertRaises(TypeError, get_cache, False)
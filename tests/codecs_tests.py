@@ -0,0 +1,119 @@
+'tests for emit/codecs.py'
+from io import BytesIO
+from unittest import TestCase
+
+from .utils import skipIf
+
+from emit import codecs
+from emit.codecs import (
+    get_codec, Codec, JSONCodec, MsgpackCodec, OrjsonCodec
+)
+
+MESSAGE = {'text': u'caf\xe9', 'count': 3, 'tags': ['a', 'b'], 'n': None}
+
+
+class CodecRoundTrips(object):
+    'tests for every codec. Mixed in with a ``codec`` attribute'
+    def test_round_trip(self):
+        'decode reverses encode'
+        encoded = self.codec.encode(MESSAGE)
+        self.assertTrue(isinstance(encoded, bytes))
+        self.assertEqual(MESSAGE, self.codec.decode(encoded))
+
+    def test_frames(self):
+        'frames are read back in order, then None'
+        stream = BytesIO()
+        for obj in (MESSAGE, 1, []):
+            self.codec.write_frame(stream, self.codec.encode(obj))
+
+        stream.seek(0)
+        self.assertEqual(
+            [MESSAGE, 1, []],
+            [self.codec.decode(self.codec.read_frame(stream)) for _ in range(3)]
+        )
+        self.assertEqual(None, self.codec.read_frame(stream))
+
+    def test_tag(self):
+        'untag reverses tag'
+        data = self.codec.encode(MESSAGE)
+        self.assertEqual((5, data), self.codec.untag(self.codec.tag(5, data)))
+        self.assertEqual((5, None), self.codec.untag(self.codec.tag(5)))
+
+
+class JSONCodecTests(CodecRoundTrips, TestCase):
+    'tests for JSONCodec'
+    codec = JSONCodec()
+
+    def test_lines(self):
+        'frames are lines'
+        stream = BytesIO()
+        self.codec.write_frame(stream, b'1')
+        self.assertEqual(b'1\n', stream.getvalue())
+
+    def test_untagged(self):
+        'frames without an ID raise ValueError'
+        self.assertRaises(ValueError, self.codec.untag, b'{"x": 1}')
+
+    def test_decode_str(self):
+        'text is decoded as well as bytes'
+        self.assertEqual([1], self.codec.decode('[1]'))
+
+
+@skipIf(codecs.orjson is None, 'orjson is not installed')
+class OrjsonCodecTests(CodecRoundTrips, TestCase):
+    'tests for OrjsonCodec'
+    def setUp(self):
+        self.codec = OrjsonCodec()
+
+
+@skipIf(codecs.msgpack is None, 'msgpack is not installed')
+class MsgpackCodecTests(CodecRoundTrips, TestCase):
+    'tests for MsgpackCodec'
+    def setUp(self):
+        self.codec = MsgpackCodec()
+
+    def test_length_prefixed(self):
+        'frames start with their length'
+        stream = BytesIO()
+        self.codec.write_frame(stream, b'\n\n\n')
+        self.assertEqual(b'\x00\x00\x00\x03\n\n\n', stream.getvalue())
+
+    def test_truncated(self):
+        'a frame cut short reads as the end of the stream'
+        self.assertEqual(None, self.codec.read_frame(BytesIO(b'\x00\x00\x00\x03\n')))
+
+    def test_untagged(self):
+        'frames too short for an ID raise ValueError'
+        self.assertRaises(ValueError, self.codec.untag, b'\x01')
+
+
+class GetCodecTests(TestCase):
+    'tests for get_codec'
+    def test_default(self):
+        'JSON is the default'
+        self.assertTrue(isinstance(get_codec(), JSONCodec))
+
+    def test_name(self):
+        'codecs are found by name, and reused'
+        self.assertTrue(get_codec('json') is get_codec(None))
+
+    def test_instance(self):
+        'codecs are returned as-is'
+        codec = JSONCodec()
+        self.assertTrue(get_codec(codec) is codec)
+
+    def test_unknown(self):
+        'unknown names raise ValueError'
+        self.assertRaises(ValueError, get_codec, 'xml')
+
+    def test_not_installed(self):
+        'codecs whose library is missing raise ImportError'
+        original, codecs.msgpack = codecs.msgpack, None
+        try:
+            self.assertRaises(ImportError, MsgpackCodec)
+        finally:
+            codecs.msgpack = original
+
+    def test_abstract(self):
+        'Codec leaves encoding to subclasses'
+        self.assertRaises(NotImplementedError, Codec().encode, 1)
@@ -0,0 +1,175 @@
+'tests for emit/dedupe.py'
+from unittest import TestCase
+
+import mock
+
+from emit.dedupe import (
+    BloomFilter, Deduper, ExactFilter, fields_key, get_deduper
+)
+from emit.messages import Message
+
+
+class FieldsKeyTests(TestCase):
+    'tests for fields_key'
+    def test_chosen_fields(self):
+        'only the chosen fields make up the key'
+        key = fields_key(['id'])
+        self.assertEqual(
+            key(Message(id=1, text='a')), key(Message(id=1, text='b'))
+        )
+        self.assertNotEqual(key(Message(id=1)), key(Message(id=2)))
+
+    def test_missing_field(self):
+        'missing fields count as None'
+        key = fields_key(['id'])
+        self.assertEqual(key(Message(x=1)), key(Message(id=None)))
+
+    def test_unrepresentable(self):
+        'fields JSON can\'t represent have no key'
+        key = fields_key(['id'])
+        self.assertRaises(TypeError, key, Message(id={(1, 2): 'a'}))
+        self.assertRaises(TypeError, key, Message(id={1: 'a', 'b': 'c'}))
+        self.assertRaises(TypeError, key, Message(id=object()))
+
+
+class ExactFilterTests(TestCase):
+    'tests for ExactFilter'
+    def test_add(self):
+        'keys are remembered'
+        remembered = ExactFilter()
+        self.assertFalse(remembered.add(b'a'))
+        self.assertTrue(remembered.add(b'a'))
+        self.assertFalse(remembered.add(b'b'))
+
+    def test_size(self):
+        'the oldest keys are forgotten first'
+        remembered = ExactFilter(2)
+        for key in (b'a', b'b', b'c'):
+            remembered.add(key)
+
+        self.assertEqual(2, len(remembered))
+        self.assertFalse(remembered.add(b'a'))
+        self.assertTrue(remembered.add(b'c'))
+
+    @mock.patch('emit.dedupe.time')
+    def test_window(self, fake_time):
+        'keys older than window are forgotten'
+        fake_time.monotonic.return_value = 100
+        remembered = ExactFilter(window=10)
+        remembered.add(b'a')
+
+        fake_time.monotonic.return_value = 109
+        self.assertTrue(remembered.add(b'a'))
+
+        fake_time.monotonic.return_value = 111
+        self.assertFalse(remembered.add(b'a'))
+
+    def test_bad_size(self):
+        'size must be positive'
+        self.assertRaises(ValueError, ExactFilter, 0)
+
+
+class BloomFilterTests(TestCase):
+    'tests for BloomFilter'
+    def test_add(self):
+        'keys are remembered'
+        remembered = BloomFilter(100)
+        self.assertFalse(remembered.add(b'a'))
+        self.assertTrue(remembered.add(b'a'))
+
+    def test_sizing(self):
+        'bits and hashes follow from size and error rate'
+        remembered = BloomFilter(1000, error_rate=0.01)
+        self.assertEqual(9586, remembered.bits)
+        self.assertEqual(7, remembered.hashes)
+
+    def test_false_positives(self):
+        'few new keys are mistaken for remembered ones'
+        remembered = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            remembered.add(b'old %d' % i)
+
+        mistakes = sum(
+            remembered.add(b'new %d' % i) for i in range(300)
+        )
+        self.assertLess(mistakes, 15)
+
+    def test_generations(self):
+        'keys are remembered for two generations'
+        remembered = BloomFilter(2)
+        remembered.add(b'a')
+        remembered.add(b'b')
+        remembered.add(b'c')  # starts a new generation
+        self.assertTrue(remembered.add(b'a'))
+
+        remembered = BloomFilter(2)
+        for key in (b'a', b'b', b'c', b'd', b'e'):
+            remembered.add(key)
+        self.assertFalse(remembered.add(b'a'))
+
+    @mock.patch('emit.dedupe.time')
+    def test_window(self, fake_time):
+        'generations last window seconds'
+        fake_time.monotonic.return_value = 100
+        remembered = BloomFilter(100, window=10)
+        remembered.add(b'a')
+
+        fake_time.monotonic.return_value = 111
+        self.assertTrue(remembered.add(b'b') is False)
+        fake_time.monotonic.return_value = 122
+        self.assertFalse(remembered.add(b'a'))
+
+    def test_bad_arguments(self):
+        'size and error rate are checked'
+        self.assertRaises(ValueError, BloomFilter, 0)
+        self.assertRaises(ValueError, BloomFilter, 10, error_rate=1)
+
+
+class DeduperTests(TestCase):
+    'tests for Deduper'
+    def test_counts(self):
+        'repeats are counted as dropped'
+        deduper = Deduper('id')
+        for i in (1, 2, 1, 1):
+            deduper.is_duplicate(Message(id=i))
+
+        self.assertEqual({'seen': 4, 'dropped': 2}, deduper.stats())
+
+    def test_whole_message(self):
+        'without fields, whole messages are compared'
+        deduper = Deduper()
+        self.assertFalse(deduper.is_duplicate(Message(id=1, x=1)))
+        self.assertFalse(deduper.is_duplicate(Message(id=1, x=2)))
+        self.assertTrue(deduper.is_duplicate(Message(id=1, x=2, _origin='a')))
+
+    def test_bloom(self):
+        'the bloom method uses a BloomFilter'
+        deduper = Deduper(method='bloom', size=10)
+        self.assertIsInstance(deduper.filter, BloomFilter)
+        self.assertFalse(deduper.is_duplicate(Message(id=1)))
+        self.assertTrue(deduper.is_duplicate(Message(id=1)))
+
+    def test_bad_method(self):
+        'unknown methods are rejected'
+        self.assertRaises(ValueError, Deduper, method='cuckoo')
+
+
+class GetDeduperTests(TestCase):
+    'tests for get_deduper'
+    def test_true(self):
+        'True compares whole messages'
+        self.assertEqual(None, get_deduper(True).fields)
+
+    def test_fields(self):
+        'field names are used as the key'
+        self.assertEqual(['id'], get_deduper('id').fields)
+        self.assertEqual(['a', 'b'], get_deduper(['a', 'b']).fields)
+
+    def test_instance(self):
+        'a deduper is used as-is'
+        deduper = Deduper()
+        self.assertIs(deduper, get_deduper(deduper))
+
+    def test_other(self):
+        'anything else is an error'
+        self.assertRaises(TypeError, get_deduper, 1)
@@ -1,8 +1,9 @@
 'tests for message'
 import json
+import pickle
 from unittest import TestCase
 
-from emit.messages import Message
+from emit.messages import Bounded, Message
 
 
 class MessageTests(TestCase):
@@ -39,6 +40,12 @@ class MessageTests(TestCase):
                 repr(x)
             )
 
+    def test_repr_bounded(self):
+        'large messages are abbreviated in repr'
+        x = Message(dict(('k%d' % i, 'v' * 1000) for i in range(100)))
+        self.assertTrue(len(repr(x)) < 10000)
+        self.assertTrue(repr(x).endswith(', ...)'))
+
     def test_dir(self):
         'dir includes attributes'
         x = Message(x=1, y=2)
@@ -74,3 +81,57 @@ class MessageTests(TestCase):
         y = Message(**d)
 
         self.assertEqual(x, y)
+
+    def test_adopt(self):
+        'adopt uses the dictionary without copying it'
+        d = {'x': 1}
+        x = Message.adopt(d)
+
+        self.assertTrue(x.bundle is d)
+        self.assertEqual(1, x.x)
+
+    def test_adopt_subclass(self):
+        'adopt creates instances of subclasses'
+        class Custom(Message):
+            pass
+
+        self.assertTrue(isinstance(Custom.adopt({}), Custom))
+
+    def test_slots(self):
+        'messages have no instance dictionary'
+        x = Message(x=1)
+        self.assertFalse(hasattr(x, '__dict__'))
+        self.assertRaises(AttributeError, setattr, x, 'y', 2)
+
+    def test_pickle(self):
+        'messages can be pickled'
+        x = Message(x=1)
+        self.assertEqual(x, pickle.loads(pickle.dumps(x)))
+
+    def test_encode(self):
+        'encode uses JSON by default'
+        x = Message(x=1)
+        self.assertEqual({'x': 1}, json.loads(x.encode().decode('UTF-8')))
+
+    def test_decode(self):
+        'decode reverses encode'
+        x = Message(x=[1, 'a'])
+        self.assertEqual(x, Message.decode(x.encode()))
+
+
+class BoundedTests(TestCase):
+    'tests for Bounded'
+    def test_short_str(self):
+        'short strings are unchanged'
+        self.assertEqual('abc', str(Bounded('abc')))
+
+    def test_long_str(self):
+        'long strings are truncated'
+        self.assertEqual('a' * 200 + '...', str(Bounded('a' * 1000)))
+
+    def test_repr(self):
+        'containers are abbreviated'
+        self.assertEqual(
+            '[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, ...]',
+            repr(Bounded(list(range(100))))
+        )
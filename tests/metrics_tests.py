@@ -0,0 +1,111 @@
+'tests for emit/metrics.py'
+from unittest import TestCase
+
+from emit.metrics import Histogram, Metrics
+
+
+class HistogramTests(TestCase):
+    'tests for Histogram'
+    def test_observe(self):
+        'observations are counted in the first bucket they fit'
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(6.0, histogram.sum)
+
+    def test_cumulative(self):
+        'cumulative counts end with everything'
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual(
+            [(1, 1), (2, 2), (float('inf'), 3)], histogram.cumulative()
+        )
+
+    def test_quantile(self):
+        'quantiles are interpolated within buckets'
+        histogram = Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual(1.0, histogram.quantile(0.25))
+        self.assertEqual(1.5, histogram.quantile(0.5))
+        self.assertEqual(4.0, histogram.quantile(1))
+
+    def test_quantile_overflow(self):
+        'quantiles above the last bound are the last bound'
+        histogram = Histogram((1,))
+        histogram.observe(5)
+        self.assertEqual(1.0, histogram.quantile(0.5))
+
+    def test_quantile_empty(self):
+        'there are no quantiles without observations'
+        self.assertEqual(None, Histogram((1,)).quantile(0.5))
+
+
+class MetricsTests(TestCase):
+    'tests for Metrics'
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.1, 1))
+
+    def test_snapshot(self):
+        'snapshot has counts for nodes and edges'
+        self.metrics.record_call('a', 0.05, 2)
+        self.metrics.record_call('a', 0.5, 0, 1)
+        self.metrics.record_edge('a', 'b')
+        self.metrics.record_edge('a', 'b')
+
+        self.assertEqual(
+            {
+                'nodes': {
+                    'a': {
+                        'calls': 2, 'emitted': 2, 'dropped': 1,
+                        'latency': {
+                            'count': 2, 'sum': 0.55,
+                            'buckets': [[0.1, 1], [1, 2], [float('inf'), 2]],
+                        },
+                    },
+                },
+                'edges': [{'origin': 'a', 'destination': 'b', 'messages': 2}],
+            },
+            self.metrics.snapshot()
+        )
+
+    def test_reset(self):
+        'reset forgets everything'
+        self.metrics.record_call('a', 0.05, 1)
+        self.metrics.record_edge('a', 'b')
+        self.metrics.reset()
+
+        self.assertEqual({'nodes': {}, 'edges': []}, self.metrics.snapshot())
+
+    def test_prometheus(self):
+        'prometheus renders the text exposition format'
+        self.metrics.record_call('a', 0.5, 3)
+        self.metrics.record_edge('a', 'b"c')
+
+        text = self.metrics.prometheus()
+
+        self.assertIn('# TYPE emit_node_calls_total counter\n', text)
+        self.assertIn('emit_node_calls_total{node="a"} 1\n', text)
+        self.assertIn('emit_node_emitted_total{node="a"} 3\n', text)
+        self.assertIn('emit_node_dropped_total{node="a"} 0\n', text)
+        self.assertIn('# TYPE emit_node_latency_seconds histogram\n', text)
+        self.assertIn('emit_node_latency_seconds_bucket{node="a",le="0.1"} 0\n', text)
+        self.assertIn('emit_node_latency_seconds_bucket{node="a",le="1.0"} 1\n', text)
+        self.assertIn('emit_node_latency_seconds_bucket{node="a",le="+Inf"} 1\n', text)
+        self.assertIn('emit_node_latency_seconds_sum{node="a"} 0.5\n', text)
+        self.assertIn('emit_node_latency_seconds_count{node="a"} 1\n', text)
+        self.assertIn(
+            'emit_edge_messages_total{origin="a",destination="b\\"c"} 1\n', text
+        )
+
+    def test_prometheus_prefix(self):
+        'metric names take the prefix'
+        self.metrics.record_call('a', 0.5, 3)
+        self.assertIn('graph_node_calls_total{node="a"} 1\n',
+                      self.metrics.prometheus('graph'))
@@ -1,7 +1,13 @@
 'tests for multilang'
 import json
+from threading import Thread
+import time
 from unittest import TestCase
 
+from .utils import skipIf
+
+from emit import codecs
+from emit.messages import Message
 from emit.router.core import Router
 from emit.multilang import ShellNode
 
@@ -11,6 +17,12 @@ class SampleNode(ShellNode):
     cwd = 'examples/multilang'
 
 
+class PersistentSampleNode(ShellNode):
+    command = 'python test.py --persistent'
+    cwd = 'examples/multilang'
+    persistent = True
+
+
 class SampleRubyNode(ShellNode):
     command = 'bundle exec ruby test.rb'
     cwd = 'examples/multilang'
@@ -32,6 +44,18 @@ class ShellNodeTests(TestCase):
             self.raw.deserialize(packed)
         )
 
+    def test_deserialize_override(self):
+        'deserialize receives text from text codecs'
+        received = []
+
+        class Override(SampleNode):
+            def deserialize(self, msg):
+                received.append(msg)
+                return super(Override, self).deserialize(msg)
+
+        self.assertEqual([0, 1], list(Override()(Message(count=2))))
+        self.assertEqual(['0', '1'], received)
+
     def test_get_command(self):
         'get_command gets command'
         self.assertEqual(
@@ -83,3 +107,277 @@ class ShellNodeTests(TestCase):
             ),
             rb_node(count=5)
         )
+
+
+class StreamingShellNodeTests(TestCase):
+    'tests for ShellNode reading output as it arrives'
+    def shell_node(self, script):
+        class Script(ShellNode):
+            command = 'python -c "%s"' % script
+
+        return Script()
+
+    def test_large_output(self):
+        'many lines of output are all returned'
+        output = SampleNode()(Message(count=100000))
+        self.assertEqual(list(range(100000)), list(output))
+
+    def test_no_output(self):
+        'commands without output return nothing'
+        self.assertEqual(tuple(), Router().node(['n'])(SampleNode())(count=0))
+
+    def test_yields_before_exit(self):
+        'output is yielded before the command finishes'
+        node = self.shell_node(
+            'import sys, time; print(1); sys.stdout.flush(); time.sleep(30)'
+        )
+        output = node(Message())
+
+        start = time.time()
+        self.assertEqual(1, next(output))
+        output.close()
+        self.assertTrue(time.time() - start < 10)
+
+    def test_stderr(self):
+        'writing to stderr raises RuntimeError after the output'
+        node = self.shell_node(
+            'import sys; print(1); sys.stderr.write(\'oops\')'
+        )
+        output = node(Message())
+
+        self.assertEqual(1, next(output))
+        self.assertRaises(RuntimeError, next, output)
+
+    def test_stderr_does_not_block(self):
+        'commands writing a lot to stderr do not block'
+        node = self.shell_node(
+            'import sys; sys.stderr.write(\'x\' * 1000000); print(1)'
+        )
+        output = node(Message())
+
+        self.assertEqual(1, next(output))
+        self.assertRaises(RuntimeError, next, output)
+
+
+class MsgpackSampleNode(ShellNode):
+    command = 'python test_msgpack.py'
+    cwd = 'examples/multilang'
+    codec = 'msgpack'
+
+
+class CodecShellNodeTests(TestCase):
+    'tests for ShellNode with other codecs'
+    @skipIf(codecs.orjson is None, 'orjson is not installed')
+    def test_orjson(self):
+        'orjson speaks JSON to the command'
+        class OrjsonNode(SampleNode):
+            codec = 'orjson'
+
+        self.assertEqual([0, 1], list(OrjsonNode()(Message(count=2))))
+
+    @skipIf(codecs.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        'msgpack messages are length-prefixed'
+        node = Router().node(['n'])(MsgpackSampleNode())
+        self.assertEqual(({'n': 0}, {'n': 1}), node(count=2))
+
+    @skipIf(codecs.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_persistent(self):
+        'persistent processes can use msgpack'
+        class PersistentMsgpackNode(MsgpackSampleNode):
+            command = 'python test_msgpack.py --persistent'
+            persistent = True
+
+        raw = PersistentMsgpackNode()
+        try:
+            self.assertEqual([0, 1, 2], list(raw(Message(count=3))))
+            self.assertEqual([0], list(raw(Message(count=1))))
+        finally:
+            raw.close()
+
+    @skipIf(codecs.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_deserialize(self):
+        'deserialize receives bytes from binary codecs'
+        received = []
+
+        class Override(MsgpackSampleNode):
+            def deserialize(self, msg):
+                received.append(msg)
+                return super(Override, self).deserialize(msg)
+
+        self.assertEqual([0], list(Override()(Message(count=1))))
+        self.assertTrue(isinstance(received[0], bytes))
+
+    def test_router_codec(self):
+        'nodes without a codec use the router\'s'
+        raw = SampleNode()
+        Router(codec='orjson').node(['n'])(raw)
+        self.assertEqual('orjson', raw.codec)
+
+    def test_node_codec(self):
+        'nodes with a codec keep it'
+        raw = MsgpackSampleNode()
+        Router(codec='orjson').node(['n'])(raw)
+        self.assertEqual('msgpack', raw.codec)
+
+
+class PersistentShellNodeTests(TestCase):
+    'tests for ShellNode with a persistent process'
+    def setUp(self):
+        self.raw = PersistentSampleNode()
+        self.node = Router().node(['n'])(self.raw)
+
+    def tearDown(self):
+        self.raw.close()
+
+    def test_runs(self):
+        'running returns proper output'
+        self.assertEqual(
+            ({'n': 0}, {'n': 1}, {'n': 2}),
+            self.node(count=3)
+        )
+
+    def test_deserialize_override(self):
+        'deserialize receives text from persistent processes too'
+        received = []
+
+        class Override(PersistentSampleNode):
+            def deserialize(self, msg):
+                received.append(msg)
+                return super(Override, self).deserialize(msg)
+
+        raw = Override()
+        try:
+            self.assertEqual([0, 1], list(raw(Message(count=2))))
+        finally:
+            raw.close()
+
+        self.assertEqual(['0', '1'], received)
+
+    def test_reuses_process(self):
+        'the same process handles every message'
+        self.node(count=1)
+        process, = self.raw.pool
+
+        self.assertEqual(({'n': 0}, {'n': 1}), self.node(count=2))
+        self.assertEqual([process], self.raw.pool)
+
+    def test_no_output(self):
+        'messages without output return nothing'
+        self.assertEqual(tuple(), self.node(count=0))
+
+    def test_restarts(self):
+        'the process is restarted if it exits'
+        self.node(count=1)
+        process, = self.raw.pool
+        process.process.kill()
+        process.process.wait()
+
+        self.assertEqual(({'n': 0},), self.node(count=1))
+        self.assertFalse(process in self.raw.pool)
+
+    def test_crash(self):
+        'a process exiting partway through a message raises RuntimeError'
+        self.assertRaises(RuntimeError, self.node, count='x')
+        self.assertEqual(({'n': 0},), self.node(count=1))
+
+    def test_abandoned(self):
+        'output abandoned partway through is dropped'
+        output = self.raw(Message(count=3))
+        next(output)
+        output.close()
+
+        self.assertEqual(({'n': 0},), self.node(count=1))
+        self.assertEqual(0, self.raw.pool[0].in_flight)
+
+    def test_timeout(self):
+        'requests which take longer than timeout raise RuntimeError'
+        class Silent(ShellNode):
+            command = 'python -c "import sys; sys.stdin.read()"'
+            persistent = True
+            timeout = 0.1
+
+        raw = Silent()
+        try:
+            self.assertRaises(RuntimeError, list, raw(Message(count=1)))
+            self.assertEqual(0, raw.pool[0].in_flight)
+        finally:
+            raw.close()
+
+    def test_close(self):
+        'close stops the processes'
+        self.node(count=1)
+        process, = self.raw.pool
+        self.raw.close()
+
+        self.assertEqual([], self.raw.pool)
+        self.assertFalse(process.running)
+
+
+class PooledSampleNode(PersistentSampleNode):
+    workers = 3
+    max_in_flight = 2
+
+
+class ShellNodePoolTests(TestCase):
+    'tests for ShellNode with several persistent processes'
+    def setUp(self):
+        self.raw = PooledSampleNode()
+
+    def tearDown(self):
+        self.raw.close()
+
+    def test_least_busy(self):
+        'requests go to an idle process, starting one if needed'
+        first = self.raw(Message(count=2))
+        self.assertEqual(0, next(first))
+        second = self.raw(Message(count=2))
+        self.assertEqual(0, next(second))
+
+        self.assertEqual(2, len(self.raw.pool))
+        self.assertEqual([1, 1], [p.in_flight for p in self.raw.pool])
+
+        self.assertEqual([1], list(first))
+        self.assertEqual([0, 1], list(self.raw(Message(count=2))))
+        self.assertEqual(2, len(self.raw.pool))
+        self.assertEqual([1], list(second))
+
+    def test_bounded(self):
+        'at most workers * max_in_flight requests wait at once'
+        outputs = [self.raw(Message(count=2)) for _ in range(6)]
+        for output in outputs:
+            next(output)
+
+        self.raw.timeout = 0.1
+        self.assertRaises(RuntimeError, list, self.raw(Message(count=1)))
+
+        for output in outputs:
+            self.assertEqual([1], list(output))
+
+        self.assertEqual([0], list(self.raw(Message(count=1))))
+
+    def test_concurrent(self):
+        'messages from several threads are answered correctly'
+        results = {}
+
+        def call(n):
+            results[n] = list(self.raw(Message(count=n)))
+
+        threads = [Thread(target=call, args=(n,)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            dict((n, list(range(n))) for n in range(20)),
+            results
+        )
+        self.assertTrue(len(self.raw.pool) <= 3)
+
+    def test_router_close(self):
+        'closing the router closes the node'
+        with Router() as router:
+            router.node(['n'])(self.raw)(count=1)
+
+        self.assertEqual([], self.raw.pool)
@@ -0,0 +1,96 @@
+'tests for emit/patterns.py'
+import re
+from unittest import TestCase
+
+from emit.patterns import NameIndex, PatternIndex
+
+
+def compiled(*patterns):
+    return [re.compile(pattern) for pattern in patterns]
+
+
+class PatternIndexTests(TestCase):
+    'tests for PatternIndex'
+    def setUp(self):
+        self.index = PatternIndex()
+
+    def test_exact(self):
+        'plain names are indexed for exact lookup'
+        self.index.add('dest', compiled('tasks.tweet_text'))
+
+        self.assertEqual(set(['dest']), self.index.exact['tasks.tweet_text'])
+        self.assertEqual(set(['dest']), self.index.match('tasks.tweet_text'))
+
+    def test_literal_substring(self):
+        'literal patterns still match anywhere in the name'
+        self.index.add('dest', compiled('tasks.tweet_text'))
+
+        self.assertEqual(set(['dest']), self.index.match('tasks.tweet_text_length'))
+        self.assertEqual(set(['dest']), self.index.match('tasksXtweet_text'))
+        self.assertEqual(set(), self.index.match('tasks.tweet'))
+
+    def test_segment(self):
+        'literal patterns are indexed by their longest segment'
+        self.assertEqual('tweet_text', self.index.get_segment(r'^tasks\.tweet_text$'))
+        self.assertEqual(None, self.index.get_segment('.+'))
+        self.assertEqual(None, self.index.get_segment('a|b'))
+
+    def test_fallback(self):
+        'non-literal patterns are checked against every name'
+        self.index.add('all', compiled('.+'))
+        self.index.add('either', compiled('a|b'))
+
+        self.assertEqual(set(['all', 'either']), self.index.match('bc'))
+        self.assertEqual(set(['all']), self.index.match('c'))
+
+    def test_multiple_patterns(self):
+        'any pattern under a key matching returns the key'
+        self.index.add('dest', compiled('x$', 'y$'))
+        self.index.add('other', compiled('^y'))
+
+        self.assertEqual(set(['dest']), self.index.match('a.x'))
+        self.assertEqual(set(['dest', 'other']), self.index.match('y.y'))
+
+    def test_initial(self):
+        'patterns can be passed when initializing'
+        index = PatternIndex({'dest': compiled('x')})
+        self.assertEqual(set(['dest']), index.match('x'))
+
+
+class NameIndexTests(TestCase):
+    'tests for NameIndex'
+    def setUp(self):
+        self.index = NameIndex([
+            'tasks.tweet_text', 'tasks.tweet_text_length', 'tasksXtweet_text',
+            'tasks.tweet', 'other.count',
+        ])
+
+    def search(self, pattern):
+        return self.index.search(re.compile(pattern))
+
+    def test_exact(self):
+        'plain names match themselves and any name containing them'
+        self.assertEqual(
+            set(['tasks.tweet_text', 'tasks.tweet_text_length', 'tasksXtweet_text']),
+            self.search('tasks.tweet_text')
+        )
+
+    def test_anchored(self):
+        'anchored literal patterns are checked against candidates'
+        self.assertEqual(set(['tasks.tweet_text']), self.search(r'^tasks\.tweet_text$'))
+        self.assertEqual(set(), self.search(r'^missing\.name$'))
+
+    def test_candidates(self):
+        'literal patterns are only checked against names sharing substrings'
+        self.assertEqual(set(['other.count']), self.index.candidates(r'^other\.'))
+        self.assertEqual(self.index.names, self.index.candidates('.+'))
+
+    def test_fallback(self):
+        'non-literal patterns are checked against every name'
+        self.assertEqual(set(['tasks.tweet', 'other.count']), self.search('(tweet|count)$'))
+
+    def test_contains(self):
+        'added names are in the index'
+        self.index.add('new.name')
+        self.assertTrue('new.name' in self.index)
+        self.assertEqual(set(['new.name']), self.search('new'))
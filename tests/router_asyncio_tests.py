@@ -0,0 +1,217 @@
+'tests for emit/router/asyncio.py'
+import asyncio
+import time
+from unittest import TestCase
+
+from emit.messages import NoResult
+from emit.router.asyncio import AsyncRouter
+
+
+def prefix(name):
+    return '%s.%s' % (__name__, name)
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+class AsyncRouterTests(TestCase):
+    'tests for AsyncRouter'
+    def setUp(self):
+        self.router = AsyncRouter()
+        self.seen = []
+
+    def watch(self, name, subscribe_to=None, entry_point=False, delay=0, ignore=None):
+        'register an async node which records what it sees'
+        async def watcher(msg):
+            await asyncio.sleep(delay)
+            self.seen.append((name, msg.as_dict()))
+            return msg.x
+
+        watcher.__name__ = name
+        return self.router.node(
+            ['x'], subscribe_to=subscribe_to, entry_point=entry_point,
+            ignore=ignore
+        )(watcher)
+
+    def test_async_node(self):
+        'async nodes are awaited, and their results routed'
+        node = self.watch('a')
+        self.watch('b', prefix('a'))
+
+        self.assertEqual({'x': 1}, run(node(x=1)))
+        self.assertEqual(
+            [('a', {'x': 1}), ('b', {'x': 1, '_origin': prefix('a')})],
+            self.seen
+        )
+
+    def test_sync_node(self):
+        'plain functions work too'
+        node = self.router.node(['y'])(lambda msg: msg.x + 1)
+        self.assertEqual({'y': 2}, run(node(x=1)))
+
+    def test_entry_point(self):
+        'calling the router calls entry points'
+        self.watch('a', entry_point=True)
+        self.watch('b')
+
+        run(self.router(x=1))
+        self.assertEqual([('a', {'x': 1, '_origin': '__entry_point'})], self.seen)
+
+    def test_ignore(self):
+        'ignored origins are not routed'
+        self.watch('a', entry_point=True)
+        self.watch('b', entry_point=True)
+        self.watch('c', subscribe_to=r'^tests', ignore=prefix('b'))
+
+        run(self.router(x=1))
+        self.assertEqual(
+            ['a', 'b', 'c'], sorted(name for name, _ in self.seen)
+        )
+
+    def test_concurrent_fanout(self):
+        'subscribers of a message run concurrently'
+        node = self.watch('source')
+        for i in range(5):
+            self.watch('sub%d' % i, prefix('source'), delay=0.1)
+
+        start = time.time()
+        run(node(x=1))
+
+        self.assertEqual(6, len(self.seen))
+        self.assertTrue(time.time() - start < 0.4)
+
+    def test_concurrency_limit(self):
+        'no more than concurrency nodes run at once'
+        self.router.concurrency = 2
+        running = []
+        peak = []
+
+        def limited(name, **options):
+            async def node(msg):
+                running.append(name)
+                peak.append(len(running))
+                await asyncio.sleep(0.01)
+                running.remove(name)
+
+            node.__name__ = name
+            return self.router.node(['x'], **options)(node)
+
+        limited('source', entry_point=True)
+        for i in range(5):
+            limited('sub%d' % i, subscribe_to=prefix('source'))
+
+        run(self.router(x=1))
+        self.assertEqual(6, len(peak))
+        self.assertEqual(2, max(peak))
+
+    def test_deep_graph(self):
+        'graphs deeper than the concurrency limit do not deadlock'
+        self.router.concurrency = 1
+        node = self.watch('n0')
+        for i in range(1, 5):
+            self.watch('n%d' % i, prefix('n%d' % (i - 1)))
+
+        run(asyncio.wait_for(node(x=1), 5))
+        self.assertEqual(5, len(self.seen))
+
+    def test_async_generator(self):
+        'async generators are collected and routed'
+        async def gen(msg):
+            for i in range(msg.x):
+                yield i
+            yield NoResult
+
+        gen.__name__ = 'gen'
+        node = self.router.node(['x'])(gen)
+        self.watch('b', prefix('gen'))
+
+        self.assertEqual(({'x': 0}, {'x': 1}), run(node(x=2)))
+        self.assertEqual(2, len(self.seen))
+
+    def test_stream(self):
+        'streamed generators route each item and return a count'
+        async def gen(msg):
+            for i in range(msg.x):
+                yield i
+
+        gen.__name__ = 'gen'
+        node = self.router.node(['x'], stream=True)(gen)
+        self.watch('b', prefix('gen'))
+
+        self.assertEqual(3, run(node(x=3)))
+        self.assertEqual([0, 1, 2], [msg['x'] for _, msg in self.seen])
+
+    def test_frozen(self):
+        'frozen routers route through the dispatch table'
+        node = self.watch('a')
+        self.watch('b', prefix('a'))
+        self.router.freeze()
+
+        run(node(x=1))
+        self.assertEqual(2, len(self.seen))
+
+    def test_feed(self):
+        'feed routes every message and counts emissions'
+        self.watch('a', entry_point=True, delay=0.01)
+        self.router.concurrency = 3
+
+        result = run(self.router.feed({'x': i} for i in range(10)))
+
+        self.assertEqual(10, result['messages'])
+        self.assertEqual({prefix('a'): 10}, result['emitted'])
+        self.assertEqual(10, len(self.seen))
+
+    def test_metrics(self):
+        'node calls are recorded in metrics'
+        router = AsyncRouter(metrics=True)
+
+        @router.node(['word'], entry_point=True)
+        async def words(msg):
+            for word in msg.text.split():
+                yield word if word != 'skip' else NoResult
+
+        @router.node(['char'], prefix('words'), stream=True)
+        def chars(msg):
+            for char in msg.word:
+                yield char
+
+        @router.node(['length'], prefix('words'))
+        async def length(msg):
+            await asyncio.sleep(0.01)
+            return len(msg.word)
+
+        run(router(text='ab skip c'))
+
+        nodes = router.metrics.snapshot()['nodes']
+        self.assertEqual(
+            (1, 2, 1),
+            tuple(nodes[prefix('words')][key] for key in ('calls', 'emitted', 'dropped'))
+        )
+        self.assertEqual(
+            (2, 3, 0),
+            tuple(nodes[prefix('chars')][key] for key in ('calls', 'emitted', 'dropped'))
+        )
+        self.assertEqual(2, nodes[prefix('length')]['calls'])
+        self.assertTrue(nodes[prefix('length')]['latency']['sum'] >= 0.02)
+
+    def test_unsupported_options(self):
+        'batching and cached nodes raise ValueError'
+        def receive(msg):
+            return msg.x
+
+        self.assertRaises(ValueError, self.router.node(['x'], batch_size=2), receive)
+        self.assertRaises(ValueError, self.router.node(['x'], cache={}), receive)
+
+    def test_dedupe(self):
+        'repeated messages are dropped'
+        async def receive(msg):
+            self.seen.append(msg.x)
+            return msg.x
+
+        node = self.router.node(['x'], dedupe='x')(receive)
+
+        self.assertEqual({'x': 1}, run(node(x=1)))
+        self.assertIs(NoResult, run(node(x=1)))
+        self.assertEqual([1], self.seen)
+        self.assertEqual({prefix('receive'): 1}, self.router.duplicates())
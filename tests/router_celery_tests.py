@@ -1,11 +1,12 @@
 import mock
+import threading
 from unittest import TestCase
 from .utils import skipIf
 
 from emit.router.celery import CeleryRouter
 
 try:
-    from celery import Celery, Task
+    from celery import Celery, Task, group
 except ValueError:  # Celery doesn't work under Python 3.3 - when it does it'll test again
     Celery = None
 
@@ -30,9 +31,10 @@ class CeleryRouterTests(TestCase):
 
     def test_registers_as_task(self):
         'registers the function as a task'
-        l = lambda x: x
-        l.__name__ = 'test'
-        self.router.node(['test'], celery_task=self.celery.task)(l)
+        def test(x):
+            return x
+
+        self.router.node(['test'], celery_task=self.celery.task)(test)
 
         self.assertTrue(
             isinstance(self.router.functions[prefix('test')], Task)
@@ -42,17 +44,27 @@ class CeleryRouterTests(TestCase):
         'if router is passed a celery task when initialized it wraps with it'
         r = CeleryRouter(celery_task=self.celery.task)
 
-        l = lambda x: x
-        l.__name__ = 'test'
-        r.node(['test'])(l)
+        def test(x):
+            return x
+
+        r.node(['test'])(test)
 
         self.assertTrue(
             isinstance(r.functions[prefix('test')], Task)
         )
 
+    def test_lambda_name(self):
+        'lambda nodes get a name celery can compile a signature for'
+        task = self.router.node(['x'])(lambda msg: msg.x)
+
+        self.assertTrue(task.run.__name__.isidentifier())
+        self.assertTrue(callable(task.__header__))  # compiled from the name
+
     def test_calls_delay(self):
         'calls delay to route'
-        func = lambda n: n
+        def func(n):
+            return n
+
         func.name = 'name'
         self.router.node(tuple(), entry_point=True)(func)
 
@@ -63,10 +75,136 @@ class CeleryRouterTests(TestCase):
 
         node.delay.assert_called_with(_origin='__entry_point', x=1)
 
+    def test_feed(self):
+        'feed publishes every message for the entry points together'
+        def func(n):
+            return n
+
+        func.name = 'name'
+        self.router.node(tuple(), entry_point=True)(func)
+
+        node = mock.Mock()
+        self.router.functions['name'] = node
+
+        with mock.patch('emit.router.celery.group') as fake_group:
+            self.assertEqual(2, self.router.feed([{'x': 1}, {'x': 2}])['messages'])
+
+        node.s.assert_has_calls([
+            mock.call(_origin='__entry_point', x=1),
+            mock.call(_origin='__entry_point', x=2),
+        ])
+        fake_group.return_value.apply_async.assert_called_once_with()
+
     def test_get_name_celery(self):
         'gets the name of a celery-decorated function'
-        l = lambda x: x
-        l.__name__ = 'test'
-        l = self.celery.task(l)
+        def test(x):
+            return x
+
+        task = self.celery.task(test)
 
-        self.assertEqual(prefix('test'), self.router.get_name(l))
+        self.assertEqual(prefix('test'), self.router.get_name(task))
+
+
+@skipIf(Celery is None, 'Celery did not import correctly')
+class CeleryRouterBatchTests(TestCase):
+    'tests for publishing messages from one node call together'
+    def setUp(self):
+        self.celery = Celery()
+        self.celery.conf.update(CELERY_ALWAYS_EAGER=True)
+        self.router = CeleryRouter(self.celery.task, chunk_size=3)
+
+        self.received = []
+
+        @self.router.node(['word'], entry_point=True)
+        def words(msg):
+            for word in msg.text.split():
+                yield word
+
+        @self.router.node(['word'], prefix('words'))
+        def tally(msg):
+            self.received.append(msg.word)
+
+        self.words = words
+
+    def test_publishes_group(self):
+        'messages from one node call are published as a group'
+        with mock.patch('emit.router.celery.group', wraps=group) as fake_group:
+            self.words(text='a b')
+
+        self.assertEqual(1, fake_group.call_count)
+        self.assertEqual(2, len(fake_group.call_args[0][0]))
+        self.assertEqual(['a', 'b'], self.received)
+
+    def test_chunks(self):
+        'more messages than chunk_size are published in chunks'
+        with mock.patch('emit.router.celery.group', wraps=group) as fake_group:
+            self.words(text='a b c d e f g')
+
+        self.assertEqual(3, len(fake_group.call_args[0][0]))
+        self.assertEqual(list('abcdefg'), self.received)
+
+    def test_feed(self):
+        'feed publishes every message in one group'
+        with mock.patch('emit.router.celery.group', wraps=group) as fake_group:
+            self.router.feed([{'text': 'a'}, {'text': 'b'}])
+
+        self.assertEqual(1, fake_group.call_count)
+        self.assertEqual(['a', 'b'], sorted(self.received))
+
+    def test_single_delays(self):
+        'a single message is sent with delay'
+        with mock.patch('emit.router.celery.group') as fake_group:
+            self.words(text='a')
+
+        self.assertEqual(0, fake_group.call_count)
+        self.assertEqual(['a'], self.received)
+
+    def test_nothing_published_on_error(self):
+        'messages are not published if the batch raises'
+        def fail():
+            with self.router.batch():
+                self.router.dispatch('origin', prefix('tally'), {'word': 'a'})
+                raise ValueError('test')
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual([], self.received)
+        self.assertEqual(None, self.router.pending)
+
+    def test_batches_per_thread(self):
+        'each thread collects its own batch'
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def run(i):
+            try:
+                with self.router.batch():
+                    for _ in range(50):
+                        self.router.dispatch('origin', prefix('tally'), {'word': 'a'})
+
+                    barrier.wait()
+                    if i == 0:
+                        raise ValueError('test')
+            except ValueError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(150, len(self.received))
+
+    def test_batching_node(self):
+        'messages to batching nodes are published as one task with a list'
+        batches = []
+
+        @self.router.node(['word'], prefix('words'), batch_size=10)
+        def batched(messages):
+            batches.append([msg.word for msg in messages])
+            return [msg.word for msg in messages]
+
+        self.words(text='a b c')
+
+        self.assertEqual([['a', 'b', 'c']], batches)
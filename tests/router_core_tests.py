@@ -1,6 +1,12 @@
 'tests for emit/router.py'
 from __future__ import print_function
+import json
+import logging
+import os
 import re
+import shutil
+import tempfile
+import threading
 from unittest import TestCase
 
 from .utils import skipIf
@@ -8,8 +14,9 @@ from .utils import skipIf
 import mock
 from redis import Redis
 
-from emit.router.core import Router
+from emit.router.core import Router, noop
 from emit.messages import Message, NoResult
+from emit.metrics import Metrics
 
 
 def prefix(name):
@@ -100,6 +107,11 @@ class GetMessageFromCallTests(TestCase):
             self.router.get_message_from_call(**d)
         )
 
+    def test_does_not_copy(self):
+        'the dictionary passed becomes the bundle without copying'
+        d = {'test': 1}
+        self.assertTrue(d is self.router.get_message_from_call(d).bundle)
+
     def test_two_args(self):
         'two args should raise a TypeError'
         self.assertRaises(TypeError, self.router.get_message_from_call, 1, 2)
@@ -286,6 +298,38 @@ class RegisterRouteTests(TestCase):
             self.router.routes
         )
 
+    def test_ignore_after_route(self):
+        'an ignore registered after a route removes it'
+        self.router.register_route(None, 'test1')
+        self.router.register_route('test.', 'test2')
+        self.assertEqual({'test1': set(['test2'])}, self.router.routes)
+
+        self.router.register_ignore('1', 'test2')
+        self.assertEqual({'test1': set()}, self.router.routes)
+
+    def test_incremental_matches_regenerate(self):
+        'incremental registration gives the same routes as regenerating'
+        registrations = [
+            ('a.one', None, None),
+            ('a.two', 'a.one', None),
+            ('b.all', '.+', 'a.two'),
+            ('b.one', ['one$', 'b.all'], None),
+            ('c.late', 'b', 'b.one'),
+            ('a.three', 'two', None),
+        ]
+        for name, subscribe_to, ignore in registrations:
+            self.router.register_route(subscribe_to, name)
+            if ignore:
+                self.router.register_ignore(ignore, name)
+
+        expected = Router()
+        expected.names = set(self.router.names)
+        expected.regexes = dict(self.router.regexes)
+        expected.ignore_regexes = dict(self.router.ignore_regexes)
+        expected.regenerate_routes()
+
+        self.assertEqual(expected.routes, self.router.routes)
+
     def test_returns_routes(self):
         'register_route returns the currently registered routes'
         self.assertEqual(
@@ -343,8 +387,9 @@ class DisableEnableRoutingTests(TestCase):
 
     def test_disable_routing(self):
         'disable routing disables routing'
-        a = lambda x: x
-        a.__name__ = 'a'
+        def a(x):
+            return x
+
         node = self.router.node(['x'])(a)
 
         watcher = get_named_mock('watcher')
@@ -357,8 +402,9 @@ class DisableEnableRoutingTests(TestCase):
 
     def test_enable_routing(self):
         'enable routing re-enables routing'
-        a = lambda x: x
-        a.__name__ = 'a'
+        def a(x):
+            return x
+
         node = self.router.node(['x'])(a)
 
         watcher = get_named_mock('watcher')
@@ -373,6 +419,722 @@ class DisableEnableRoutingTests(TestCase):
         self.assertEqual(1, watcher.call_count)
 
 
+class CloseTests(TestCase):
+    'tests for close'
+    def setUp(self):
+        self.router = Router()
+
+    def test_closes_nodes(self):
+        'close calls close on nodes which have it, once'
+        closeable = get_named_mock('closeable')
+        self.router.node(['x'])(closeable)
+
+        self.router.close()
+        self.router.close()
+
+        closeable.close.assert_called_once_with()
+
+    def test_plain_functions(self):
+        'nodes without close are skipped'
+        def a(x):
+            return x
+
+        self.router.node(['x'])(a)
+
+        self.router.close()
+        self.assertEqual([], self.router.closers)
+
+    def test_context_manager(self):
+        'routers close when used as a context manager'
+        closeable = get_named_mock('closeable')
+        with self.router as router:
+            router.node(['x'])(closeable)
+
+        closeable.close.assert_called_once_with()
+
+
+class FeedTests(TestCase):
+    'tests for Router.feed'
+    def setUp(self):
+        self.router = Router()
+
+        @self.router.node(['word'], entry_point=True)
+        def words(msg):
+            for word in msg.text.split():
+                yield word
+
+        self.watcher = get_named_mock('watcher')
+        self.router.node(['word'], prefix('words'))(self.watcher)
+
+    def test_routes_all(self):
+        'feed routes every message to the entry points'
+        self.router.feed([{'text': 'a b'}, {'text': 'c'}])
+
+        self.assertEqual(
+            ['a', 'b', 'c'],
+            [call[0][0].word for call in self.watcher.call_args_list]
+        )
+
+    def test_counts(self):
+        'feed returns the number of messages and emissions per node'
+        self.assertEqual(
+            {'messages': 2, 'emitted': {prefix('words'): 3, 'watcher': 3}},
+            self.router.feed(iter([{'text': 'a b'}, {'text': 'c'}]))
+        )
+
+    def test_frozen(self):
+        'feed uses the dispatch table when frozen'
+        self.router.freeze()
+        self.router.routes = {}
+
+        self.assertEqual(2, self.router.feed([{'text': 'a b'}])['emitted'][prefix('words')])
+
+    def test_disabled(self):
+        'feed does not route when routing is disabled'
+        self.router.disable_routing()
+
+        self.assertEqual(
+            {'messages': 1, 'emitted': {}},
+            self.router.feed([{'text': 'a b'}])
+        )
+        self.assertEqual(0, self.watcher.call_count)
+
+    def test_stops_counting(self):
+        'emissions are only counted while feeding'
+        self.router.feed([])
+        self.assertEqual(None, self.router.emissions)
+
+
+class BatchNodeTests(TestCase):
+    'tests for nodes with batch_size'
+    def setUp(self):
+        self.router = Router()
+        self.batches = []
+
+        @self.router.node(['word'], entry_point=True)
+        def words(msg):
+            for word in msg.text.split():
+                yield word
+
+        @self.router.node(['word', 'length'], prefix('words'), batch_size=3)
+        def lengths(messages):
+            self.batches.append([msg.word for msg in messages])
+            return [(msg.word, len(msg.word)) for msg in messages]
+
+        self.lengths = lengths
+        self.watcher = get_named_mock('watcher')
+        self.router.node(['x'], prefix('lengths'))(self.watcher)
+
+    def seen(self):
+        return [call[0][0].as_dict() for call in self.watcher.call_args_list]
+
+    def test_batches(self):
+        'messages are delivered in lists of batch_size'
+        self.router(text='a bb ccc dddd')
+
+        self.assertEqual([['a', 'bb', 'ccc']], self.batches)
+        self.assertEqual(3, self.watcher.call_count)
+
+    def test_results_routed_separately(self):
+        'each result is routed with the node\'s fields'
+        self.router(text='a bb ccc')
+
+        self.assertEqual(
+            [{'word': 'a', 'length': 1, '_origin': prefix('lengths')},
+             {'word': 'bb', 'length': 2, '_origin': prefix('lengths')},
+             {'word': 'ccc', 'length': 3, '_origin': prefix('lengths')}],
+            self.seen()
+        )
+
+    def test_flush(self):
+        'flush sends partial batches'
+        self.router(text='a bb')
+        self.assertEqual([], self.batches)
+
+        self.router.flush()
+        self.assertEqual([['a', 'bb']], self.batches)
+        self.assertEqual(0, len(self.router.batchers[prefix('lengths')]))
+
+    def test_feed_flushes(self):
+        'feed sends partial batches at the end'
+        result = self.router.feed([{'text': 'a bb'}, {'text': 'ccc dddd'}])
+
+        self.assertEqual([['a', 'bb', 'ccc'], ['dddd']], self.batches)
+        self.assertEqual(4, result['emitted'][prefix('lengths')])
+
+    def test_timeout(self):
+        'partial batches are sent after batch_timeout'
+        done = threading.Event()
+
+        @self.router.node(['x'], batch_size=10, batch_timeout=0.05)
+        def timed(messages):
+            done.set()
+            return [len(messages)]
+
+        timed(x=1)
+        self.assertTrue(done.wait(5))
+
+    def test_call_with_list(self):
+        'calling the node with a list processes it at once'
+        self.assertEqual(
+            ({'word': 'a', 'length': 1}, {'word': 'bb', 'length': 2}),
+            self.lengths([{'word': 'a'}, {'word': 'bb'}])
+        )
+        self.assertEqual(2, self.watcher.call_count)
+
+    def test_call_with_message(self):
+        'calling the node with a message adds it to the batch'
+        self.assertEqual(None, self.lengths(word='a'))
+        self.assertEqual(1, len(self.router.batchers[prefix('lengths')]))
+
+    def test_close_flushes(self):
+        'closing the router sends partial batches'
+        self.router(text='a')
+        self.router.close()
+        self.assertEqual([['a']], self.batches)
+
+
+class CacheNodeTests(TestCase):
+    'tests for nodes with cache'
+    def setUp(self):
+        self.router = Router()
+        self.calls = []
+
+        @self.router.node(['word'], entry_point=True, cache=True)
+        def words(msg):
+            self.calls.append(msg.text)
+            for word in msg.text.split():
+                yield word
+
+        @self.router.node(['length'], prefix('words'), cache=True)
+        def length(msg):
+            self.calls.append(msg.word)
+            return len(msg.word) if msg.word != 'skip' else NoResult
+
+        self.words = words
+        self.length = length
+        self.watcher = get_named_mock('watcher')
+        self.router.node(['x'], prefix('length'))(self.watcher)
+
+    def seen(self):
+        return [call[0][0].length for call in self.watcher.call_args_list]
+
+    def test_skips_function(self):
+        'cached messages do not call the function again'
+        self.router(text='a bb a')
+        self.router(text='a bb a')
+
+        self.assertEqual(['a bb a', 'a', 'bb'], self.calls)
+
+    def test_routes_cached_results(self):
+        'cached results are still routed downstream'
+        self.router(text='a bb')
+        self.router(text='a bb')
+
+        self.assertEqual([1, 2, 1, 2], self.seen())
+
+    def test_returns_cached_results(self):
+        'cached results are returned'
+        first = self.words(text='a b')
+        self.assertEqual(first, self.words(text='a b'))
+        self.assertEqual(({'word': 'a'}, {'word': 'b'}), first)
+
+    def test_no_result_cached(self):
+        'NoResult is cached and not routed'
+        self.assertIs(NoResult, self.length(word='skip'))
+        self.assertIs(NoResult, self.length(word='skip'))
+
+        self.assertEqual(['skip'], self.calls)
+        self.assertEqual(0, self.watcher.call_count)
+
+    def test_counters(self):
+        'caches are kept by node name'
+        self.router(text='a a')
+        cache = self.router.caches[prefix('length')]
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_exceptions_not_cached(self):
+        'a call which raises is tried again'
+        @self.router.node(['x'], cache=True)
+        def flaky(msg):
+            self.calls.append(msg.x)
+            if len(self.calls) == 1:
+                raise ValueError('flaky')
+            return msg.x
+
+        self.assertRaises(ValueError, flaky, x=1)
+        self.assertEqual({'x': 1}, flaky(x=1))
+        self.assertEqual({'x': 1}, flaky(x=1))
+        self.assertEqual([1, 1], self.calls)
+
+    def test_uncacheable(self):
+        'messages without a cache key are processed every time'
+        @self.router.node(['x'], cache=True)
+        def keys(msg):
+            self.calls.append(msg.x)
+            return len(msg.x)
+
+        for value in ({(1, 2): 'a'}, {1: 'a', 'b': 'c'}):
+            with self.assertLogs(self.router.logger, 'WARNING'):
+                self.assertEqual({'x': len(value)}, keys(x=value))
+                self.assertEqual({'x': len(value)}, keys(x=value))
+
+        self.assertEqual(4, len(self.calls))
+        self.assertEqual(0, len(self.router.caches[prefix('keys')]))
+
+    def test_stream_rejected(self):
+        'cached nodes cannot stream'
+        self.assertRaises(
+            ValueError, self.router.node(['x'], stream=True, cache=True), noop
+        )
+
+    def test_batch_rejected(self):
+        'cached nodes cannot batch'
+        self.assertRaises(
+            ValueError, self.router.node(['x'], batch_size=2, cache=True), noop
+        )
+
+
+class DedupeNodeTests(TestCase):
+    'tests for nodes with dedupe'
+    def setUp(self):
+        self.router = Router()
+        self.calls = []
+
+        @self.router.node(['id'], entry_point=True, dedupe='id')
+        def receive(msg):
+            self.calls.append(msg.id)
+            return msg.id
+
+        self.receive = receive
+        self.watcher = get_named_mock('watcher')
+        self.router.node(['x'], prefix('receive'))(self.watcher)
+
+    def test_drops_repeats(self):
+        'repeated messages are not processed or routed'
+        self.router.feed([{'id': 1}, {'id': 2}, {'id': 1, 'text': 'again'}])
+
+        self.assertEqual([1, 2], self.calls)
+        self.assertEqual(2, self.watcher.call_count)
+
+    def test_returns_no_result(self):
+        'calling with a repeat returns NoResult'
+        self.assertEqual({'id': 1}, self.receive(id=1))
+        self.assertIs(NoResult, self.receive(id=1))
+
+    def test_duplicates(self):
+        'the router counts dropped messages by node'
+        self.router.feed([{'id': 1}, {'id': 1}, {'id': 1}])
+        self.assertEqual({prefix('receive'): 2}, self.router.duplicates())
+
+    def test_no_key(self):
+        'messages without a dedupe key are never repeats'
+        for value in ({(1, 2): 'a'}, {1: 'a', 'b': 'c'}):
+            with self.assertLogs(self.router.logger, 'WARNING'):
+                self.assertEqual({'id': value}, self.receive(id=value))
+                self.assertEqual({'id': value}, self.receive(id=value))
+
+        self.assertEqual(4, len(self.calls))
+        self.assertEqual({prefix('receive'): 0}, self.router.duplicates())
+
+    def test_with_cache(self):
+        'dedupe applies before the cache'
+        @self.router.node(['x'], cache=True, dedupe=True)
+        def both(msg):
+            return msg.x
+
+        both(x=1)
+        self.assertIs(NoResult, both(x=1))
+
+    def test_batch_rejected(self):
+        'batching nodes cannot dedupe'
+        self.assertRaises(
+            ValueError, self.router.node(['x'], batch_size=2, dedupe=True), noop
+        )
+
+
+class ManifestTests(TestCase):
+    'tests for saving and loading route manifests'
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'routes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, router, extra=False):
+        'register a small graph'
+        router.register('a', None, ('x',), None, True, None)
+        router.register('b', None, ('x',), '^a$', False, None)
+        router.register('c', None, ('x',), '.+', False, '^b$')
+        if extra:
+            router.register('d', None, ('x',), '^b$', False, None)
+
+        return router
+
+    def saved(self):
+        return self.build(Router()).save_manifest(self.path)
+
+    def test_save(self):
+        'the manifest has routes, fields, ignored routes and a hash'
+        manifest = self.saved()
+
+        with open(self.path) as manifest_file:
+            self.assertEqual(manifest, json.load(manifest_file))
+
+        self.assertEqual(
+            {'__entry_point': ['a'], 'a': ['b', 'c'], 'b': []},
+            manifest['routes']
+        )
+        self.assertEqual(['x'], manifest['fields']['a'])
+        self.assertEqual([['b', 'c']], manifest['ignored'])
+        self.assertEqual(1, manifest['version'])
+
+    def test_load_skips_resolving(self):
+        'routes are not resolved while a manifest is pending'
+        self.saved()
+        router = Router(manifest=self.path)
+
+        with mock.patch.object(router, 'resolve_destination') as resolve:
+            self.build(router)
+            self.assertEqual(0, resolve.call_count)
+
+    def test_load_match(self):
+        'a matching manifest provides the routes'
+        expected = self.build(Router()).routes
+        self.saved()
+
+        router = self.build(Router(manifest=self.path))
+        with mock.patch.object(router, 'regenerate_routes') as regenerate:
+            router.resolve_node_modules()
+            self.assertEqual(0, regenerate.call_count)
+
+        self.assertEqual(expected, router.routes)
+        self.assertIs(None, router.manifest)
+
+    def test_load_mismatch(self):
+        'routes are computed when the manifest does not match'
+        self.saved()
+        router = self.build(Router(manifest=self.path), extra=True)
+
+        self.assertFalse(router.apply_manifest())
+        self.assertEqual(
+            self.build(Router(), extra=True).routes, router.routes
+        )
+
+    def test_routes_after_load(self):
+        'messages are routed with manifest routes'
+        self.saved()
+        router = Router(manifest=self.path)
+        seen = []
+        for name, subscribe_to, entry_point in (('a', None, True),
+                                                ('b', '^a$', False)):
+            node = get_named_mock(name)
+            node.side_effect = lambda _origin, **message: seen.append(_origin)
+            router.register(name, node, ('x',), subscribe_to, entry_point, None)
+        router.register('c', None, ('x',), '.+', False, '^b$')
+        router.functions['c'] = get_named_mock('c')
+
+        router.route('a', {'x': 1})
+        self.assertEqual(['a'], seen)
+        self.assertEqual(1, router.functions['c'].call_count)
+
+    def test_hash_changes(self):
+        'the hash changes with subscriptions, ignores and fields'
+        base = self.build(Router()).route_hash()
+
+        router = Router()
+        router.register('a', None, ('x',), None, True, None)
+        router.register('b', None, ('x',), '^a', False, None)
+        router.register('c', None, ('x',), '.+', False, '^b$')
+        self.assertNotEqual(base, router.route_hash())
+
+        router = self.build(Router())
+        router.fields['a'] = ('y',)
+        self.assertNotEqual(base, router.route_hash())
+
+    def check_fallback(self):
+        'a manifest which cannot be used is ignored, and routes are computed'
+        router = Router(manifest=self.path)
+        self.assertIs(None, router.manifest)
+
+        self.build(router)
+        self.assertEqual(self.build(Router()).routes, router.routes)
+
+    def test_bad_version(self):
+        'files which are not manifests of this version are ignored'
+        with open(self.path, 'w') as manifest_file:
+            json.dump({'version': 0}, manifest_file)
+
+        self.check_fallback()
+
+    def test_missing(self):
+        'missing manifests are ignored'
+        self.check_fallback()
+
+    def test_corrupt(self):
+        'manifests which are not JSON are ignored'
+        with open(self.path, 'w') as manifest_file:
+            manifest_file.write('{"version": 1, "routes": {')
+
+        self.check_fallback()
+
+    def test_frozen(self):
+        'frozen routers cannot load a manifest'
+        self.saved()
+        router = Router()
+        router.freeze()
+        self.assertRaises(RuntimeError, router.load_manifest, self.path)
+
+
+class MetricsTests(TestCase):
+    'tests for routers with metrics'
+    def setUp(self):
+        self.router = Router(metrics=True)
+
+        @self.router.node(['word'], entry_point=True)
+        def words(msg):
+            for word in msg.text.split():
+                yield word
+
+        @self.router.node(['word', 'length'], prefix('words'))
+        def lengths(msg):
+            if msg.word == 'skip':
+                return NoResult
+
+            return msg.word, len(msg.word)
+
+        @self.router.node(['char'], prefix('words'), stream=True)
+        def chars(msg):
+            for char in msg.word:
+                yield char if char != '-' else NoResult
+
+    def node(self, name):
+        return self.router.metrics.snapshot()['nodes'][prefix(name)]
+
+    def edges(self):
+        return dict(
+            ((edge['origin'], edge['destination']), edge['messages'])
+            for edge in self.router.metrics.snapshot()['edges']
+        )
+
+    def check(self):
+        self.router(text='ab skip c-')
+
+        self.assertEqual(1, self.node('words')['calls'])
+        self.assertEqual(3, self.node('words')['emitted'])
+
+        self.assertEqual(3, self.node('lengths')['calls'])
+        self.assertEqual(2, self.node('lengths')['emitted'])
+        self.assertEqual(1, self.node('lengths')['dropped'])
+        self.assertEqual(3, self.node('lengths')['latency']['count'])
+
+        self.assertEqual(3, self.node('chars')['calls'])
+        self.assertEqual(7, self.node('chars')['emitted'])
+        self.assertEqual(1, self.node('chars')['dropped'])
+
+        self.assertEqual(
+            {('__entry_point', prefix('words')): 1,
+             (prefix('words'), prefix('lengths')): 3,
+             (prefix('words'), prefix('chars')): 3},
+            self.edges()
+        )
+
+    def test_records(self):
+        'calls, emissions, drops and edges are recorded'
+        self.check()
+
+    def test_records_frozen(self):
+        'frozen routers record edges too'
+        self.router.freeze()
+        self.check()
+
+    def test_results_unchanged(self):
+        'measured nodes return the same results'
+        self.assertEqual(
+            ({'word': 'a'}, {'word': 'b'}),
+            self.router.functions[prefix('words')](text='a b')
+        )
+
+    def test_batch_node(self):
+        'batching nodes are measured per batch'
+        @self.router.node(['x'], batch_size=2)
+        def batched(messages):
+            return [NoResult] + [msg.x for msg in messages]
+
+        batched([{'x': 1}, {'x': 2}])
+        self.assertEqual(
+            (1, 2, 1),
+            tuple(self.node('batched')[key]
+                  for key in ('calls', 'emitted', 'dropped'))
+        )
+
+    def test_shared(self):
+        'routers can share a Metrics instance'
+        metrics = Metrics()
+        router = Router(metrics=metrics)
+        self.assertIs(metrics, router.metrics)
+
+    def test_disabled(self):
+        'nodes are not wrapped without metrics'
+        router = Router()
+        self.assertIs(None, router.metrics)
+
+        def func(msg):
+            pass
+
+        router.node(['x'])(func)
+        self.assertIs(func, router.functions[router.get_name(func)].__wrapped__)
+
+
+class DispatchTests(TestCase):
+    'tests for Router.dispatch'
+    def setUp(self):
+        self.router = Router()
+
+    def test_direct(self):
+        'nodes are handed messages without going through keyword arguments'
+        received = []
+
+        @self.router.node(['y'])
+        def node(msg):
+            received.append(msg)
+
+        with mock.patch.object(self.router, 'get_message_from_call') as gmfc:
+            self.router.dispatch('origin', prefix('node'), {'x': 1})
+
+        self.assertEqual(0, gmfc.call_count)
+        self.assertEqual([Message(x=1, _origin='origin')], received)
+
+    def test_does_not_change_message(self):
+        'the dispatched message is not changed'
+        self.router.node(['y'])(get_named_mock('watcher'))
+
+        message = {'x': 1}
+        self.router.dispatch('origin', 'watcher', message)
+
+        self.assertEqual({'x': 1}, message)
+
+    def test_other_functions(self):
+        'other functions are called with keyword arguments'
+        func = mock.Mock()
+        self.router.functions['test'] = func
+
+        self.router.dispatch('origin', 'test', {'x': 1})
+
+        func.assert_called_once_with(_origin='origin', x=1)
+
+
+class FreezeTests(TestCase):
+    'tests for Router.freeze'
+    def setUp(self):
+        self.router = Router()
+
+        self.watcher = get_named_mock('watcher')
+        self.router.node(['n'], entry_point=True)(self.watcher)
+
+    def test_builds_dispatch_table(self):
+        'freeze builds a table of dispatchers for each origin'
+        table = self.router.freeze()
+
+        self.assertEqual(['__entry_point'], list(table.keys()))
+        self.assertTrue(isinstance(table['__entry_point'], tuple))
+        self.assertEqual(1, len(table['__entry_point']))
+
+    def test_routes_through_table(self):
+        'routing after freezing uses the dispatch table'
+        self.router.freeze()
+        self.router.routes = {}
+
+        self.router(n=1)
+
+        self.assertEqual(1, self.watcher.call_count)
+
+    def test_resolves_node_modules(self):
+        'node modules are resolved when freezing, not when routing'
+        with mock.patch.object(self.router, 'resolve_node_modules') as resolve:
+            self.router.freeze()
+            self.router(n=1)
+
+        self.assertEqual(1, resolve.call_count)
+
+    def test_frozen(self):
+        'frozen is set after freezing'
+        self.assertFalse(self.router.frozen)
+        self.router.freeze()
+        self.assertTrue(self.router.frozen)
+
+    def test_disable_routing(self):
+        'disabling routing still works after freezing'
+        self.router.freeze()
+        self.router.disable_routing()
+
+        self.router(n=1)
+
+        self.assertEqual(0, self.watcher.call_count)
+
+    def test_register_raises(self):
+        'registering after freezing raises a RuntimeError'
+        self.router.freeze()
+
+        self.assertRaises(
+            RuntimeError,
+            self.router.node(['n'], 'watcher'), get_named_mock('other')
+        )
+        self.assertRaises(RuntimeError, self.router.register_route, 'a', 'b')
+        self.assertRaises(RuntimeError, self.router.register_ignore, 'a', 'b')
+        self.assertRaises(RuntimeError, self.router.add_entry_point, 'b')
+
+
+class ConfigureLoggingTests(TestCase):
+    'tests for Router.configure_logging'
+    def setUp(self):
+        self.router = Router()
+        self.router.logger = mock.Mock()
+        self.router.logger.isEnabledFor.side_effect = lambda level: level >= logging.INFO
+
+    def test_always(self):
+        'log_messages=True binds the logging hooks'
+        self.router.configure_logging()
+
+        self.router.log_info('test %s', 'x')
+        self.router.logger.log.assert_called_once_with(logging.INFO, 'test %s', mock.ANY)
+
+    def test_never(self):
+        'log_messages=False binds no-op hooks'
+        self.router.log_messages = False
+        self.router.configure_logging()
+
+        self.assertTrue(self.router.log_info is noop)
+        self.assertTrue(self.router.log_debug is noop)
+
+    def test_from_level(self):
+        'log_messages=None binds hooks according to the logger level'
+        self.router.log_messages = None
+        self.router.configure_logging()
+
+        self.assertFalse(self.router.log_info is noop)
+        self.assertTrue(self.router.log_debug is noop)
+
+    def test_bounded(self):
+        'arguments are logged with bounded representations'
+        self.router.log(logging.INFO, 'test %s %d', 'x' * 1000, 1)
+
+        args = self.router.logger.log.call_args[0]
+        self.assertEqual(1, args[3])
+        self.assertTrue(len(str(args[2])) < 1000)
+
+    def test_frozen_without_debug(self):
+        'frozen routers dispatch directly when debug logging is off'
+        self.router.log_messages = None
+        self.router.freeze()
+
+        self.assertEqual(
+            self.router.dispatch,
+            self.router.get_dispatcher('a', 'b').func
+        )
+
+
 class RouterTests(TestCase):
     def setUp(self):
         self.router = Router()
@@ -380,11 +1142,11 @@ class RouterTests(TestCase):
     # node
     def test_node_adds_routes(self):
         'router adds routes for node when decorating'
-        a = lambda x: x
-        a.__name__ = 'a'
+        def a(x):
+            return x
 
-        b = lambda x: x
-        b.__name__ = 'b'
+        def b(x):
+            return x
 
         fields = ('field_a', 'field_b')
         self.router.node(fields)(a)
@@ -397,8 +1159,8 @@ class RouterTests(TestCase):
 
     def test_node_adds_fields(self):
         'router adds fields when decorating'
-        a = lambda x: x
-        a.__name__ = 'a'
+        def a(x):
+            return x
 
         self.router.node(['a', 'b', 'c'])(a)
 
@@ -436,6 +1198,25 @@ class RouterTests(TestCase):
             suffixes(pre='stuff', sufs=['y', 'ier', 'iest'])
         )
 
+    def test_calling_streams(self):
+        'calling a streaming generator routes items as they are yielded'
+        routed = []
+
+        @self.router.node(['i'], stream=True)
+        def count(msg):
+            for i in range(msg.n):
+                yield i
+                self.assertEqual(i + 1, len(routed))
+
+            yield NoResult
+
+        watcher = get_named_mock('watcher')
+        watcher.side_effect = routed.append
+        self.router.node(['i'], prefix('count'))(watcher)
+
+        self.assertEqual(3, count(n=3))
+        self.assertEqual([0, 1, 2], [msg.i for msg in routed])
+
     def test_routing(self):
         'calling a function will route to subscribed functions'
         n = 5
@@ -468,12 +1249,12 @@ class RouterTests(TestCase):
 
     def test_get_name(self):
         'get name gets the __name__ property by default'
-        l = lambda x: x
-        l.__name__ = 'test'
+        def test(x):
+            return x
 
         self.assertEqual(
             prefix('test'),
-            self.router.get_name(l)
+            self.router.get_name(test)
         )
 
     def test_custom_message(self):
@@ -519,8 +1300,9 @@ class RouterTests(TestCase):
 
     def test_no_result_single(self):
         'a function returning NoResult should only pass on non-NoResults'
-        func = lambda msg: NoResult
-        func.__name__ = 'func'
+        def func(msg):
+            return NoResult
+
         func = self.router.node(['n'])(func)
 
         watcher = get_named_mock('watcher')
@@ -0,0 +1,152 @@
+'tests for emit/router/processes.py'
+import os
+from unittest import TestCase
+
+from emit.codecs import get_codec
+from emit.messages import Message, NoResult
+from emit.router.processes import call_node, find_node, ProcessRouter
+
+
+def prefix(name):
+    return '%s.%s' % (__name__, name)
+
+
+# nodes are found by name in worker processes, so they live at module level
+def words(msg):
+    for word in msg.text.split():
+        yield word
+
+
+def pid(msg):
+    return msg.word, os.getpid()
+
+
+def nothing(msg):
+    return NoResult
+
+
+def square(msg):
+    return msg.x * msg.x
+
+
+class CallNodeTests(TestCase):
+    'tests for call_node'
+    def setUp(self):
+        self.codec = get_codec()
+
+    def call(self, name, fields, **message):
+        many, data, seconds, dropped = call_node(
+            __name__, name, fields, Message, self.codec,
+            Message(message).encode(self.codec)
+        )
+        self.assertTrue(seconds >= 0)
+        self.dropped = dropped
+        return many, self.codec.decode(data)
+
+    def test_generator(self):
+        'yielded results are collected'
+        self.assertEqual(
+            (True, [{'word': 'a'}, {'word': 'b'}]),
+            self.call('words', ['word'], text='a b')
+        )
+
+    def test_tuple(self):
+        'tuples are split into fields'
+        self.assertEqual(
+            (False, [{'word': 'a', 'pid': os.getpid()}]),
+            self.call('pid', ['word', 'pid'], word='a')
+        )
+
+    def test_no_result(self):
+        'NoResult returns nothing'
+        self.assertEqual((False, []), self.call('nothing', ['x']))
+        self.assertEqual(1, self.dropped)
+
+    def test_find_node_unwraps(self):
+        'decorated nodes are unwrapped'
+        self.assertTrue(find_node(__name__, 'words') is words)
+
+
+class ProcessRouterTests(TestCase):
+    'tests for ProcessRouter'
+    def setUp(self):
+        self.router = ProcessRouter(processes=2)
+        self.seen = []
+
+        def watcher(msg):
+            self.seen.append(msg.as_dict())
+
+        self.words = self.router.node(['word'], entry_point=True, cpu_bound=True)(words)
+        self.pid = self.router.node(['word', 'pid'], prefix('words'), cpu_bound=True)(pid)
+        self.router.node(['x'], prefix('pid'))(watcher)
+
+    def tearDown(self):
+        self.router.close()
+
+    def test_runs_in_workers(self):
+        'cpu bound nodes run in other processes, and results are routed here'
+        call = self.router(text='a b c')
+
+        self.assertEqual([], call.exceptions)
+        self.assertEqual(['a', 'b', 'c'], sorted(msg['word'] for msg in self.seen))
+        self.assertFalse(os.getpid() in [msg['pid'] for msg in self.seen])
+
+    def test_direct_call(self):
+        'calling a cpu bound node directly returns its results'
+        self.assertEqual(
+            ({'word': 'a'}, {'word': 'b'}),
+            self.words(text='a b')
+        )
+
+    def test_feed(self):
+        'feed counts emissions from workers'
+        result = self.router.feed({'text': 'a b'} for _ in range(5))
+        self.assertEqual(10, result['emitted'][prefix('pid')])
+        self.assertEqual(10, len(self.seen))
+
+    def test_cache(self):
+        'cpu bound nodes can be cached'
+        node = self.router.node(['y'], cpu_bound=True, cache=True)(square)
+
+        self.assertEqual({'y': 9}, node(x=3))
+        self.assertEqual({'y': 9}, node(x=3))
+        self.assertEqual(1, self.router.caches[prefix('square')].hits)
+
+    def test_dedupe(self):
+        'cpu bound nodes can drop repeated messages'
+        node = self.router.node(['y'], cpu_bound=True, dedupe=True)(square)
+
+        self.assertEqual({'y': 9}, node(x=3))
+        self.assertIs(NoResult, node(x=3))
+        self.assertEqual({prefix('square'): 1}, self.router.duplicates())
+
+    def test_stream(self):
+        'cpu bound nodes cannot stream'
+        self.assertRaises(
+            ValueError, self.router.node, ['word'], cpu_bound=True, stream=True
+        )
+
+    def test_batch(self):
+        'cpu bound nodes cannot batch'
+        self.assertRaises(
+            ValueError, self.router.node, ['word'], cpu_bound=True, batch_size=2
+        )
+
+    def test_metrics(self):
+        'calls in workers are recorded in metrics'
+        router = ProcessRouter(processes=1, metrics=True)
+        self.addCleanup(router.close)
+        router.node(['word'], entry_point=True, cpu_bound=True)(words)
+
+        router(text='a b')
+
+        node = router.metrics.snapshot()['nodes'][prefix('words')]
+        self.assertEqual(1, node['calls'])
+        self.assertEqual(2, node['emitted'])
+        self.assertEqual(1, node['latency']['count'])
+
+    def test_pool_started_lazily(self):
+        'the process pool starts with the first cpu bound message'
+        self.assertEqual(None, self.router.process_pool)
+        self.router(text='a')
+        self.assertFalse(self.router.process_pool is None)
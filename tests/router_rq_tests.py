@@ -1,5 +1,6 @@
 import mock
 from redis import Redis
+import threading
 from unittest import TestCase
 
 from .utils import skipIf
@@ -10,6 +11,11 @@ try:
 except ImportError:
     RQRouter = None
 
+try:
+    from fakeredis import FakeStrictRedis
+except ImportError:
+    FakeStrictRedis = None
+
 
 @skipIf(RQRouter is None, 'RQ did not import correctly')
 class RQRouterTests(TestCase):
@@ -30,6 +36,21 @@ class RQRouterTests(TestCase):
 
         node.delay.assert_called_with(_origin='origin', x=1)
 
+    def test_feed(self):
+        'feed enqueues each message for the entry points'
+        node = mock.Mock()
+        self.router.functions['test'] = node
+        self.router.add_entry_point('test')
+
+        self.assertEqual(
+            {'messages': 2, 'emitted': {}},
+            self.router.feed([{'x': 1}, {'x': 2}])
+        )
+        node.delay.assert_has_calls([
+            mock.call(_origin='__entry_point', x=1),
+            mock.call(_origin='__entry_point', x=2),
+        ])
+
     @mock.patch('emit.router.rq.job')
     def test_registers_as_job(self, fake_job):
         'registers the task with the job decorator'
@@ -78,3 +99,138 @@ class RQRouterTests(TestCase):
             queue='default', connection=self.redis,
             timeout=None, result_ttl=30
         )
+
+
+@skipIf(RQRouter is None or FakeStrictRedis is None, 'RQ or fakeredis did not import correctly')
+class RQRouterBatchTests(TestCase):
+    'tests for enqueueing jobs in batches'
+    def setUp(self):
+        self.redis = FakeStrictRedis()
+        self.router = RQRouter(self.redis)
+
+        @self.router.node(['word'], entry_point=True)
+        def words(msg):
+            for word in msg.text.split():
+                yield word
+
+        @self.router.node(['word'], 'words$')
+        def default(msg):
+            return msg.word
+
+        @self.router.node(['word'], 'words$', queue='other')
+        def other(msg):
+            return msg.word
+
+        self.words = words
+
+    def get_queue(self, name):
+        return rq.Queue(name, connection=self.redis)
+
+    def test_node_enqueues_together(self):
+        'everything dispatched by one node call is enqueued in one pipeline'
+        with mock.patch.object(self.redis, 'pipeline', wraps=self.redis.pipeline) as pipeline:
+            self.words(text='a b c')
+
+        self.assertEqual(1, pipeline.call_count)
+        self.assertEqual(3, self.get_queue('default').count)
+        self.assertEqual(3, self.get_queue('other').count)
+
+    def test_enqueued_kwargs(self):
+        'enqueued jobs receive the message and origin'
+        self.words(text='a')
+
+        job = self.get_queue('default').jobs[0]
+        self.assertEqual(
+            {'word': 'a', '_origin': self.router.get_name(self.words)},
+            job.kwargs
+        )
+
+    def test_entry_point(self):
+        'calling the router enqueues entry points in a batch'
+        self.router(text='a b')
+
+        self.assertEqual(1, self.get_queue('default').count)
+
+    def test_feed(self):
+        'feed enqueues every message in one batch'
+        with mock.patch.object(self.redis, 'pipeline', wraps=self.redis.pipeline) as pipeline:
+            self.router.feed([{'text': 'a'}, {'text': 'b'}, {'text': 'c'}])
+
+        self.assertEqual(1, pipeline.call_count)
+        self.assertEqual(3, self.get_queue('default').count)
+
+    def test_nothing_enqueued_on_error(self):
+        'jobs are not enqueued if the batch raises'
+        def fail():
+            with self.router.batch():
+                self.router.dispatch('origin', self.router.get_name(self.words), {'text': 'a'})
+                raise ValueError('test')
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(0, self.get_queue('default').count)
+        self.assertEqual(None, self.router.pending)
+
+    def test_batches_per_thread(self):
+        'each thread collects its own batch'
+        barrier = threading.Barrier(4)
+        name = self.router.get_name(self.words)
+        errors = []
+
+        def run(i):
+            try:
+                with self.router.batch():
+                    for _ in range(50):
+                        self.router.dispatch('origin', name, {'text': 'a'})
+
+                    barrier.wait()
+                    if i == 0:
+                        raise ValueError('test')
+            except ValueError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(150, self.get_queue('default').count)
+
+    def test_falls_back_to_delay(self):
+        'functions without job options are enqueued with delay'
+        node = mock.Mock()
+        self.router.functions['test'] = node
+
+        with self.router.batch():
+            self.router.dispatch('origin', 'test', {'x': 1})
+            self.assertEqual(0, node.delay.call_count)
+
+        node.delay.assert_called_once_with(_origin='origin', x=1)
+
+    def test_batching_node(self):
+        'messages to batching nodes are enqueued as one job with a list'
+        @self.router.node(['word'], 'words$', queue='batched', batch_size=10)
+        def batched(messages):
+            return [msg.word for msg in messages]
+
+        self.words(text='a b c')
+
+        jobs = self.get_queue('batched').jobs
+        self.assertEqual(1, len(jobs))
+        self.assertEqual(
+            [{'word': word, '_origin': self.router.get_name(self.words)}
+             for word in 'abc'],
+            jobs[0].args[0]
+        )
+
+    def test_batching_node_job(self):
+        'batched jobs call the node with a list of messages'
+        @self.router.node(['word'], 'words$', queue='batched', batch_size=10)
+        def batched(messages):
+            return [msg.word.upper() for msg in messages]
+
+        self.assertEqual(
+            ({'word': 'A'}, {'word': 'B'}),
+            batched([{'word': 'a'}, {'word': 'b'}])
+        )
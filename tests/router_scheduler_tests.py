@@ -0,0 +1,201 @@
+'tests for emit/router/scheduler.py'
+import sys
+from unittest import TestCase
+
+from emit.router.core import Router
+from emit.router.scheduler import ScheduledRouter
+
+
+def prefix(name):
+    return '%s.%s' % (__name__, name)
+
+
+class ScheduledRouterTests(TestCase):
+    'tests for ScheduledRouter'
+    def setUp(self):
+        self.seen = []
+
+    def watch(self, router, name, subscribe_to=None, entry_point=False,
+              fanout=1, **options):
+        'register a node which records what it sees and emits fanout times'
+        def watcher(msg):
+            self.seen.append(name)
+            for _ in range(fanout):
+                yield msg.x
+
+        watcher.__name__ = name
+        return router.node(
+            ['x'], subscribe_to=subscribe_to, entry_point=entry_point,
+            **options
+        )(watcher)
+
+    def tree(self, router):
+        'a -> (b1, b2) -> c'
+        self.watch(router, 'a', entry_point=True)
+        self.watch(router, 'b1', prefix('a'))
+        self.watch(router, 'b2', prefix('a'), priority=1)
+        self.watch(router, 'c', prefix('b1'))
+
+    def test_breadth_first(self):
+        'fifo order processes the graph breadth-first'
+        router = ScheduledRouter()
+        self.tree(router)
+
+        router(x=1)
+        self.assertEqual('a', self.seen[0])
+        self.assertEqual(set(['b1', 'b2']), set(self.seen[1:3]))
+        self.assertEqual('c', self.seen[3])
+
+    def test_recursive_is_depth_first(self):
+        'the plain router processes the graph depth-first, for comparison'
+        router = Router()
+        self.watch(router, 'a', entry_point=True)
+        self.watch(router, 'b', prefix('a'), fanout=2)
+        self.watch(router, 'c', prefix('b'))
+
+        router(x=1)
+        self.assertEqual(['a', 'b', 'c', 'c'], self.seen)
+
+    def test_priority(self):
+        'priority order runs higher priority nodes first'
+        router = ScheduledRouter(order='priority')
+        self.watch(router, 'a', entry_point=True, fanout=2)
+        self.watch(router, 'low', prefix('a'))
+        self.watch(router, 'high', prefix('a'), priority=5)
+
+        router(x=1)
+        self.assertEqual(['a', 'high', 'high', 'low', 'low'], self.seen)
+
+    def test_deep_graph(self):
+        'graphs deeper than the recursion limit run'
+        depth = sys.getrecursionlimit()
+        router = ScheduledRouter()
+        node = self.watch(router, 'n0')
+        for i in range(1, depth):
+            self.watch(router, 'n%d' % i, prefix('n%d$' % (i - 1)))
+
+        node(x=1)
+        self.assertEqual(depth, len(self.seen))
+
+    def test_reject(self):
+        'a full queue rejects messages when asked to'
+        router = ScheduledRouter(max_queued=2, when_full='reject')
+        self.watch(router, 'a', entry_point=True, fanout=3)
+        self.watch(router, 'b', prefix('a'))
+
+        self.assertRaises(RuntimeError, router, x=1)
+        self.assertEqual(0, len(router.queue))
+        self.assertFalse(router.draining)
+
+    def test_block(self):
+        'a full queue runs queued messages to make room'
+        router = ScheduledRouter(max_queued=2)
+        self.watch(router, 'a', entry_point=True, fanout=5)
+        self.watch(router, 'b', prefix('a'))
+
+        original = router.push
+        sizes = []
+
+        def push(*args):
+            original(*args)
+            sizes.append(len(router.queue))
+
+        router.push = push
+        router(x=1)
+
+        self.assertEqual(['a'] + ['b'] * 5, self.seen)
+        self.assertEqual(2, max(sizes))
+
+    def test_block_deep_fanout(self):
+        'a full queue holds no more than max_queued messages'
+        levels = 12
+        depths = []
+        held = []
+        routed = [0]
+
+        def split(msg):
+            frame, depth = sys._getframe(), 0
+            while frame is not None:
+                frame, depth = frame.f_back, depth + 1
+
+            depths.append(depth)
+            held.append(routed[0] - len(depths))
+            yield msg.x
+            yield msg.x
+
+        for max_queued in (1, 4, 16, 64):
+            router = ScheduledRouter(max_queued=max_queued)
+            for level in range(levels):
+                split.__name__ = 'split%d' % level
+                router.node(
+                    ['x'], entry_point=level == 0,
+                    subscribe_to=prefix('split%d$' % (level - 1)) if level else None,
+                )(split)
+
+            original = router.dispatch
+
+            def dispatch(*args):
+                routed[0] += 1
+                return original(*args)
+
+            router.dispatch = dispatch
+            del depths[:], held[:]
+            routed[0] = 0
+            router(x=1)
+
+            self.assertEqual(2 ** levels - 1, len(depths))
+            self.assertTrue(max(held) <= max_queued)
+            self.assertEqual(0, len(router.queue))
+
+            # messages run straight away only nest as deep as the graph
+            self.assertTrue(max(depths) - min(depths) < levels * 8)
+
+    def test_drop(self):
+        'a full queue drops messages when asked to'
+        router = ScheduledRouter(max_queued=2, when_full='drop')
+        self.watch(router, 'a', entry_point=True, fanout=5)
+        self.watch(router, 'b', prefix('a'))
+
+        with self.assertLogs(router.logger, 'WARNING'):
+            router(x=1)
+
+        self.assertEqual(['a', 'b', 'b'], self.seen)
+        self.assertEqual({prefix('b'): 3}, router.dropped)
+        self.assertEqual(0, len(router.queue))
+
+    def test_error_clears_queue(self):
+        'an error drops the rest of the queue'
+        router = ScheduledRouter()
+
+        def fails(msg):
+            raise ValueError()
+
+        self.watch(router, 'a', entry_point=True, fanout=2)
+        router.node(['x'], prefix('a'))(fails)
+
+        self.assertRaises(ValueError, router, x=1)
+        self.assertEqual(0, len(router.queue))
+
+        self.seen = []
+        router.disable_routing()
+        router(x=1)
+        self.assertEqual([], self.seen)
+
+    def test_invalid_options(self):
+        'unknown orders and policies raise ValueError'
+        self.assertRaises(ValueError, ScheduledRouter, order='lifo')
+        self.assertRaises(ValueError, ScheduledRouter, when_full='wait')
+
+    def test_batch_timeout(self):
+        'batch_timeout raises ValueError, but batch_size works'
+        router = ScheduledRouter()
+
+        def batch(messages):
+            return [msg.x for msg in messages]
+
+        self.assertRaises(
+            ValueError, router.node(['x'], batch_size=2, batch_timeout=1), batch
+        )
+
+        node = router.node(['x'], batch_size=2)(batch)
+        self.assertEqual(({'x': 1}, {'x': 2}), node([{'x': 1}, {'x': 2}]))
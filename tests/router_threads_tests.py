@@ -0,0 +1,198 @@
+'tests for emit/router/threads.py'
+import threading
+import time
+from unittest import TestCase
+
+from emit.router.threads import Call, ThreadRouter
+
+
+def prefix(name):
+    return '%s.%s' % (__name__, name)
+
+
+class CallTests(TestCase):
+    'tests for Call'
+    def test_wait(self):
+        'wait returns once every dispatch finishes'
+        call = Call()
+        call.add()
+        call.add()
+        error = ValueError()
+
+        call.finish()
+        self.assertFalse(call.done)
+        call.finish(error)
+
+        self.assertTrue(call.done)
+        self.assertEqual([error], call.wait())
+
+    def test_wait_timeout(self):
+        'wait gives up after timeout'
+        call = Call()
+        call.add()
+
+        self.assertEqual([], call.wait(0.01))
+        self.assertFalse(call.done)
+
+    def test_no_collect(self):
+        'exceptions are dropped when collect is False'
+        call = Call(collect=False)
+        call.add()
+        call.finish(ValueError())
+
+        self.assertEqual([], call.wait())
+
+
+class ThreadRouterTests(TestCase):
+    'tests for ThreadRouter'
+    def setUp(self):
+        self.router = ThreadRouter(max_workers=8)
+        self.seen = []
+
+    def tearDown(self):
+        self.router.close()
+
+    def watch(self, name, subscribe_to=None, entry_point=False, delay=0, **options):
+        'register a node which records what it sees'
+        def watcher(msg):
+            time.sleep(delay)
+            self.seen.append((name, msg.as_dict()))
+            return msg.x
+
+        watcher.__name__ = name
+        return self.router.node(
+            ['x'], subscribe_to=subscribe_to, entry_point=entry_point,
+            **options
+        )(watcher)
+
+    def test_waits_for_graph(self):
+        'calling the router waits for every node below it'
+        self.watch('a', entry_point=True)
+        self.watch('b', prefix('a'), delay=0.05)
+        self.watch('c', prefix('b'), delay=0.05)
+
+        call = self.router(x=1)
+
+        self.assertTrue(call.done)
+        self.assertEqual(['a', 'b', 'c'], [name for name, _ in self.seen])
+
+    def test_no_wait(self):
+        'with wait=False, calling the router returns at once'
+        self.router.wait = False
+        self.watch('a', entry_point=True, delay=0.1)
+
+        call = self.router(x=1)
+        self.assertEqual([], self.seen)
+
+        self.assertEqual([], call.wait())
+        self.assertEqual(1, len(self.seen))
+
+    def test_concurrent_fanout(self):
+        'subscribers of a message run in parallel threads'
+        self.watch('source', entry_point=True)
+        for i in range(5):
+            self.watch('sub%d' % i, prefix('source'), delay=0.1)
+
+        start = time.time()
+        self.router(x=1)
+
+        self.assertEqual(6, len(self.seen))
+        self.assertTrue(time.time() - start < 0.4)
+
+    def test_exceptions(self):
+        'exceptions in the graph are collected'
+        def fails(msg):
+            raise ValueError(msg.x)
+
+        self.router.node(['x'], entry_point=True)(fails)
+        self.watch('b', entry_point=True)
+
+        call = self.router(x=1)
+
+        self.assertEqual(1, len(call.exceptions))
+        self.assertTrue(isinstance(call.exceptions[0], ValueError))
+        self.assertEqual(1, len(self.seen))
+
+    def test_untracked_exceptions(self):
+        'exceptions from untracked dispatches are logged, not kept'
+        def fails(msg):
+            raise ValueError(msg.x)
+
+        node = self.watch('a')
+        self.router.node(['x'], prefix('a'))(fails)
+
+        with self.assertLogs(self.router.logger, 'ERROR'):
+            node(x=1)
+            self.router.untracked.wait()
+
+        self.assertEqual([], self.router.untracked.exceptions)
+
+    def test_max_concurrency(self):
+        'nodes run no more than max_concurrency calls at once'
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow(msg):
+            with lock:
+                running.append(msg)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(msg)
+
+        self.router.node(['x'], entry_point=True, max_concurrency=2)(slow)
+        self.watch('fast', entry_point=True)
+
+        result = self.router.feed({'x': i} for i in range(10))
+
+        self.assertEqual(10, len(peak))
+        self.assertEqual(2, max(peak))
+        self.assertEqual(10, len(self.seen))
+        self.assertEqual([], result['exceptions'])
+
+    def test_feed(self):
+        'feed waits for the graph and counts emissions'
+        self.watch('a', entry_point=True)
+        self.watch('b', prefix('a'), delay=0.01)
+
+        result = self.router.feed({'x': i} for i in range(20))
+
+        self.assertEqual(20, result['messages'])
+        self.assertEqual(
+            {prefix('a'): 20, prefix('b'): 20},
+            result['emitted']
+        )
+
+    def test_feed_flushes(self):
+        'feed sends messages waiting in batches, and waits for them'
+        batches = []
+
+        @self.router.node(['x'], entry_point=True, batch_size=10)
+        def batched(messages):
+            batches.append([msg.x for msg in messages])
+            return [msg.x for msg in messages]
+
+        self.watch('after', prefix('batched'), delay=0.01)
+
+        result = self.router.feed({'x': i} for i in range(3))
+
+        self.assertEqual([[0, 1, 2]], batches)
+        self.assertEqual(3, len(self.seen))
+        self.assertEqual([], result['exceptions'])
+
+    def test_tracking(self):
+        'nodes called directly can be tracked'
+        node = self.watch('a')
+        self.watch('b', prefix('a'), delay=0.05)
+
+        with self.router.tracking() as call:
+            node(x=1)
+
+        self.assertEqual([], call.wait())
+        self.assertEqual(2, len(self.seen))
+
+    def test_close(self):
+        'close shuts down the pool'
+        self.router.close()
+        self.assertRaises(RuntimeError, self.router.executor.submit, len, ())